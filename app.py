@@ -15,6 +15,9 @@ import time
 
 # Import safe parquet utilities
 from parquet_utils import safe_read_parquet, safe_write_parquet_atomic, acquire_lock
+from retention import archived_days, read_archive
+from metrics import refresh_metrics
+from subrubrics import DEFAULT_SUBRUBRICS, cache_dir, is_hr_subrubric
 
 logger = logging.getLogger(__name__)
 
@@ -24,6 +27,9 @@ IMPORT_FOLDER = './import'
 STATIC_FOLDER = './static'
 LOCK_FILE = os.path.join(SHAB_DATA_DIR, 'refresh.lock')
 
+# Low-cardinality columns, stored dictionary-encoded and held as pandas categoricals
+CATEGORICAL_COLUMNS = ['rubric', 'subrubric', 'publikations_status', 'primaryTenantCode']
+
 def ensure_directories():
     for folder in [SHAB_DATA_DIR, IMPORT_FOLDER, STATIC_FOLDER]:
         if not os.path.exists(folder):
@@ -43,6 +49,13 @@ def element_text(element):
     else:
         return element.text
 
+def compact_shab_df(df):
+    """Convert the low-cardinality columns to categoricals (about 1 byte per row instead of a string object)."""
+    for column in CATEGORICAL_COLUMNS:
+        if column in df.columns and not isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype('category')
+    return df
+
 def get_session():
     session = requests.Session()
     # Retry on:
@@ -62,13 +75,18 @@ def get_session():
     session.mount('https://', adapter)
     return session
 
-def Get_Shab_DF(download_date, session=None):
+def Get_Shab_DF(download_date, session=None, use_cache=True, all_subrubrics=False):
     ensure_directories()
+    data_dir = cache_dir(all_subrubrics)
+    if not os.path.exists(data_dir):
+        os.makedirs(data_dir)
     download_date_str = download_date.strftime("%Y-%m-%d")
-    parquet_file = os.path.join(SHAB_DATA_DIR, f'shab-{download_date_str}.parquet')
+    parquet_file = os.path.join(data_dir, f'shab-{download_date_str}.parquet')
 
-    if os.path.isfile(parquet_file):
+    # use_cache=False re-downloads the day, e.g. for recent days that may still get publications
+    if use_cache and os.path.isfile(parquet_file):
         logger.debug(f"Using cached data for {download_date_str}")
+        refresh_metrics.inc("shab_days_cached")
         return safe_read_parquet(parquet_file)
 
     logger.info(f"Downloading data for {download_date_str}...")
@@ -82,7 +100,7 @@ def Get_Shab_DF(download_date, session=None):
         session = get_session()
 
     while True:
-        # Reduced rubrics to HR only as we filter for HR01 and HR03 later
+        # All HR subrubrics come with the response; by default only HR01 and HR03 are kept
         url = (
             'https://amtsblattportal.ch/api/v1/publications/xml'
             '?publicationStates=PUBLISHED&tenant=shab&rubrics=HR'
@@ -94,10 +112,17 @@ def Get_Shab_DF(download_date, session=None):
 
         logger.debug(f"Fetching page {page+1} for {download_date_str}")
         try:
-            r = session.get(url, allow_redirects=True, timeout=(10, 30))
+            with refresh_metrics.timer("shab_http_seconds"):
+                r = session.get(url, allow_redirects=True, timeout=(10, 30))
+            refresh_metrics.inc("shab_http_requests")
+            refresh_metrics.inc("shab_http_bytes", len(r.content))
+            retries = getattr(getattr(r.raw, "retries", None), "history", None)
+            if retries:
+                refresh_metrics.inc("shab_http_retries", len(retries))
             r.raise_for_status()
 
             # Parse from memory
+            parse_start = time.perf_counter()
             try:
                 tree = ET.parse(io.BytesIO(r.content))
                 root = tree.getroot()
@@ -107,21 +132,28 @@ def Get_Shab_DF(download_date, session=None):
 
             publications = root.findall('./publication/meta')
             if not publications:
+                refresh_metrics.add_time("shab_xml_parse_seconds", time.perf_counter() - parse_start)
                 break # No more publications found
 
+            refresh_metrics.inc("shab_pages")
             for rls in publications:
+                subrubric = element_text(rls.find('subRubric'))
+                # Skipped before the row is built, so the default mode never holds the other subrubrics
+                if not (is_hr_subrubric(subrubric) if all_subrubrics else subrubric in DEFAULT_SUBRUBRICS):
+                    continue
                 inner = {}
                 inner['id'] = element_text(rls.find('id'))
                 inner['date'] = element_text(rls.find('publicationDate'))
                 inner['title'] = element_text(rls.find('title/de'))
                 inner['rubric'] = element_text(rls.find('rubric'))
-                inner['subrubric'] = element_text(rls.find('subRubric'))
+                inner['subrubric'] = subrubric
                 inner['publikations_status'] = element_text(rls.find('publicationState'))
                 inner['primaryTenantCode'] = element_text(rls.find('primaryTenantCode'))
                 inner['kanton'] = element_text(rls.find('cantons'))
 
                 data.append(inner)
 
+            refresh_metrics.add_time("shab_xml_parse_seconds", time.perf_counter() - parse_start)
             page += 1
 
             # Simple safety breaker for infinite loops
@@ -139,23 +171,23 @@ def Get_Shab_DF(download_date, session=None):
             raise e
 
     df = pd.DataFrame(data, columns=columns)
+    # Also ensures the schema if empty
+    df['date'] = pd.to_datetime(df['date'])
+    if all_subrubrics:
+        compact_shab_df(df)
 
-    if not df.empty:
-        df = df[(df["subrubric"] == "HR01") | (df["subrubric"] == "HR03")]
-        if 'date' in df.columns:
-            df['date'] = pd.to_datetime(df['date'])
-    else:
-        # Ensure schema even if empty
-        if 'date' in df.columns:
-             df['date'] = pd.to_datetime(df['date'])
+    refresh_metrics.inc("shab_days_downloaded")
+    refresh_metrics.inc("shab_rows_downloaded", len(df))
 
     # Save as parquet (even if empty, to mark as processed)
     safe_write_parquet_atomic(df, parquet_file)
     return df
 
-def Get_Shab_DF_from_range(from_date, to_date, progress_callback=None):
+def Get_Shab_DF_from_range(from_date, to_date, progress_callback=None, all_subrubrics=False):
     ensure_directories()
-    main_parquet = os.path.join(SHAB_DATA_DIR, 'last_df.parquet')
+    data_dir = cache_dir(all_subrubrics)
+    archive_dir = os.path.join(data_dir, 'archive')
+    main_parquet = os.path.join(data_dir, 'last_df.parquet')
 
     # We will use a session for reuse
     session = get_session()
@@ -196,18 +228,40 @@ def Get_Shab_DF_from_range(from_date, to_date, progress_callback=None):
             days_to_fetch.extend(daterange(cached_end + timedelta(days=1), to_date))
 
     # Remove days that might be in the middle gap if any (though we assume continuous cache)
-    # But also check if individual daily files exist to avoid re-downloading even if not in aggregated file
+    # Days outside the aggregated file that already have a daily file are read from it instead
+    # of being downloaded again (a --stream refresh writes daily files but not last_df)
 
     final_days_to_fetch = []
+    daily_frames = []
     for day in days_to_fetch:
         day_str = day.strftime("%Y-%m-%d")
-        daily_file = os.path.join(SHAB_DATA_DIR, f'shab-{day_str}.parquet')
+        daily_file = os.path.join(data_dir, f'shab-{day_str}.parquet')
         if not os.path.exists(daily_file):
             final_days_to_fetch.append(day)
+            continue
+        refresh_metrics.inc("shab_days_cached")
+        df = safe_read_parquet(daily_file)
+        if df is not None and not df.empty:
+            df['date'] = pd.to_datetime(df['date'])
+            daily_frames.append(df)
+    if daily_frames:
+        logger.info(f"Read {len(daily_frames)} days from daily files outside the aggregated dataset")
 
     days_to_fetch = final_days_to_fetch
     days_to_fetch.sort()
 
+    # Days that retention moved to the cold archive are read from there, not downloaded again
+    archived_frames = []
+    if days_to_fetch:
+        archived = archived_days(archive_dir)
+        from_archive = [day for day in days_to_fetch if day in archived]
+        if from_archive:
+            logger.info(f"Reading {len(from_archive)} days from the archive...")
+            df_archived = read_archive(from_archive[0], from_archive[-1], archive_dir=archive_dir)
+            if not df_archived.empty:
+                archived_frames.append(df_archived[df_archived['date'].dt.date.isin(set(from_archive))])
+            days_to_fetch = [day for day in days_to_fetch if day not in archived]
+
     logger.info(f"Need to fetch {len(days_to_fetch)} days...")
 
     # Fetch missing days
@@ -221,7 +275,7 @@ def Get_Shab_DF_from_range(from_date, to_date, progress_callback=None):
             logger.info(f"Progress: {i}/{total_days} days fetched")
 
         try:
-            df = Get_Shab_DF(date_curr, session=session)
+            df = Get_Shab_DF(date_curr, session=session, all_subrubrics=all_subrubrics)
             if not df.empty:
                 # Ensure date is datetime64
                 df['date'] = pd.to_datetime(df['date'])
@@ -234,9 +288,11 @@ def Get_Shab_DF_from_range(from_date, to_date, progress_callback=None):
     # 1. Start with cached data
     dfs_to_concat = [df_cached] if not df_cached.empty else []
 
-    # 2. Add newly fetched data (in memory)
+    # 2. Add the daily files, newly fetched and archived data (in memory)
+    dfs_to_concat.extend(daily_frames)
     if new_data_frames:
         dfs_to_concat.extend(new_data_frames)
+    dfs_to_concat.extend(archived_frames)
 
     # 3. Also look for daily files that were already on disk but not in cached_df (gap filling logic simplified)
     # Actually, simpler approach: Reload ALL daily files within the requested range to ensure consistency
@@ -253,6 +309,9 @@ def Get_Shab_DF_from_range(from_date, to_date, progress_callback=None):
             df_result = df_result.drop_duplicates(subset=['id'])
 
         df_result['date'] = pd.to_datetime(df_result['date'])
+        if all_subrubrics:
+            # Frames with different categories concatenate to strings: compact again
+            compact_shab_df(df_result)
 
         # Save updated aggregated file
         safe_write_parquet_atomic(df_result, main_parquet)
@@ -261,3 +320,61 @@ def Get_Shab_DF_from_range(from_date, to_date, progress_callback=None):
         df_result = df_result[(df_result["date"].dt.date <= to_date) & (df_result["date"].dt.date >= from_date)]
 
     return df_result
+
+def iter_shab_months(from_date, to_date, progress_callback=None, all_subrubrics=False):
+    """
+    Yield the SHAB rows of the range one calendar month at a time, oldest first, for
+    consumers that fold them into aggregates instead of holding the whole history.
+
+    Each day comes from its daily file, from the archive or, if neither has it, from the API
+    (and is then cached like in Get_Shab_DF). last_df.parquet, the whole-history file, is
+    neither read nor written, so at most one month of rows is in memory at a time; the next
+    regular refresh picks the new days up from their daily files.
+
+    Yields:
+        (month_start, DataFrame) per month that has rows.
+    """
+    ensure_directories()
+    data_dir = cache_dir(all_subrubrics)
+    archive_dir = os.path.join(data_dir, 'archive')
+    archived = archived_days(archive_dir)
+    session = get_session()
+
+    total_days = (to_date - from_date).days + 1
+    done = 0
+    month_start = from_date
+    while month_start <= to_date:
+        next_month = (month_start.replace(day=1) + timedelta(days=32)).replace(day=1)
+        month_days = daterange(month_start, min(next_month - timedelta(days=1), to_date))
+
+        frames = []
+        from_archive = [day for day in month_days if day in archived and
+                        not os.path.exists(os.path.join(data_dir, f'shab-{day.strftime("%Y-%m-%d")}.parquet'))]
+        if from_archive:
+            df_archived = read_archive(from_archive[0], from_archive[-1], archive_dir=archive_dir)
+            if not df_archived.empty:
+                frames.append(df_archived[df_archived['date'].dt.date.isin(set(from_archive))])
+
+        for day in month_days:
+            done += 1
+            if progress_callback:
+                progress_callback(done, total_days, f"Reading data for {day}")
+            if day in from_archive:
+                continue
+            try:
+                df = Get_Shab_DF(day, session=session, all_subrubrics=all_subrubrics)
+            except Exception as e:
+                logger.error(f"Error fetching {day}: {e}")
+                continue
+            if df is not None and not df.empty:
+                frames.append(df)
+
+        if frames:
+            df_month = pd.concat(frames, ignore_index=True)
+            df_month['date'] = pd.to_datetime(df_month['date'])
+            if 'id' in df_month.columns:
+                df_month = df_month.drop_duplicates(subset=['id'], ignore_index=True)
+            if all_subrubrics:
+                compact_shab_df(df_month)
+            yield month_start, df_month
+        month_start = next_month
@@ -0,0 +1,82 @@
+"""
+Content-addressed bookkeeping for refresh artifacts.
+
+Every artifact-producing stage of the refresh is tagged with a hash of the aggregates it is
+built from. The manifest remembers the last published hash per stage, so a stage whose
+inputs did not change (and whose outputs are still on disk) can be skipped.
+"""
+
+import os
+import json
+import hashlib
+import logging
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+SHAB_DATA_DIR = './shab_data'
+MANIFEST_FILE = os.path.join(SHAB_DATA_DIR, 'artifacts.json')
+
+
+def content_hash(*parts):
+    """
+    Hash DataFrames, NumPy arrays and JSON-serializable values into one hex digest.
+    DataFrames are hashed by content (values, column names and dtypes), not by identity.
+    """
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, pd.DataFrame):
+            h.update(json.dumps([list(map(str, part.columns)), list(map(str, part.dtypes))]).encode("utf-8"))
+            h.update(pd.util.hash_pandas_object(part, index=False).to_numpy().tobytes())
+        elif isinstance(part, np.ndarray):
+            h.update(f"{part.dtype.str}{part.shape}".encode("utf-8"))
+            h.update(np.ascontiguousarray(part).tobytes())
+        else:
+            h.update(json.dumps(part, sort_keys=True, default=str).encode("utf-8"))
+        # Separator so ("ab", "c") and ("a", "bc") differ
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class ArtifactManifest:
+    """The last published input hash and outputs of every refresh stage."""
+
+    def __init__(self, path=MANIFEST_FILE):
+        self.path = path
+        self.stages = {}
+        if os.path.isfile(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.stages = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable artifact manifest {path}: {e}")
+
+    def is_fresh(self, stage, input_hash, outputs=None):
+        """
+        True if `stage` was last published from `input_hash` and all its outputs still exist.
+        `outputs` defaults to the outputs recorded for the stage.
+        """
+        entry = self.stages.get(stage)
+        if entry is None or entry.get("hash") != input_hash:
+            return False
+        if outputs is None:
+            outputs = entry.get("outputs", [])
+        return all(os.path.exists(p) for p in outputs)
+
+    def get(self, stage, key, default=None):
+        return self.stages.get(stage, {}).get(key, default)
+
+    def record(self, stage, input_hash, outputs=(), **extra):
+        self.stages[stage] = {"hash": input_hash, "outputs": list(outputs), **extra}
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        fd, temp_path = tempfile.mkstemp(dir=directory or ".", prefix="tmp_shab_", suffix=".json")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(self.stages, f, indent=2)
+        os.replace(temp_path, self.path)
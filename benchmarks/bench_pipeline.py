@@ -0,0 +1,224 @@
+"""
+Benchmark suite of the refresh pipeline on synthetic data at multiples of the current volume.
+
+Times separately, per scale:
+    xml_parse         XML parsing in app.Get_Shab_DF (one publication day, served from memory)
+    parquet_roundtrip parquet_utils.safe_write_parquet_atomic + safe_read_parquet
+    dashboard_export  dashboard_data.export_dashboard_data
+    plots             plots.generate_plots
+    udemo_merge       the SHAB/UDEMO merge stage of refresh_data
+
+Every run is appended to a JSON history (one record per run with the commit, the options
+and the timings) and compared with the last run that used the same options.
+
+Usage:
+    python -m benchmarks.bench_pipeline [--scales 1,10] [--years 3] [--repeat 3]
+
+The 100x scale (22M rows over 3 years) is not run by default: with the in-memory dashboard
+aggregation it needs more than 5 GB of RAM. Run it explicitly with --scales 100.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import date, datetime
+
+from benchmarks.synthetic import ROWS_PER_DAY, make_shab_df, make_shab_xml_pages, make_udemo_observations
+
+HISTORY_FILE = os.path.join(os.path.dirname(__file__), 'history.json')
+BENCHMARKS = ("xml_parse", "parquet_roundtrip", "dashboard_export", "plots", "udemo_merge")
+# Slowdown against the previous comparable run that is reported as a regression
+REGRESSION_THRESHOLD = 1.2
+
+
+class _FakeResponse:
+    def __init__(self, content):
+        self.content = content
+        self.status_code = 200
+        self.raw = None
+
+    def raise_for_status(self):
+        pass
+
+
+class _PagedSession:
+    """Stands in for the requests session in Get_Shab_DF and serves prebuilt XML pages."""
+
+    def __init__(self, pages):
+        self.pages = pages
+
+    def get(self, url, **kwargs):
+        page = int(url.rsplit("pageRequest.page=", 1)[1])
+        return _FakeResponse(self.pages[min(page, len(self.pages) - 1)])
+
+
+def _best(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def bench_xml_parse(scale, repeat):
+    from app import Get_Shab_DF
+    from metrics import refresh_metrics
+
+    day = date(2025, 6, 2)
+    session = _PagedSession(make_shab_xml_pages(day, ROWS_PER_DAY * scale * 2))
+    parse_times = []
+    for _ in range(repeat):
+        refresh_metrics.reset()
+        Get_Shab_DF(day, session=session, use_cache=False)
+        parse_times.append(refresh_metrics.snapshot()["timers"]["shab_xml_parse_seconds"])
+    return min(parse_times)
+
+
+def bench_parquet_roundtrip(df, repeat):
+    from parquet_utils import safe_read_parquet, safe_write_parquet_atomic
+
+    path = os.path.join("shab_data", "bench_roundtrip.parquet")
+
+    def roundtrip():
+        safe_write_parquet_atomic(df, path)
+        safe_read_parquet(path)
+
+    return _best(roundtrip, repeat)
+
+
+def bench_dashboard_export(df, repeat):
+    from dashboard_data import export_dashboard_data
+    return _best(lambda: export_dashboard_data(df, out_dir=os.path.join("static", "data")), repeat)
+
+
+def bench_plots(df, start_date, end_date, repeat):
+    from plots import generate_plots
+    return _best(lambda: generate_plots(df, start_date, end_date, "static"), repeat)
+
+
+def bench_udemo_merge(df, years, repeat):
+    import refresh_data
+    from artifacts import ArtifactManifest
+
+    observations = make_udemo_observations(years)
+
+    def merge():
+        # A fresh manifest and no previous table: the full merge, as on a first refresh
+        if os.path.exists(refresh_data.UDEMO_MERGED_FILE):
+            os.remove(refresh_data.UDEMO_MERGED_FILE)
+        refresh_data.merge_bfs({
+            "df_shab": df,
+            "df_bfs": observations,
+            "manifest": ArtifactManifest(os.path.join("shab_data", "bench_artifacts.json")),
+        })
+
+    return _best(merge, repeat)
+
+
+def run_scale(scale, years, repeat, only):
+    end_date = date(2025, 12, 31)
+    start_date = date(end_date.year - years + 1, 1, 1)
+    df = make_shab_df(start_date, end_date, rows_per_day=ROWS_PER_DAY * scale)
+    print(f"\n{scale}x: {len(df)} rows, {start_date} - {end_date}")
+
+    runners = {
+        "xml_parse": lambda: bench_xml_parse(scale, repeat),
+        "parquet_roundtrip": lambda: bench_parquet_roundtrip(df, repeat),
+        "dashboard_export": lambda: bench_dashboard_export(df, repeat),
+        "plots": lambda: bench_plots(df, start_date, end_date, repeat),
+        "udemo_merge": lambda: bench_udemo_merge(df, list(range(start_date.year, end_date.year + 1)), repeat),
+    }
+    results = {"rows": len(df)}
+    for name in only:
+        results[name] = round(runners[name](), 4)
+        print(f"  {name:<18} {results[name]:9.3f} s")
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+
+def compare(record, history):
+    """Print the change against the last run with the same options."""
+    previous = next((r for r in reversed(history) if r["options"] == record["options"]), None)
+    if previous is None:
+        print("\nNo previous run with the same options to compare with.")
+        return
+    print(f"\nCompared with {previous['commit'] or 'unknown commit'} ({previous['timestamp']}):")
+    for scale, results in record["results"].items():
+        for name in BENCHMARKS:
+            before = previous["results"].get(scale, {}).get(name)
+            after = results.get(name)
+            if not before or after is None:
+                continue
+            ratio = after / before
+            flag = "  REGRESSION" if ratio > REGRESSION_THRESHOLD else ""
+            print(f"  {scale}x {name:<18} {before:9.3f} s -> {after:9.3f} s  ({ratio:5.2f}x){flag}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scales", default="1,10", help="Comma-separated multiples of the current volume")
+    parser.add_argument("--years", type=int, default=3, help="Length of the synthetic history (the refresh window is 3 years)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per benchmark (best is reported)")
+    parser.add_argument("--only", default=",".join(BENCHMARKS), help="Comma-separated benchmarks to run")
+    parser.add_argument("--history", default=HISTORY_FILE, help="JSON history file to append the results to")
+    parser.add_argument("--no-history", action="store_true", help="Do not record this run")
+    args = parser.parse_args(argv)
+
+    scales = [int(s) for s in args.scales.split(",") if s.strip()]
+    only = [b.strip() for b in args.only.split(",") if b.strip()]
+    unknown = sorted(set(only) - set(BENCHMARKS))
+    if unknown:
+        parser.error(f"Unknown benchmark: {', '.join(unknown)}")
+
+    record = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "options": {"years": args.years, "repeat": args.repeat},
+        "results": {},
+    }
+
+    # The pipeline writes to ./shab_data and ./static: run in a scratch directory
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as scratch:
+        os.chdir(scratch)
+        try:
+            for scale in scales:
+                record["results"][str(scale)] = run_scale(scale, args.years, args.repeat, only)
+        finally:
+            os.chdir(cwd)
+
+    if not args.no_history:
+        history = load_history(args.history)
+        compare(record, history)
+        history.append(record)
+        with open(args.history, "w", encoding="utf-8") as f:
+            json.dump(history, f, indent=2)
+        print(f"\nAppended to {args.history}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""
+Benchmark of the plot stage: the previous seaborn FacetGrid implementation vs plots.generate_plots.
+
+Usage:
+    python -m benchmarks.bench_plots [--years 3] [--repeat 3]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+from datetime import date
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+from plots import generate_plots
+from benchmarks.synthetic import make_shab_df
+
+
+def legacy_generate_plots(df, start_date, end_date, output_dir):
+    """The seaborn-based implementation generate_plots replaced, kept as the baseline."""
+    import pandas as pd
+    import seaborn as sns
+
+    df = df.copy()
+    df['month'] = pd.to_datetime(df['date']).dt.to_period('M')
+
+    grouped_multiple = df.groupby(['month', 'subrubric', 'kanton']).agg({'subrubric': ['count']})
+    grouped_multiple.columns = ['count']
+    grouped_multiple = grouped_multiple.reset_index()
+    grouped_multiple['month_str'] = grouped_multiple['month'].dt.strftime('%Y-%m')
+    grouped_multiple.sort_values(by=['kanton', 'month'], inplace=True)
+
+    g = sns.FacetGrid(grouped_multiple, col="kanton", col_wrap=5, hue="subrubric", sharey=False)
+    g.map(sns.lineplot, "month_str", "count")
+    g.add_legend()
+    g.set_axis_labels(f"{start_date} - {end_date}", "Meldungen")
+    g.set(xticklabels=[])
+    g.savefig(os.path.join(output_dir, "FacetGridKanton.png"))
+    plt.close()
+
+    grouped_no_kanton = df.groupby(['month', 'subrubric']).agg({'subrubric': ['count']})
+    grouped_no_kanton.columns = ['count']
+    grouped_no_kanton = grouped_no_kanton.reset_index()
+    grouped_no_kanton['month_str'] = grouped_no_kanton['month'].dt.strftime('%Y-%m')
+    grouped_no_kanton = grouped_no_kanton.sort_values('month')
+
+    plt.figure(figsize=(20, 6))
+    sns.set_style(style='darkgrid')
+    sns.lineplot(data=grouped_no_kanton, x="month_str", y='count', hue='subrubric')
+    plt.xticks(rotation=45)
+    plt.title(f"SHAB Meldungen {start_date} - {end_date}")
+    plt.savefig(os.path.join(output_dir, "LineGraph.png"), bbox_inches='tight')
+    plt.close()
+
+
+def _time(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--years", type=int, default=3, help="Length of the synthetic history")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per variant (best is reported)")
+    args = parser.parse_args(argv)
+
+    end_date = date(2025, 12, 31)
+    start_date = date(end_date.year - args.years + 1, 1, 1)
+    df = make_shab_df(start_date, end_date)
+    print(f"Synthetic dataset: {len(df)} rows, {start_date} - {end_date}")
+
+    variants = {
+        "before (seaborn FacetGrid, sequential)": lambda out: legacy_generate_plots(df, start_date, end_date, out),
+        "after (NumPy + Line2D, in-process)": lambda out: generate_plots(df, start_date, end_date, out, max_workers=1),
+    }
+    # generate_plots renders in-process when there is a single CPU; timing that as the pool would mislead
+    if (os.cpu_count() or 1) > 1:
+        variants["after (NumPy + Line2D, process pool)"] = lambda out: generate_plots(df, start_date, end_date, out)
+    else:
+        print("Single CPU: the process pool variant is skipped (generate_plots renders in-process).")
+
+    with tempfile.TemporaryDirectory() as out:
+        results = {name: _time(lambda: fn(out), args.repeat) for name, fn in variants.items()}
+
+    baseline = next(iter(results.values()))
+    for name, seconds in results.items():
+        print(f"{name:<42} {seconds:8.3f} s  ({baseline / seconds:5.1f}x)")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
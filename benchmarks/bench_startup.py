@@ -0,0 +1,67 @@
+"""
+Startup benchmark of the Flask app: import time of flask_seaborn measured with `python -X importtime`.
+
+Reports the total import time, the slowest top-level imports, and whether any heavy module
+(pandas, pyarrow, numpy, matplotlib, seaborn) is loaded at startup. Each run is a fresh
+interpreter, so nothing is served from an already-imported module.
+
+Usage:
+    python -m benchmarks.bench_startup [--module flask_seaborn] [--repeat 5] [--top 10]
+"""
+
+import sys
+import argparse
+import subprocess
+import statistics
+
+HEAVY_MODULES = ("pandas", "pyarrow", "numpy", "matplotlib", "seaborn")
+
+
+def import_times(module):
+    """
+    Import `module` in a fresh interpreter with -X importtime.
+
+    Returns:
+        List of (package, self_us, cumulative_us) in the order they finished importing.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        # "import time:      self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # Nested imports are indented below the module that triggered them
+        rows.append((name.rstrip()[1:], int(self_us), int(cumulative_us)))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--module", default="flask_seaborn", help="Module to import")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters to run (median is reported)")
+    parser.add_argument("--top", type=int, default=10, help="Slowest top-level imports to list")
+    args = parser.parse_args(argv)
+
+    runs = [import_times(args.module) for _ in range(args.repeat)]
+    totals = [next(cum for name, _, cum in rows if name.strip() == args.module) for rows in runs]
+    print(f"import {args.module}: median {statistics.median(totals) / 1000:.1f} ms over {args.repeat} runs")
+
+    # Direct imports of the module (one indentation level) in the median run
+    rows = runs[totals.index(sorted(totals)[len(totals) // 2])]
+    direct = sorted((r for r in rows if r[0].startswith("  ") and not r[0].startswith("    ")),
+                    key=lambda r: r[2], reverse=True)
+    print(f"\nSlowest imports of {args.module}:")
+    for name, _, cumulative_us in direct[:args.top]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name.strip()}")
+
+    loaded = sorted({name.strip().split(".")[0] for name, _, _ in rows} & set(HEAVY_MODULES))
+    print(f"\nHeavy modules loaded at startup: {', '.join(loaded) if loaded else 'none'}")
+    return 1 if loaded else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
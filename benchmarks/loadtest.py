@@ -0,0 +1,314 @@
+"""
+Load test of the Flask serving layer under a production WSGI server.
+
+Starts flask_seaborn:app under gunicorn (or waitress) on a local port. A number of virtual
+users then send a weighted mix of dashboard requests for a fixed duration. The report
+covers throughput, latency percentiles per endpoint, errors, and the peak RSS of every
+server process. With --bump-at, the harness rewrites status.json with a new data_version
+partway through, like a refresh does, so the snapshot reload is measured under load; the
+original status.json is put back once the server has stopped.
+
+The app serves the data published by the last refresh in this checkout (static/, shab_data/),
+so run refresh_data.py first.
+
+Usage:
+    python -m benchmarks.loadtest [--server gunicorn] [--workers 4] [--users 32] [--duration 30]
+                                  [--bump-at 10] [--output loadtest.json]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import subprocess
+import http.client
+import importlib.util
+from collections import defaultdict
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATUS_FILE = os.path.join(REPO_DIR, 'static', 'status.json')
+
+# (path, weight): the dashboard page loads the data files once and then polls the status
+REQUEST_MIX = [
+    ("/", 10),
+    ("/api/status", 40),
+    ("/api/udemo_vs_shab", 10),
+    ("/static/data/shab_monthly.json", 20),
+    ("/static/data/dimensions.json", 20),
+]
+
+SERVERS = ("gunicorn", "waitress", "werkzeug")
+
+
+def server_command(server, host, port, workers, threads):
+    """The command line that serves flask_seaborn:app with `server`."""
+    if server == "gunicorn":
+        return [sys.executable, "-m", "gunicorn", "--workers", str(workers), "--threads", str(threads),
+                "--bind", f"{host}:{port}", "--log-level", "warning", "flask_seaborn:app"]
+    if server == "waitress":
+        # Single process; --workers does not apply
+        return [sys.executable, "-m", "waitress", f"--listen={host}:{port}", f"--threads={threads}", "flask_seaborn:app"]
+    # Flask's development server, only for comparison or when no production server is installed
+    return [sys.executable, "-c",
+            f"from flask_seaborn import app; app.run(host={host!r}, port={port}, threaded=True)"]
+
+
+def server_available(server):
+    if server == "werkzeug":
+        return True
+    if server == "gunicorn" and sys.platform == "win32":
+        return False
+    return importlib.util.find_spec(server) is not None
+
+
+def process_tree(pid):
+    """pid and all its descendants (Linux /proc only; [pid] elsewhere)."""
+    if not os.path.isdir("/proc"):
+        return [pid]
+    children = defaultdict(list)
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r") as f:
+                # The command name may contain spaces; the fields after it are fixed
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children[ppid].append(int(entry))
+    tree, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        tree.append(current)
+        pending.extend(children.get(current, []))
+    return tree
+
+
+def rss_bytes(pid):
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+class MemorySampler:
+    """Records the peak RSS of every process in the server's process tree."""
+
+    def __init__(self, pid, interval=0.5):
+        self.pid = pid
+        self.interval = interval
+        self.peaks = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            for pid in process_tree(self.pid):
+                rss = rss_bytes(pid)
+                if rss is not None:
+                    self.peaks[pid] = max(rss, self.peaks.get(pid, 0))
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def wait_until_ready(host, port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=2)
+            conn.request("GET", "/api/status")
+            conn.getresponse().read()
+            conn.close()
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def virtual_user(host, port, deadline, results, lock, seed):
+    """Send weighted random requests over one keep-alive connection until the deadline."""
+    rng = random.Random(seed)
+    paths = [p for p, _ in REQUEST_MIX]
+    weights = [w for _, w in REQUEST_MIX]
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    local = defaultdict(list)
+    errors = defaultdict(int)
+    while time.time() < deadline:
+        path = rng.choices(paths, weights)[0]
+        start = time.perf_counter()
+        try:
+            conn.request("GET", path)
+            response = conn.getresponse()
+            response.read()
+            status = response.status
+            if response.getheader("Connection", "").lower() == "close":
+                conn.close()
+                conn = http.client.HTTPConnection(host, port, timeout=30)
+        except (OSError, http.client.HTTPException):
+            status = "connection error"
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=30)
+        elapsed = time.perf_counter() - start
+        local[path].append(elapsed)
+        if status != 200:
+            errors[f"{path} {status}"] += 1
+    conn.close()
+    with lock:
+        for path, latencies in local.items():
+            results["latencies"][path].extend(latencies)
+        for key, count in errors.items():
+            results["errors"][key] += count
+
+
+def _write_status(content):
+    tmp = f"{STATUS_FILE}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(content)
+    os.replace(tmp, STATUS_FILE)
+
+
+def bump_data_version(original):
+    """Rewrite status.json with a new data_version, as a refresh that changed data would."""
+    status = json.loads(original)
+    status["data_version"] = int(time.time())
+    _write_status(json.dumps(status).encode("utf-8"))
+    return status["data_version"]
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies):
+    """Request count and latency percentiles; the percentiles are None without any request."""
+    values = sorted(latencies)
+    if not values:
+        return {"requests": 0, **{f"p{q}_ms": None for q in (50, 90, 95, 99)}, "max_ms": None}
+    return {
+        "requests": len(values),
+        **{f"p{q}_ms": round(percentile(values, q) * 1000, 2) for q in (50, 90, 95, 99)},
+        "max_ms": round(values[-1] * 1000, 2),
+    }
+
+
+def _ms(value):
+    return "-" if value is None else value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--server", choices=SERVERS, default="gunicorn",
+                        help="WSGI server (werkzeug is Flask's development server, for comparison only)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8050)
+    parser.add_argument("--workers", type=int, default=4, help="Server worker processes (gunicorn)")
+    parser.add_argument("--threads", type=int, default=4, help="Threads per worker")
+    parser.add_argument("--users", type=int, default=32, help="Concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of load")
+    parser.add_argument("--bump-at", type=float, metavar="SECONDS",
+                        help="Bump data_version in status.json this many seconds into the run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also write the report as JSON to this file")
+    parser.add_argument("--verbose", action="store_true", help="Show the server's own output (access logs)")
+    args = parser.parse_args(argv)
+
+    if not server_available(args.server):
+        print(f"{args.server} is not installed (pipenv install --dev), or not supported on this platform. "
+              f"Use --server with one of: {', '.join(s for s in SERVERS if server_available(s))}.")
+        return 2
+    if not os.path.isfile(STATUS_FILE):
+        print(f"{STATUS_FILE} not found. Run refresh_data.py first so the app has data to serve.")
+        return 2
+
+    with open(STATUS_FILE, "rb") as f:
+        original_status = f.read()
+
+    server_output = None if args.verbose else subprocess.DEVNULL
+    server = subprocess.Popen(server_command(args.server, args.host, args.port, args.workers, args.threads),
+                              cwd=REPO_DIR, stdout=server_output, stderr=server_output)
+    bumped = None
+    try:
+        if not wait_until_ready(args.host, args.port):
+            print("Server did not become ready.")
+            return 1
+
+        sampler = MemorySampler(server.pid)
+        sampler.start()
+
+        results = {"latencies": defaultdict(list), "errors": defaultdict(int)}
+        lock = threading.Lock()
+        started = time.time()
+        deadline = started + args.duration
+        users = [threading.Thread(target=virtual_user, args=(args.host, args.port, deadline, results, lock, args.seed + i))
+                 for i in range(args.users)]
+        for user in users:
+            user.start()
+
+        if args.bump_at is not None:
+            time.sleep(max(0, args.bump_at - (time.time() - started)))
+            bumped = bump_data_version(original_status)
+            print(f"data_version bumped to {bumped} at {time.time() - started:.1f}s")
+
+        for user in users:
+            user.join()
+        elapsed = time.time() - started
+        sampler.stop()
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        if bumped is not None:
+            _write_status(original_status)
+
+    all_latencies = [v for values in results["latencies"].values() for v in values]
+    report = {
+        "server": args.server,
+        "workers": args.workers if args.server == "gunicorn" else 1,
+        "threads": args.threads,
+        "users": args.users,
+        "duration_s": round(elapsed, 2),
+        "data_version_bump": bumped,
+        "throughput_rps": round(len(all_latencies) / elapsed, 1),
+        "overall": summarize(all_latencies),
+        "endpoints": {path: summarize(values) for path, values in sorted(results["latencies"].items())},
+        "errors": dict(results["errors"]),
+        "peak_rss_mib": {str(pid): round(rss / 2**20, 1) for pid, rss in sorted(sampler.peaks.items())},
+    }
+
+    print(f"\n{report['server']}: {report['workers']} worker(s) x {report['threads']} threads, "
+          f"{report['users']} users, {report['duration_s']} s")
+    print(f"Throughput: {report['throughput_rps']} req/s, errors: {sum(report['errors'].values())}")
+    print(f"\n{'endpoint':<34}{'requests':>9}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for path, s in list(report["endpoints"].items()) + [("(all)", report["overall"])]:
+        print(f"{path:<34}{s['requests']:>9}{_ms(s['p50_ms']):>9}{_ms(s['p90_ms']):>9}{_ms(s['p99_ms']):>9}{_ms(s['max_ms']):>9}")
+    for key, count in report["errors"].items():
+        print(f"  error: {key} x{count}")
+    print("\nPeak RSS per server process (MiB): " +
+          ", ".join(f"{pid}: {rss}" for pid, rss in report["peak_rss_mib"].items()))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
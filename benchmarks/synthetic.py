@@ -0,0 +1,93 @@
+"""
+Synthetic SHAB data for benchmarks.
+"""
+
+import numpy as np
+import pandas as pd
+
+from cantons import VALID_CANTONS
+
+# Roughly the current daily HR01 + HR03 volume
+ROWS_PER_DAY = 200
+
+
+def make_shab_df(start_date, end_date, rows_per_day=ROWS_PER_DAY, seed=0):
+    """
+    Build a DataFrame with the same schema as app.Get_Shab_DF_from_range returns.
+    Cantons are drawn with a skewed distribution so the large cantons dominate, like in the real data.
+    """
+    rng = np.random.default_rng(seed)
+    days = pd.date_range(start_date, end_date, freq="D")
+    n = rows_per_day * len(days)
+
+    cantons = np.array(sorted(VALID_CANTONS))
+    weights = rng.pareto(1.5, len(cantons)) + 0.1
+    weights /= weights.sum()
+
+    return pd.DataFrame({
+        "id": [f"{i:08x}-0000-0000-0000-000000000000" for i in range(n)],
+        "date": np.repeat(days.values, rows_per_day),
+        "title": [f"Muster {i % 9973} AG" for i in range(n)],
+        "rubric": "HR",
+        "subrubric": rng.choice(["HR01", "HR03"], n, p=[0.55, 0.45]),
+        "publikations_status": "PUBLISHED",
+        "primaryTenantCode": "shab",
+        "kanton": rng.choice(cantons, n, p=weights),
+    })
+
+
+# Page size of the amtsblattportal API as requested by app.Get_Shab_DF
+XML_PAGE_SIZE = 3000
+# Other HR subrubrics are part of the response and filtered out by Get_Shab_DF
+OTHER_SUBRUBRICS = ["HR02", "HR04", "HR05"]
+
+
+def make_shab_xml_pages(day, rows, seed=0, page_size=XML_PAGE_SIZE):
+    """
+    Build the amtsblattportal XML response pages for one publication day, in the structure
+    app.Get_Shab_DF parses, followed by the empty page that ends its paging loop.
+
+    Returns:
+        List of UTF-8 encoded XML documents, one per page.
+    """
+    rng = np.random.default_rng(seed)
+    cantons = np.array(sorted(VALID_CANTONS))
+    subrubrics = rng.choice(["HR01", "HR03"] + OTHER_SUBRUBRICS, rows, p=[0.4, 0.3, 0.1, 0.1, 0.1])
+    kantone = rng.choice(cantons, rows)
+    day_str = pd.Timestamp(day).strftime("%Y-%m-%d")
+
+    pages = []
+    for start in range(0, rows, page_size):
+        parts = ['<?xml version="1.0" encoding="UTF-8"?>\n<bulk-export>']
+        for i in range(start, min(start + page_size, rows)):
+            parts.append(
+                "<publication><meta>"
+                f"<id>{day_str}-{i:08x}</id>"
+                f"<publicationDate>{day_str}</publicationDate>"
+                f"<title><de>Muster {i % 9973} AG</de><fr>Muster {i % 9973} SA</fr></title>"
+                "<rubric>HR</rubric>"
+                f"<subRubric>{subrubrics[i]}</subRubric>"
+                "<publicationState>PUBLISHED</publicationState>"
+                "<primaryTenantCode>shab</primaryTenantCode>"
+                f"<cantons>{kantone[i]}</cantons>"
+                "</meta><content>Eintrag ins Handelsregister</content></publication>"
+            )
+        parts.append("</bulk-export>")
+        pages.append("".join(parts).encode("utf-8"))
+    pages.append(b'<?xml version="1.0" encoding="UTF-8"?>\n<bulk-export></bulk-export>')
+    return pages
+
+
+def make_udemo_observations(years, observation_text="Unternehmensneugründungen", seed=0):
+    """Build BFS UDEMO observations with the columns udemo_store.update_store returns."""
+    from bfs_pxweb import CANTON_ABBR_TO_LABEL
+
+    rng = np.random.default_rng(seed)
+    rows = [
+        {"Beobachtungseinheit": observation_text, "Kanton": label, "Rechtsform": form,
+         "Jahr": int(year), "value": float(rng.integers(10, 2000))}
+        for year in years
+        for label in CANTON_ABBR_TO_LABEL.values()
+        for form in ("Einzelunternehmen", "Kollektivgesellschaft", "Aktiengesellschaft", "GmbH")
+    ]
+    return pd.DataFrame(rows)
@@ -1,11 +1,139 @@
 
+import os
+import json
+import time
+import hashlib
+import tempfile
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import numpy as np
 import pandas as pd
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from time import sleep
 
+from metrics import refresh_metrics
+
 logger = logging.getLogger(__name__)
 
+PXWEB_BASE_URL = "https://www.pxweb.bfs.admin.ch/api/v1/de"
+UDEMO_TABLE_ID = "px-x-0602010000_102"
+
+# Responses are cached on disk per table and query; UDEMO changes about once a year.
+BFS_CACHE_DIR = os.path.join('./shab_data', 'bfs_cache')
+BFS_CACHE_TTL = 7 * 24 * 3600  # seconds
+
+# PxWeb rejects queries selecting more cells than this (the "maxValues" of the BFS API config)
+PXWEB_MAX_CELLS = 5000
+PXWEB_WORKERS = 4
+
+_session = None
+
+def get_session():
+    """
+    Shared pooled session for PxWeb requests.
+    PxWeb data queries are POSTs but read-only, so they are retried like GETs.
+    """
+    global _session
+    if _session is None:
+        session = requests.Session()
+        retry = Retry(
+            total=5,
+            backoff_factor=1.0,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["HEAD", "GET", "OPTIONS", "POST"]
+        )
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=4, pool_maxsize=8)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _session = session
+    return _session
+
+def _cache_path(table_id, payload, cache_dir):
+    raw = json.dumps({"table": table_id, "query": payload}, sort_keys=True, ensure_ascii=False)
+    key = hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, f"{table_id}-{key[:32]}.json")
+
+def _write_cache_entry(path, entry):
+    directory = os.path.dirname(path)
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix="tmp_bfs_", suffix=".json")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(entry, f)
+    os.replace(temp_path, path)
+
+def pxweb_request(table_id, payload=None, cache_ttl=BFS_CACHE_TTL, cache_dir=BFS_CACHE_DIR):
+    """
+    GET the metadata (payload None) or POST a query for a PxWeb table, through a disk cache.
+
+    Fresh cache entries (younger than cache_ttl seconds) are returned without any network
+    round trip. Expired entries are revalidated with If-None-Match / If-Modified-Since when
+    the server provided validators, and served stale if the server cannot be reached.
+
+    Returns:
+        The decoded JSON response.
+    """
+    url = f"{PXWEB_BASE_URL}/{table_id}"
+    path = _cache_path(table_id, payload, cache_dir) if cache_dir else None
+
+    entry = None
+    if path and os.path.isfile(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            entry = None
+
+    if entry is not None and time.time() - entry["fetched_at"] < cache_ttl:
+        logger.debug(f"BFS cache hit for {table_id}")
+        refresh_metrics.inc("bfs_cache_hits")
+        return entry["body"]
+
+    headers = {}
+    if entry is not None:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    session = get_session()
+    try:
+        with refresh_metrics.timer("bfs_http_seconds"):
+            if payload is None:
+                r = session.get(url, headers=headers, timeout=(10, 30))
+            else:
+                r = session.post(url, json=payload, headers=headers, timeout=(10, 60))
+        refresh_metrics.inc("bfs_http_requests")
+        refresh_metrics.inc("bfs_http_bytes", len(r.content))
+        retries = getattr(getattr(r.raw, "retries", None), "history", None)
+        if retries:
+            refresh_metrics.inc("bfs_http_retries", len(retries))
+        if r.status_code == 304 and entry is not None:
+            logger.debug(f"BFS cache revalidated for {table_id}")
+            refresh_metrics.inc("bfs_cache_revalidated")
+            entry["fetched_at"] = time.time()
+            _write_cache_entry(path, entry)
+            return entry["body"]
+        r.raise_for_status()
+        body = r.json()
+    except (requests.RequestException, ValueError) as e:
+        if entry is None:
+            raise
+        logger.warning(f"BFS request for {table_id} failed, using stale cached response: {e}")
+        return entry["body"]
+
+    if path:
+        _write_cache_entry(path, {
+            "url": url,
+            "fetched_at": time.time(),
+            "etag": r.headers.get("ETag"),
+            "last_modified": r.headers.get("Last-Modified"),
+            "body": body,
+        })
+    return body
+
 # Mapping from internal abbreviation to BFS label (bilingual or specific format)
 # This list matches the "Kanton" dimension values in BFS UDEMO datasets.
 CANTON_ABBR_TO_LABEL = {
@@ -37,7 +165,74 @@ CANTON_ABBR_TO_LABEL = {
     'JU': 'Jura'
 }
 
-def fetch_udemo(observation_text="Unternehmensneugründungen", years=None, canton_abbrs=None, legal_form_text=None):
+def split_query(query, max_cells=PXWEB_MAX_CELLS):
+    """
+    Split a PxWeb query into queries that each select at most max_cells cells.
+    The selection with the most values is halved until every chunk fits.
+    """
+    cells = 1
+    for selection in query:
+        cells *= max(len(selection["selection"]["values"]), 1)
+    if cells <= max_cells:
+        return [query]
+
+    widest = max(range(len(query)), key=lambda i: len(query[i]["selection"]["values"]))
+    values = query[widest]["selection"]["values"]
+    if len(values) <= 1:
+        # Cannot split any further; let the server decide
+        return [query]
+
+    chunks = []
+    mid = len(values) // 2
+    for part in (values[:mid], values[mid:]):
+        sub = [dict(sel) for sel in query]
+        sub[widest] = {**query[widest], "selection": {**query[widest]["selection"], "values": part}}
+        chunks.extend(split_query(sub, max_cells))
+    return chunks
+
+def jsonstat2_to_df(js):
+    """
+    Convert a json-stat2 dataset into a long DataFrame with one column per dimension
+    (category labels) and a 'value' column.
+
+    The flat value array is in row-major order over the dimensions listed in js['id'],
+    so the dimension columns are the cartesian product of the category labels; no
+    per-cell Python loop is needed.
+    """
+    ids = js["id"]
+    sizes = js["size"]
+
+    labels = []
+    for dim_id in ids:
+        category = js["dimension"][dim_id]["category"]
+        index = category.get("index")
+        if index is None:
+            codes = list(category["label"].keys())
+        elif isinstance(index, dict):
+            codes = sorted(index, key=index.get)
+        else:
+            codes = list(index)
+        code_labels = category.get("label", {})
+        labels.append([code_labels.get(c, c) for c in codes])
+
+    total = int(np.prod(sizes))
+    raw = js.get("value", [])
+    if isinstance(raw, dict):
+        # Sparse form: {"flat index": value}
+        values = np.full(total, np.nan)
+        if raw:
+            idx = np.fromiter((int(k) for k in raw.keys()), dtype=np.int64, count=len(raw))
+            values[idx] = np.array(list(raw.values()), dtype=float)
+    else:
+        # null -> NaN
+        values = np.array(raw, dtype=float)
+
+    df = pd.MultiIndex.from_product(labels, names=ids).to_frame(index=False)
+    # Reshaping validates the value count against the dimension sizes
+    df["value"] = values.reshape(sizes).ravel()
+    return df
+
+def fetch_udemo(observation_text="Unternehmensneugründungen", years=None, canton_abbrs=None, legal_form_text=None, cache_ttl=BFS_CACHE_TTL):
     """
     Fetch UDEMO data from BFS PxWeb API.
 
@@ -46,6 +241,7 @@ def fetch_udemo(observation_text="Unternehmensneugründungen", years=None, canto
         years: List of years to fetch (integers or strings)
         canton_abbrs: List of canton abbreviations (e.g. ['ZH', 'BE']). If None, fetches all.
         legal_form_text: Text filter for 'Rechtsform'. If None, fetches all.
+        cache_ttl: Seconds a cached BFS response is used without revalidation (0 always revalidates).
 
     Returns:
         pd.DataFrame with columns ['Beobachtungseinheit', 'Kanton', 'Rechtsform', 'Jahr', 'value']
@@ -59,7 +255,7 @@ def fetch_udemo(observation_text="Unternehmensneugründungen", years=None, canto
     # Using the dataset ID found in online examples or common UDEMO ID.
     # "px-x-0602010000_102" is often "Unternehmensdemografie: Neugründungen"
 
-    api_url = "https://www.pxweb.bfs.admin.ch/api/v1/de/px-x-0602010000_102"
+    table_id = UDEMO_TABLE_ID
 
     # If years are provided, format them
     if years:
@@ -120,9 +316,7 @@ def fetch_udemo(observation_text="Unternehmensneugründungen", years=None, canto
 
     # Let's try to get metadata first to be robust.
     try:
-        r_meta = requests.get(api_url, timeout=(10, 30))
-        r_meta.raise_for_status()
-        metadata = r_meta.json()
+        metadata = pxweb_request(table_id, cache_ttl=cache_ttl)
 
         variables = metadata.get('variables', [])
 
@@ -236,38 +430,24 @@ def fetch_udemo(observation_text="Unternehmensneugründungen", years=None, canto
                          }
                      })
 
-        payload = {
-            "query": full_query,
-            "response": {"format": "json"}
-        }
+        # Split the query into chunks that stay under the server's cell limit and run
+        # them concurrently; each chunk is cached separately by pxweb_request.
+        chunks = split_query(full_query, PXWEB_MAX_CELLS)
+        if len(chunks) > 1:
+            logger.info(f"Splitting BFS query into {len(chunks)} chunks")
 
-        # POST request
-        r_data = requests.post(api_url, json=payload, timeout=(10, 30))
-        r_data.raise_for_status()
-
-        result = r_data.json()
-
-        # Parse result into DataFrame
-        # PxWeb JSON response is list of columns and flattened data
-        # "columns": [{"code": "...", "text": "..."}, ...]
-        # "data": [{"key": ["...", ...], "values": ["..."]}, ...]
-
-        col_names = [c['code'] for c in result['columns']] # e.g. Kanton, Rechtsform, Jahr...
-        # Note: 'value' is separate in "values" list
-
-        data_rows = []
-        for item in result['data']:
-            row = item['key'] + item['values']
-            data_rows.append(row)
-
-        final_cols = col_names + ['value']
-
-        df = pd.DataFrame(data_rows, columns=final_cols)
+        def run_chunk(chunk):
+            payload = {
+                "query": chunk,
+                "response": {"format": "json-stat2"}
+            }
+            # POST request (served from the cache when the same query was made recently)
+            return jsonstat2_to_df(pxweb_request(table_id, payload, cache_ttl=cache_ttl))
 
-        # Convert value to numeric
-        df['value'] = pd.to_numeric(df['value'], errors='coerce')
+        with ThreadPoolExecutor(max_workers=min(PXWEB_WORKERS, len(chunks))) as pool:
+            frames = list(pool.map(run_chunk, chunks))
 
-        return df
+        return pd.concat(frames, ignore_index=True)
 
     except Exception as e:
         logger.error(f"BFS Fetch failed: {e}")
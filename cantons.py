@@ -0,0 +1,10 @@
+"""
+Canton codes, kept in a dependency-free module so the Flask serving path can validate
+canton parameters without importing pandas.
+"""
+
+VALID_CANTONS = {
+    "AG", "AI", "AR", "BE", "BL", "BS", "FR", "GE", "GL", "GR",
+    "JU", "LU", "NE", "NW", "OW", "SG", "SH", "SO", "SZ", "TG",
+    "TI", "UR", "VD", "VS", "ZG", "ZH"
+}
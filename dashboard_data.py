@@ -1,52 +1,84 @@
+import numpy as np
 import pandas as pd
 import os
 import json
 import logging
 
+from cantons import VALID_CANTONS
+from subrubrics import DEFAULT_SUBRUBRICS, NET_METRIC, is_hr_subrubric, metric_order
+
 logger = logging.getLogger("dashboard_data")
 
-VALID_CANTONS = {
-    "AG", "AI", "AR", "BE", "BL", "BS", "FR", "GE", "GL", "GR",
-    "JU", "LU", "NE", "NW", "OW", "SG", "SH", "SO", "SZ", "TG",
-    "TI", "UR", "VD", "VS", "ZG", "ZH"
-}
+def dashboard_output_paths(out_dir="static/data"):
+    """The files written by write_dashboard_data."""
+    return [os.path.join(out_dir, "shab_monthly.json"), os.path.join(out_dir, "dimensions.json")]
 
-def export_dashboard_data(df_shab, udemo_df=None, out_dir="static/data"):
+def export_dashboard_data(df_shab, udemo_df=None, out_dir="static/data", all_subrubrics=False):
     """
     Generates dashboard-ready JSON files from the SHAB dataframe.
+
+    Returns:
+        The long-format monthly frame (month, geo, kanton, hr, count) that was exported,
+        or None if there was nothing to export.
     """
     if not os.path.exists(out_dir):
         os.makedirs(out_dir)
 
-    if df_shab.empty:
-        logger.warning("Empty SHAB dataframe provided. Skipping dashboard export.")
-        return
+    final_df = build_dashboard_monthly(df_shab, all_subrubrics=all_subrubrics)
+    if final_df is not None:
+        write_dashboard_data(final_df, out_dir)
+    return final_df
 
-    logger.info("Starting dashboard data export...")
+def _normalize(values, normalize):
+    """
+    Apply a string normalization to the distinct values only: a handful of cantons and
+    subrubrics, but one row per publication.
+    """
+    codes, uniques = pd.factorize(values)
+    normalized = normalize(pd.Index(uniques).astype(str)).to_numpy(dtype=object)
+    result = normalized[codes] if len(normalized) else np.full(len(codes), None, dtype=object)
+    result[codes < 0] = None
+    return result
 
-    # 1. Prepare base dataframe
-    df = df_shab.copy()
+def build_dashboard_monthly(df_shab, all_subrubrics=False):
+    """
+    Aggregates the SHAB dataframe into the long-format monthly frame
+    (month, geo, kanton, hr, count) the dashboard is built from.
 
-    # Ensure date is datetime
-    if not pd.api.types.is_datetime64_any_dtype(df["date"]):
-         df["date"] = pd.to_datetime(df["date"], errors="coerce")
+    Args:
+        df_shab: SHAB rows (date, kanton, subrubric, ...).
+        all_subrubrics: Keep a count per HR subrubric instead of HR01 and HR03 only.
 
-    df = df.dropna(subset=["date"])
+    Returns:
+        The monthly frame, or None if the SHAB dataframe is empty.
+    """
+    if df_shab.empty:
+        logger.warning("Empty SHAB dataframe provided. Skipping dashboard export.")
+        return None
 
-    # Create month column (YYYY-MM-01)
-    df["month"] = df["date"].dt.to_period("M").dt.to_timestamp()
+    logger.info("Aggregating dashboard data...")
 
-    # Normalize Canton
-    # Canton codes in SHAB data might be uppercase or have whitespace.
-    # We also need to handle multi-value cantons if any (though usually one per row in this dataset).
-    df["kanton"] = df["kanton"].astype(str).str.upper().str.strip()
-    df = df[df["kanton"].isin(VALID_CANTONS)]
+    # 1. Prepare base dataframe
+    # Only the three columns the aggregation needs: titles and ids are never copied
+    dates = df_shab["date"]
+    if not pd.api.types.is_datetime64_any_dtype(dates):
+        dates = pd.to_datetime(dates, errors="coerce")
 
-    # Normalize HR type
-    # We are interested in HR01 and HR03.
+    # Canton codes in SHAB data might be lowercase or have whitespace.
+    kanton = _normalize(df_shab["kanton"], lambda v: v.str.upper().str.strip())
     # The column in df_shab is 'subrubric' based on app.py
-    df["hr"] = df["subrubric"].astype(str).str.upper()
-    df = df[df["hr"].isin(["HR01", "HR03"])]
+    hr = _normalize(df_shab["subrubric"], lambda v: v.str.upper())
+
+    hr_codes = pd.Series(hr)
+    subrubrics = [c for c in hr_codes.dropna().unique() if is_hr_subrubric(c)] if all_subrubrics else DEFAULT_SUBRUBRICS
+    keep = dates.notna().to_numpy() & pd.Series(kanton).isin(VALID_CANTONS).to_numpy() & hr_codes.isin(subrubrics).to_numpy()
+
+    df = pd.DataFrame({
+        # Month column (YYYY-MM-01)
+        "month": dates[keep].dt.to_period("M").dt.to_timestamp().to_numpy(),
+        "kanton": kanton[keep],
+        "hr": hr[keep],
+    })
 
     # 2. Aggregations
 
@@ -65,8 +97,9 @@ def export_dashboard_data(df_shab, udemo_df=None, out_dir="static/data"):
     combined = pd.concat([canton_monthly, ch_monthly], ignore_index=True)
 
     # 3. Compute NET (HR01 - HR03)
-    # Pivot to get HR01 and HR03 in columns
-    pivot_df = combined.pivot(index=["month", "geo", "kanton"], columns="hr", values="count").fillna(0)
+    # Pivot to get HR01 and HR03 in columns; the other subrubrics don't enter the NET
+    net_base = combined[combined["hr"].isin(DEFAULT_SUBRUBRICS)]
+    pivot_df = net_base.pivot(index=["month", "geo", "kanton"], columns="hr", values="count").fillna(0)
 
     if "HR01" not in pivot_df.columns:
         pivot_df["HR01"] = 0
@@ -78,7 +111,7 @@ def export_dashboard_data(df_shab, udemo_df=None, out_dir="static/data"):
     # Unpivot back to long format for NET
     net_df = pivot_df.reset_index()[["month", "geo", "kanton", "NET"]]
     net_df = net_df.rename(columns={"NET": "count"})
-    net_df["hr"] = "NET"
+    net_df["hr"] = NET_METRIC
 
     # Final concat
     final_df = pd.concat([combined, net_df], ignore_index=True)
@@ -87,7 +120,16 @@ def export_dashboard_data(df_shab, udemo_df=None, out_dir="static/data"):
     final_df["month"] = final_df["month"].dt.strftime("%Y-%m-%d")
 
     # Sort for tidiness
-    final_df = final_df.sort_values(by=["month", "geo", "kanton", "hr"])
+    final_df = final_df.sort_values(by=["month", "geo", "kanton", "hr"], ignore_index=True)
+
+    return final_df
+
+def write_dashboard_data(final_df, out_dir="static/data"):
+    """
+    Writes shab_monthly.json and dimensions.json from the monthly frame built by build_dashboard_monthly.
+    """
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
 
     # Export to JSON
     out_file = os.path.join(out_dir, "shab_monthly.json")
@@ -96,7 +138,9 @@ def export_dashboard_data(df_shab, udemo_df=None, out_dir="static/data"):
 
     # 5. Export Dimensions (Metadata)
     dimensions = {
-        "metrics": ["HR01", "HR03", "NET"],
+        # HR01, HR03, NET, then the other subrubrics in the all-subrubrics mode
+        "metrics": metric_order(final_df["hr"].unique()),
+        "subrubrics": sorted(set(final_df["hr"].unique()) - {NET_METRIC}),
         "measures": ["count"], # Add per_10k later if needed
         "cantons": sorted(list(VALID_CANTONS)),
         "months": sorted(final_df["month"].unique().tolist())
@@ -4,13 +4,22 @@ import os
 os.environ["PYARROW_IGNORE_TIMEZONE"] = "1"
 
 import json
+import hmac
 import logging
-from flask import Flask, render_template, jsonify, send_from_directory, url_for
-import pandas as pd
-from parquet_utils import safe_read_parquet
+import threading
+import time
+from datetime import datetime
+from flask import Flask, render_template, jsonify, send_from_directory, url_for, request, Response, g
 from logging_setup import configure_logging
+from cantons import VALID_CANTONS
+from plot_service import PlotService, PLOT_FORMATS
+from metrics import LatencyHistogram, render_prometheus
+from search_index import TitleIndex, DEFAULT_LIMIT as SEARCH_DEFAULT_LIMIT, MAX_LIMIT as SEARCH_MAX_LIMIT
+import refresh_jobs
 
-from logging_setup import configure_logging
+# NumPy (shared_dataset), pandas and pyarrow (parquet_utils) are imported on first use, so
+# worker boot and the status/page/data-file endpoints never load them.
+# `python -m benchmarks.bench_startup` checks this.
 
 logger = logging.getLogger(__name__)
 
@@ -18,8 +27,194 @@ app = Flask(__name__)
 
 SHAB_DATA_DIR = './shab_data'
 UDEMO_MERGED_FILE = os.path.join(SHAB_DATA_DIR, 'udemo_merged.parquet')
+LATENCY_METRICS_DIR = os.path.join(SHAB_DATA_DIR, 'metrics')
 STATIC_FOLDER = './static'
 
+SNAPSHOT_POLL_INTERVAL = 5  # seconds
+# Milliseconds after which an EventSource reconnects to /progress?stream=1
+PROGRESS_RETRY_MS = 2000
+# POST /api/refresh requires "Authorization: Bearer <token>" with the token from this
+# environment variable; without it the endpoint is disabled
+REFRESH_TOKEN_ENV = 'SHAB_REFRESH_TOKEN'
+
+plot_service = PlotService()
+title_index = TitleIndex()
+
+
+class DataSnapshot:
+    """
+    A consistent, fully loaded view of the published data for one data_version.
+    Snapshots are immutable once built; a new data_version produces a new snapshot.
+    """
+
+    def __init__(self, data_version, status):
+        self.data_version = data_version
+        self.status = status
+        self.loaded_at = time.time()
+        self._lock = threading.Lock()
+        self._loaded = False
+        self.udemo_records = None
+        self.dataset = None
+
+    def _load_data(self):
+        # Deferred until an endpoint needs the data, so status-only traffic stays light
+        with self._lock:
+            if self._loaded:
+                return
+            # Prefer the shared memory-mapped dataset published by the refresh: every worker
+            # attaches to the same pages instead of holding its own copy.
+            dataset_file = self.status.get("dataset_file")
+            if dataset_file:
+                from shared_dataset import attach_dataset
+                self.dataset = attach_dataset(dataset_file, SHAB_DATA_DIR)
+            if self.dataset is None:
+                self.udemo_records = load_udemo_records()
+            self._loaded = True
+
+    def get_udemo_records(self):
+        self._load_data()
+        # Serialized on demand from the shared mapping, so workers hold no private copy
+        if self.dataset is not None:
+            return self.dataset.udemo_records()
+        return self.udemo_records
+
+
+def load_udemo_records():
+    """Fallback for data published before the shared dataset existed: read the merged parquet."""
+    if not os.path.exists(UDEMO_MERGED_FILE):
+        return None
+    import pandas as pd
+    from parquet_utils import safe_read_parquet
+
+    df = safe_read_parquet(UDEMO_MERGED_FILE)
+    if df is None:
+        return None
+    # Replace NaN with null (None) for JSON compatibility
+    return df.astype(object).where(pd.notnull(df), None).to_dict(orient="records")
+
+
+def load_snapshot(status):
+    """Build the snapshot for the data_version in `status`; its data is loaded on first use."""
+    return DataSnapshot(status.get("data_version"), status)
+
+
+class SnapshotWatcher:
+    """
+    Watches status.json for a new data_version and loads the matching snapshot in a
+    background thread. Snapshots are double-buffered: the new one is built completely
+    off the request path and then swapped in with a single reference assignment, while
+    the previous one stays alive for requests that are still using it.
+
+    A refresh that changed nothing rewrites status.json with the same data_version
+    (last_refresh, metrics): `status` follows every rewrite, the snapshot's data is kept.
+    """
+
+    def __init__(self, status_path, poll_interval=SNAPSHOT_POLL_INTERVAL):
+        self.status_path = status_path
+        self.poll_interval = poll_interval
+        self.current = None
+        self.previous = None
+        self.status = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._status_mtime = None
+
+    def _read_status(self):
+        try:
+            mtime = os.path.getmtime(self.status_path)
+        except OSError:
+            return None, None
+        if mtime == self._status_mtime:
+            return mtime, None
+        try:
+            with open(self.status_path, "r", encoding="utf-8") as f:
+                return mtime, json.load(f)
+        except (OSError, ValueError) as e:
+            # Partially written or unreadable; try again on the next poll
+            logger.warning(f"Could not read {self.status_path}: {e}")
+            return None, None
+
+    def check(self):
+        """Take the latest status.json; load and swap in a new snapshot if it announces a new data_version."""
+        with self._lock:
+            mtime, status = self._read_status()
+            if status is None:
+                return self.current
+
+            current = self.current
+            if current is None or status.get("data_version") != current.data_version:
+                logger.info(f"Loading data snapshot {status.get('data_version')}...")
+                snapshot = load_snapshot(status)
+                if current is not None and current._loaded:
+                    # This worker serves data endpoints: load the new data here, off the request path
+                    snapshot._load_data()
+                self.previous, self.current = current, snapshot
+                logger.info(f"Data snapshot {snapshot.data_version} is live")
+            self.status = status
+            self._status_mtime = mtime
+            return self.current
+
+    def _run(self):
+        while True:
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"Snapshot reload failed: {e}")
+            time.sleep(self.poll_interval)
+
+    def ensure_started(self):
+        # Also restarts the thread in forked WSGI workers, which don't inherit it
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name="snapshot-watcher", daemon=True)
+        self._thread.start()
+
+    def get(self):
+        """Return the live snapshot, loading it synchronously only if none exists yet."""
+        snapshot = self.current
+        if snapshot is None:
+            snapshot = self.check()
+        return snapshot
+
+    def get_status(self):
+        """The latest status.json (which may be newer than the live snapshot's), or None."""
+        if self.get() is None:
+            return None
+        return self.status
+
+
+snapshot_watcher = SnapshotWatcher(os.path.join(app.static_folder, "status.json"))
+
+# Shared by the WSGI workers through one file per process, so every worker serves the sum
+request_latency = LatencyHistogram(directory=LATENCY_METRICS_DIR)
+
+@app.before_request
+def _start_snapshot_watcher():
+    g.request_start = time.perf_counter()
+    snapshot_watcher.ensure_started()
+
+@app.after_request
+def _observe_latency(response):
+    start = g.get("request_start")
+    if start is not None:
+        # Label by route rule, not by URL, to keep the number of series bounded
+        endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        request_latency.observe((endpoint, request.method, str(response.status_code)), time.perf_counter() - start)
+    return response
+
+def _parse_month(value):
+    # Accepts YYYY-MM or YYYY-MM-DD and normalizes to YYYY-MM
+    if not value:
+        return None
+    for fmt in ("%Y-%m", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value, fmt).strftime("%Y-%m")
+        except ValueError:
+            pass
+    raise ValueError(f"Invalid month: {value}")
+
 @app.route("/")
 def home():
     # Check if dashboard data exists
@@ -37,52 +232,166 @@ def home():
 
 @app.get("/api/status")
 def api_status():
-    status_path = os.path.join(app.static_folder, "status.json")
-    if not os.path.exists(status_path):
+    status = snapshot_watcher.get_status()
+    if status is None:
         return jsonify({"state": "missing", "message": "status.json not found. Run refresh_data.py."}), 404
 
-    with open(status_path, "r", encoding="utf-8") as f:
-        return jsonify(json.load(f))
+    return jsonify(status)
 
 @app.route("/api/udemo_vs_shab")
 def udemo_vs_shab():
-    if not os.path.exists(UDEMO_MERGED_FILE):
+    try:
+        snapshot = snapshot_watcher.get()
+    except Exception as e:
+        logger.error(f"Error reading merged data: {e}")
+        return jsonify({"error": str(e)}), 500
+
+    records = snapshot.get_udemo_records() if snapshot is not None else None
+    if records is None:
         return jsonify({"error": "Data not ready"}), 503
-    
+
+    return jsonify(records)
+
+@app.get("/api/search")
+def api_search():
+    query = request.args.get("q", "")
+    kanton = request.args.get("kanton") or None
+
     try:
-        df = safe_read_parquet(UDEMO_MERGED_FILE)
-        if df is None:
-             return jsonify({"error": "Failed to read data"}), 500
+        if kanton:
+            kanton = [kt.strip().upper() for kt in kanton.split(",") if kt.strip()]
+            unknown = [kt for kt in kanton if kt not in VALID_CANTONS]
+            if unknown:
+                raise ValueError(f"Unknown canton: {', '.join(unknown)}")
+        date_from = _parse_month(request.args.get("from"))
+        date_to = _parse_month(request.args.get("to"))
+        try:
+            limit = int(request.args.get("limit", SEARCH_DEFAULT_LIMIT))
+        except ValueError:
+            raise ValueError("limit must be an integer")
+        limit = max(1, min(limit, SEARCH_MAX_LIMIT))
 
-        # Replace NaN with null (None) for JSON compatibility
-        records = df.where(pd.notnull(df), None).to_dict(orient="records")
-        return jsonify(records)
+        result = title_index.search(query, kantone=kanton, date_from=date_from, date_to=date_to, limit=limit)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
-        logger.error(f"Error reading merged data: {e}")
+        logger.error(f"Error searching for {query!r}: {e}")
         return jsonify({"error": str(e)}), 500
 
-@app.route("/progress")
-def progress():
-    # Check if data is ready by verifying plot files exist
+    if result is None:
+        return jsonify({"error": "Search index not built yet. Run refresh_data.py."}), 503
+    return jsonify(result)
+
+@app.route("/plot/<kind>")
+def plot(kind):
+    fmt = request.args.get("fmt", "png")
+    kanton = request.args.get("kanton") or None
+
+    try:
+        date_from = _parse_month(request.args.get("from"))
+        date_to = _parse_month(request.args.get("to"))
+        if kanton:
+            kanton = [kt.strip().upper() for kt in kanton.split(",") if kt.strip()]
+            unknown = [kt for kt in kanton if kt not in VALID_CANTONS]
+            if unknown:
+                raise ValueError(f"Unknown canton: {', '.join(unknown)}")
+            if kind == "line":
+                if len(kanton) != 1:
+                    raise ValueError("The line plot accepts a single canton")
+                kanton = kanton[0]
+
+        snapshot = snapshot_watcher.get()
+        if snapshot is None or snapshot.data_version is None:
+            return jsonify({"error": "Data not ready"}), 503
+
+        image = plot_service.render(kind, kanton, date_from, date_to, fmt, data_version=snapshot.data_version)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error rendering plot {kind}: {e}")
+        return jsonify({"error": str(e)}), 500
+
+    response = Response(image, mimetype=PLOT_FORMATS[fmt])
+    response.headers["Cache-Control"] = "public, max-age=3600"
+    return response
+
+@app.get("/metrics")
+def metrics():
+    # The metrics of the last refresh, also when it left data_version unchanged
+    body = render_prometheus(request_latency, snapshot_watcher.get_status())
+    return Response(body, mimetype="text/plain; version=0.0.4")
+
+@app.post("/api/refresh")
+def api_refresh():
+    token = os.environ.get(REFRESH_TOKEN_ENV)
+    if not token:
+        return jsonify({"error": f"Refresh jobs are disabled. Set {REFRESH_TOKEN_ENV} to enable them."}), 403
+    if not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return jsonify({"error": "Missing or invalid refresh token"}), 401
+    try:
+        start_date = None
+        if request.args.get("range"):
+            try:
+                start_date = datetime.strptime(request.args["range"], "%Y-%m-%d").date()
+            except ValueError:
+                raise ValueError("range must be the first day of the refresh range as YYYY-MM-DD")
+            # run_refresh rejects a start after the end of the refresh range (the previous month)
+            if start_date > refresh_jobs.latest_start_date():
+                raise ValueError(f"range must not start after {refresh_jobs.latest_start_date()}")
+        stream = request.args.get("stream", "").lower() in ("1", "true", "yes")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    job = refresh_jobs.submit_job(start_date=start_date, stream=stream)
+    return jsonify({**job, "progress_url": url_for("progress", job=job["id"])}), 202
+
+def _progress_payload(job):
+    # The data is ready once a refresh has produced the plots
     facet_plot = os.path.join(STATIC_FOLDER, 'FacetGridKanton.png')
     line_plot = os.path.join(STATIC_FOLDER, 'LineGraph.png')
-    
     data_ready = os.path.exists(facet_plot) and os.path.exists(line_plot)
-    
-    if data_ready:
-        return jsonify({
-            'status': 'complete',
-            'message': 'Ready',
-            'current': 1,
-            'total': 1
-        })
-    else:
-        return jsonify({
-            'status': 'missing',
-            'message': 'Run refresh_data.py',
-            'current': 0,
-            'total': 1
-        })
+
+    if job is None:
+        if data_ready:
+            return {'status': 'complete', 'message': 'Ready', 'current': 1, 'total': 1}
+        return {'status': 'missing', 'message': 'Run refresh_data.py', 'current': 0, 'total': 1}
+    status = job['state']
+    if status == 'complete' and not data_ready:
+        status = 'missing'
+    return {
+        'status': status,
+        'message': job['error'] or job['message'],
+        'current': job['current'],
+        'total': job['total'],
+        'job': job['id'],
+        'stages': job['stages'],
+        'stages_done': job['stages_done'],
+        'stages_total': job['stages_total'],
+    }
+
+@app.route("/progress")
+def progress():
+    """
+    Progress of a refresh job (?job=<id>, default: the running or last job). With ?stream=1 the
+    progress is sent as a server-sent event.
+    """
+    job_id = request.args.get("job")
+    if job_id and refresh_jobs.load_job(job_id) is None:
+        return jsonify({"error": f"Unknown job: {job_id}"}), 404
+
+    def current():
+        job = refresh_jobs.load_job(job_id) if job_id else refresh_jobs.current_job()
+        return _progress_payload(job)
+
+    if request.args.get("stream", "").lower() not in ("1", "true", "yes"):
+        return jsonify(current())
+
+    # One event per connection: the stream ends right away and EventSource reconnects after
+    # `retry` ms, so a loading page never holds a server thread for the length of a job
+    body = f"retry: {PROGRESS_RETRY_MS}\ndata: {json.dumps(current())}\n\n"
+    response = Response(body, mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    return response
 
 if __name__ == "__main__":
     configure_logging(level="INFO", log_file="flask.log")
@@ -0,0 +1,245 @@
+"""
+Performance instrumentation for the refresh and the Flask app.
+
+The refresh records counters (HTTP requests, bytes, pages, retries, rows, ...), accumulated
+timers (XML parse, parquet read/write, ...) and the duration of every pipeline stage in the
+process-wide `refresh_metrics`. Its snapshot is written into status.json under `metrics`.
+
+The Flask app keeps a request latency histogram per endpoint and serves it, together with
+the metrics of the last refresh, at /metrics in the Prometheus text format. Under a
+multi-worker WSGI server every worker writes its histogram to a file in a shared directory,
+and /metrics sums the files of all workers, so any worker answers a scrape with the same
+monotonic series.
+
+Standard library only, so the Flask serving path stays light.
+"""
+
+import os
+import sys
+import json
+import glob
+import time
+import threading
+import contextlib
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Request latency histogram buckets (seconds)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Seconds between writes of a worker's histogram file
+LATENCY_FLUSH_INTERVAL = 1.0
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process, or None where it is not available."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return int(peak if sys.platform == "darwin" else peak * 1024)
+
+
+class RefreshMetrics:
+    """Thread-safe counters, timers and stage durations of one refresh run."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.timers = {}
+            self.stages = {}
+            self.started = time.time()
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            self.timers[name] = self.timers.get(name, 0.0) + seconds
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        """Accumulate the duration of the block into timer `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def observe_stage(self, name, mode, seconds):
+        with self._lock:
+            self.stages[name] = {"mode": mode, "seconds": round(seconds, 4)}
+
+    def snapshot(self):
+        """JSON-ready view of the metrics recorded so far."""
+        with self._lock:
+            counters = dict(self.counters)
+            timers = {name: round(seconds, 4) for name, seconds in self.timers.items()}
+            stages = {name: dict(entry) for name, entry in self.stages.items()}
+
+        derived = {}
+        fetch = stages.get("shab_fetch")
+        if fetch and fetch["mode"] == "run" and fetch["seconds"] > 0 and "shab_rows" in counters:
+            derived["shab_rows_per_second"] = round(counters["shab_rows"] / fetch["seconds"], 1)
+        return {
+            "stages": stages,
+            "counters": counters,
+            "timers": timers,
+            "derived": derived,
+            "peak_rss_bytes": peak_rss_bytes(),
+            "elapsed_seconds": round(time.time() - self.started, 3),
+        }
+
+
+refresh_metrics = RefreshMetrics()
+
+
+class LatencyHistogram:
+    """
+    Cumulative request latency histogram per (endpoint, method, status).
+
+    With `directory`, the histogram is shared by the processes of a WSGI server: each process
+    writes its series to <directory>/latency-<pid>.json (at most every LATENCY_FLUSH_INTERVAL
+    seconds) and items() adds the files of the other processes to its own series. The files of
+    exited workers are kept, so the sums never decrease; delete the directory to start over.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS, directory=None):
+        self.buckets = tuple(buckets)
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._series = {}
+        self._flushed = 0.0
+
+    def observe(self, labels, seconds):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series["counts"][i] += 1
+            series["sum"] += seconds
+            series["count"] += 1
+        if self.directory and time.monotonic() - self._flushed >= LATENCY_FLUSH_INTERVAL:
+            self.flush()
+
+    def _own_items(self):
+        with self._lock:
+            return [(labels, {"counts": list(s["counts"]), "sum": s["sum"], "count": s["count"]})
+                    for labels, s in sorted(self._series.items())]
+
+    def _path(self, pid):
+        return os.path.join(self.directory, f"latency-{pid}.json")
+
+    def flush(self):
+        """Write this process's series to its file in `directory` (best effort)."""
+        if not self.directory:
+            return
+        with self._flush_lock:
+            self._flushed = time.monotonic()
+            body = {"buckets": list(self.buckets), "series": [[list(labels), s] for labels, s in self._own_items()]}
+            path = self._path(os.getpid())
+            tmp = f"{path}.tmp"
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(body, f)
+                os.replace(tmp, path)
+            except OSError:
+                pass
+
+    def _other_items(self):
+        own = self._path(os.getpid())
+        for path in glob.glob(os.path.join(self.directory, "latency-*.json")):
+            if path == own:
+                continue
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    body = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if tuple(body.get("buckets", ())) != self.buckets:
+                continue
+            for labels, series in body["series"]:
+                yield tuple(labels), series
+
+    def items(self):
+        """The series of this process, plus those of the other processes when `directory` is set."""
+        if not self.directory:
+            return self._own_items()
+        totals = dict(self._own_items())
+        for labels, series in self._other_items():
+            total = totals.get(labels)
+            if total is None:
+                totals[labels] = {"counts": list(series["counts"]), "sum": series["sum"], "count": series["count"]}
+                continue
+            total["counts"] = [a + b for a, b in zip(total["counts"], series["counts"])]
+            total["sum"] += series["sum"]
+            total["count"] += series["count"]
+        return sorted(totals.items())
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(**labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _sanitize(name):
+    return "".join(c if c.isalnum() or c == "_" else "_" for c in name)
+
+
+def render_prometheus(histogram, status=None):
+    """
+    Render the request latency histogram and the refresh metrics of `status` (the parsed
+    status.json) in the Prometheus text exposition format.
+    """
+    lines = [
+        "# HELP shab_http_request_duration_seconds Flask request latency.",
+        "# TYPE shab_http_request_duration_seconds histogram",
+    ]
+    for (endpoint, method, code), series in histogram.items():
+        for bound, count in zip(histogram.buckets, series["counts"]):
+            lines.append(f"shab_http_request_duration_seconds_bucket"
+                         f"{_labels(endpoint=endpoint, method=method, status=code, le=bound)} {count}")
+        lines.append(f"shab_http_request_duration_seconds_bucket"
+                     f"{_labels(endpoint=endpoint, method=method, status=code, le='+Inf')} {series['count']}")
+        lines.append(f"shab_http_request_duration_seconds_sum{_labels(endpoint=endpoint, method=method, status=code)} {series['sum']}")
+        lines.append(f"shab_http_request_duration_seconds_count{_labels(endpoint=endpoint, method=method, status=code)} {series['count']}")
+
+    status = status or {}
+    if "data_version" in status:
+        lines += ["# TYPE shab_data_version gauge", f"shab_data_version {status['data_version']}"]
+    if "records" in status:
+        lines += ["# TYPE shab_refresh_records gauge", f"shab_refresh_records {status['records']}"]
+
+    metrics = status.get("metrics") or {}
+    stages = metrics.get("stages") or {}
+    if stages:
+        lines += ["# HELP shab_refresh_stage_seconds Duration of each stage of the last refresh.",
+                  "# TYPE shab_refresh_stage_seconds gauge"]
+        for name, entry in sorted(stages.items()):
+            lines.append(f"shab_refresh_stage_seconds{_labels(stage=name, mode=entry.get('mode', 'run'))} {entry.get('seconds', 0)}")
+    for group, suffix in (("counters", ""), ("timers", "_seconds"), ("derived", "")):
+        for name, value in sorted((metrics.get(group) or {}).items()):
+            metric = f"shab_refresh_{_sanitize(name)}"
+            if suffix and not metric.endswith(suffix):
+                metric += suffix
+            lines += [f"# TYPE {metric} gauge", f"{metric} {value}"]
+    for name in ("peak_rss_bytes", "elapsed_seconds"):
+        if metrics.get(name) is not None:
+            lines += [f"# TYPE shab_refresh_{name} gauge", f"shab_refresh_{name} {metrics[name]}"]
+    return "\n".join(lines) + "\n"
@@ -17,6 +17,8 @@ import contextlib
 import time
 import sys
 
+from metrics import refresh_metrics
+
 # Import platform-specific file locking modules
 if sys.platform == 'win32':
     import msvcrt
@@ -74,10 +76,12 @@ def safe_read_parquet(filepath):
     """
     if not os.path.isfile(filepath):
         return None
-    
+
+    refresh_metrics.inc("parquet_reads")
     try:
         handle_extension_type_registration()
-        return pd.read_parquet(filepath)
+        with refresh_metrics.timer("parquet_read_seconds"):
+            return pd.read_parquet(filepath)
     except (pa.ArrowKeyError, Exception) as e:
         if "already defined" in str(e):
             logger.warning(f"Extension type already registered, attempting fallback read for {filepath}")
@@ -110,6 +114,7 @@ def safe_write_parquet_atomic(df, filepath):
     fd, temp_path = tempfile.mkstemp(dir=directory, prefix="tmp_shab_", suffix=".parquet")
     os.close(fd)
 
+    write_start = time.perf_counter()
     try:
         handle_extension_type_registration()
         df.to_parquet(temp_path)
@@ -129,6 +134,10 @@ def safe_write_parquet_atomic(df, filepath):
             os.remove(temp_path)
             raise e
 
+    refresh_metrics.add_time("parquet_write_seconds", time.perf_counter() - write_start)
+    refresh_metrics.inc("parquet_writes")
+    refresh_metrics.inc("parquet_bytes_written", os.path.getsize(temp_path))
+
     # Atomic move
     try:
         os.replace(temp_path, filepath)
@@ -0,0 +1,167 @@
+"""
+A small stage graph for the refresh pipeline.
+
+Each stage declares the context keys it reads (inputs) and writes (outputs). The runner
+starts every stage as soon as its inputs are available, so independent stages run
+concurrently on a thread pool.
+
+A run can be restricted to some stages (only / from_stage). Inputs of the selected stages
+that are produced by stages outside the selection are then restored from disk with the
+producer's `restore` function instead of being recomputed.
+"""
+
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from metrics import refresh_metrics
+
+logger = logging.getLogger(__name__)
+
+
+class Stage:
+    """
+    A pipeline stage.
+
+    Args:
+        name: Unique stage name (used by --only / --from-stage).
+        func: Callable taking the context dict and returning a dict with the outputs.
+        inputs: Context keys the stage reads.
+        outputs: Context keys the stage returns.
+        restore: Optional callable with the same signature as func that loads the outputs
+            from the last run (from disk) without redoing the work.
+    """
+
+    def __init__(self, name, func, inputs=(), outputs=(), restore=None):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.restore = restore
+
+    def __repr__(self):
+        return f"Stage({self.name!r})"
+
+
+class Pipeline:
+    def __init__(self, stages, max_workers=4):
+        self.stages = {stage.name: stage for stage in stages}
+        self.max_workers = max_workers
+        self.producers = {}
+        for stage in stages:
+            for key in stage.outputs:
+                if key in self.producers:
+                    raise ValueError(f"{key!r} is produced by both {self.producers[key].name} and {stage.name}")
+                self.producers[key] = stage
+
+    def downstream(self, name):
+        """`name` and every stage that (transitively) depends on its outputs, in declaration order."""
+        selected = {name}
+        changed = True
+        while changed:
+            changed = False
+            for stage in self.stages.values():
+                if stage.name in selected:
+                    continue
+                if any(self.producers.get(key) is not None and self.producers[key].name in selected for key in stage.inputs):
+                    selected.add(stage.name)
+                    changed = True
+        return [s for s in self.stages if s in selected]
+
+    def select(self, only=None, from_stage=None):
+        """Names of the stages to run for the given --only / --from-stage options."""
+        for name in list(only or []) + ([from_stage] if from_stage else []):
+            if name not in self.stages:
+                raise ValueError(f"Unknown stage {name!r} (stages: {', '.join(self.stages)})")
+        if only:
+            return [s for s in self.stages if s in set(only)]
+        if from_stage:
+            return self.downstream(from_stage)
+        return list(self.stages)
+
+    def plan(self, selected, context):
+        """Map every stage that has to execute to 'run' or 'restore'."""
+        plan = {name: "run" for name in selected}
+        pending = list(selected)
+        while pending:
+            stage = self.stages[pending.pop()]
+            for key in stage.inputs:
+                if key in context:
+                    continue
+                producer = self.producers.get(key)
+                if producer is None:
+                    raise ValueError(f"Stage {stage.name} needs {key!r}, which no stage produces")
+                if producer.name in plan:
+                    continue
+                plan[producer.name] = "restore" if producer.restore is not None else "run"
+                pending.append(producer.name)
+        return plan
+
+    def run(self, context, only=None, from_stage=None, profiler=None, on_stage=None):
+        """
+        Execute the pipeline, updating `context` in place with the stage outputs.
+
+        With a profiler (see profiling.StageProfiler) every stage runs inside
+        profiler.stage(name), one stage at a time. on_stage, if given, is called as
+        on_stage(name, event, done, total) with event "started", "finished" or "failed".
+
+        Returns:
+            Dict of stage name -> seconds for every stage that ran or was restored.
+        """
+        plan = self.plan(self.select(only, from_stage), context)
+        deps = {
+            name: {self.producers[key].name for key in self.stages[name].inputs
+                   if key not in context and self.producers[key].name in plan}
+            for name in plan
+        }
+        logger.info("Pipeline plan: " + ", ".join(f"{name} ({mode})" for name, mode in plan.items()))
+
+        timings = {}
+        done = set()
+        running = {}
+
+        def execute(name):
+            stage = self.stages[name]
+            func = stage.func if plan[name] == "run" else stage.restore
+            start = time.perf_counter()
+            if profiler is None:
+                outputs = func(context) or {}
+            else:
+                with profiler.stage(name):
+                    outputs = func(context) or {}
+            missing = set(stage.outputs) - set(outputs)
+            if missing:
+                raise RuntimeError(f"Stage {name} did not produce {sorted(missing)}")
+            return outputs, time.perf_counter() - start
+
+        max_workers = self.max_workers if profiler is None else 1
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="stage") as pool:
+            while len(done) < len(plan):
+                for name in plan:
+                    if name not in done and name not in running.values() and deps[name] <= done:
+                        logger.info(f"Stage {name}: {plan[name]} started")
+                        if on_stage is not None:
+                            on_stage(name, "started", len(done), len(plan))
+                        running[pool.submit(execute, name)] = name
+
+                finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        outputs, seconds = future.result()
+                    except Exception:
+                        logger.error(f"Stage {name} failed")
+                        for other in running:
+                            other.cancel()
+                        if on_stage is not None:
+                            on_stage(name, "failed", len(done), len(plan))
+                        raise
+                    context.update(outputs)
+                    timings[name] = seconds
+                    refresh_metrics.observe_stage(name, plan[name], seconds)
+                    done.add(name)
+                    logger.info(f"Stage {name}: {plan[name]} finished in {seconds:.2f}s")
+                    if on_stage is not None:
+                        on_stage(name, "finished", len(done), len(plan))
+
+        return timings
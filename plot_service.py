@@ -0,0 +1,203 @@
+"""
+On-demand plot rendering for the Flask app.
+Views are rendered in a worker process pool (so matplotlib never runs on a request thread)
+and cached in a size-bounded LRU cache in memory and on disk, keyed by the view parameters
+and the data_version of the dataset they were rendered from.
+"""
+
+import os
+import hashlib
+import logging
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+SHAB_DATA_DIR = './shab_data'
+PLOT_CACHE_DIR = os.path.join(SHAB_DATA_DIR, 'plot_cache')
+
+# Keep in sync with plots.PLOT_KINDS / plots.PLOT_FORMATS (not imported here to keep
+# matplotlib out of the Flask process).
+PLOT_KINDS = ("line", "facet")
+PLOT_FORMATS = {"png": "image/png", "svg": "image/svg+xml"}
+
+RENDER_TIMEOUT = 60
+
+
+def cache_key(kind, kanton, date_from, date_to, fmt, data_version):
+    """Build a stable cache key for a plot view."""
+    if isinstance(kanton, (list, tuple)):
+        kanton = ",".join(sorted(kanton))
+    raw = "|".join(str(p or "") for p in (kind, kanton, date_from, date_to, fmt, data_version))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _render_in_worker(kind, kanton, date_from, date_to, fmt):
+    # Imported in the worker process so the Flask process never imports matplotlib
+    from plots import render_view
+    return render_view(kind, kanton, date_from, date_to, fmt)
+
+
+class PlotCache:
+    """
+    Two-level LRU cache for rendered plots.
+    The memory level holds the most recently used entries up to `memory_bytes`;
+    the disk level holds up to `disk_bytes` in `cache_dir` and is evicted by last access time.
+    """
+
+    def __init__(self, cache_dir=PLOT_CACHE_DIR, memory_bytes=32 * 1024 * 1024, disk_bytes=256 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._lock = threading.Lock()
+
+        if self.cache_dir and not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.bin")
+
+    def get(self, key):
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                return data
+
+        if not self.cache_dir:
+            return None
+
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            # Touch so the disk level evicts in LRU order
+            os.utime(path, None)
+        except OSError:
+            return None
+
+        self._put_memory(key, data)
+        return data
+
+    def put(self, key, data):
+        self._put_memory(key, data)
+        if self.cache_dir:
+            self._put_disk(key, data)
+
+    def _put_memory(self, key, data):
+        if len(data) > self.memory_bytes:
+            return
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self._memory_size -= len(old)
+            self._memory[key] = data
+            self._memory_size += len(data)
+            while self._memory_size > self.memory_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_size -= len(evicted)
+
+    def _put_disk(self, key, data):
+        path = self._disk_path(key)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write plot cache entry {key}: {e}")
+            return
+        self._evict_disk()
+
+    def _evict_disk(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".bin"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+
+        if total <= self.disk_bytes:
+            return
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.disk_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+
+class PlotService:
+    """
+    Renders plot views in a process pool and serves repeated views from a PlotCache.
+    Concurrent requests for the same view share a single render.
+    """
+
+    def __init__(self, max_workers=2, cache=None):
+        self.max_workers = max_workers
+        self.cache = cache if cache is not None else PlotCache()
+        self._executor = None
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # Created lazily so importing the Flask app doesn't spawn processes.
+        # 'spawn' avoids forking a multi-threaded server process.
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    def render(self, kind, kanton=None, date_from=None, date_to=None, fmt="png", data_version=None):
+        """
+        Return the rendered view as bytes, rendering it in the pool on a cache miss.
+
+        Raises:
+            ValueError: If kind or fmt is not supported.
+        """
+        if kind not in PLOT_KINDS:
+            raise ValueError(f"Unknown plot kind: {kind}")
+        if fmt not in PLOT_FORMATS:
+            raise ValueError(f"Unknown plot format: {fmt}")
+
+        key = cache_key(kind, kanton, date_from, date_to, fmt, data_version)
+        data = self.cache.get(key)
+        if data is not None:
+            return data
+
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._get_executor().submit(_render_in_worker, kind, kanton, date_from, date_to, fmt)
+                self._inflight[key] = future
+
+        try:
+            data = future.result(timeout=RENDER_TIMEOUT)
+            self.cache.put(key, data)
+        finally:
+            with self._lock:
+                if self._inflight.get(key) is future:
+                    del self._inflight[key]
+
+        return data
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -3,87 +3,405 @@ import matplotlib
 # Use Agg backend for non-interactive plotting
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
-import seaborn as sns
+import matplotlib.dates as mdates
+from matplotlib.lines import Line2D
+import numpy as np
 import pandas as pd
 import logging
 import os
+import io
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from artifacts import content_hash
 
 logger = logging.getLogger(__name__)
 
-def generate_plots(df, start_date, end_date, output_dir='./static'):
+SUBRUBRICS = ["HR01", "HR03"]
+# Same colors seaborn used for the two hue levels
+SUBRUBRIC_COLORS = {"HR01": "#1f77b4", "HR03": "#ff7f0e"}
+
+PLOT_WORKERS = 2
+
+
+def _process_pool(max_workers):
+    # 'spawn' as in plot_service: the refresh renders from a pipeline stage thread (and the
+    # daemon also runs its control server thread); forking a multi-threaded process can
+    # deadlock on locks held by other threads (logging, matplotlib)
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+class PlotData:
     """
-    Generate all plots for the dashboard.
+    Monthly counts per subrubric as dense NumPy arrays on a shared date axis.
+
+    Attributes:
+        months: datetime64[D] array with the first day of every month in the range.
+        x: The same months as matplotlib date numbers (computed once, shared by all axes).
+        cantons: Canton codes, aligned to the second axis of `counts`.
+        counts: int64 array of shape (len(SUBRUBRICS), len(cantons), len(months)).
+        totals: int64 array of shape (len(SUBRUBRICS), len(months)).
+    """
+
+    def __init__(self, months, cantons, counts, totals=None):
+        self.months = np.asarray(months, dtype='datetime64[D]')
+        self.x = mdates.date2num(self.months) if len(self.months) else np.zeros(0)
+        self.cantons = list(cantons)
+        self.counts = counts
+        self.totals = counts.sum(axis=1) if totals is None else totals
+
+    def window(self, date_from=None, date_to=None):
+        """Return the months between date_from and date_to ('YYYY-MM', inclusive)."""
+        mask = np.ones(len(self.months), dtype=bool)
+        if date_from:
+            mask &= self.months >= np.datetime64(date_from, 'D')
+        if date_to:
+            mask &= self.months <= np.datetime64(date_to, 'D')
+        return PlotData(self.months[mask], self.cantons, self.counts[:, :, mask], self.totals[:, mask])
+
+    def kanton_counts(self, kanton):
+        """Counts of one canton, shape (len(SUBRUBRICS), len(months)); zeros if it has no rows in the range."""
+        if kanton not in self.cantons:
+            return np.zeros((self.counts.shape[0], len(self.months)), dtype=self.counts.dtype)
+        return self.counts[:, self.cantons.index(kanton)]
+
+    @property
+    def period(self):
+        if not len(self.months):
+            return ""
+        return f"{self.months[0].astype('datetime64[M]')} - {self.months[-1].astype('datetime64[M]')}"
+
+
+def build_plot_data(df):
+    """Aggregate raw SHAB rows into a PlotData (one vectorized pass, no groupby)."""
+    dates = pd.to_datetime(df['date'])
+    month_codes = (dates.dt.year.to_numpy() - 1970) * 12 + dates.dt.month.to_numpy() - 1
+    first, last = month_codes.min(), month_codes.max()
+    months = np.arange(first, last + 1).astype('datetime64[M]')
+
+    kt_codes, cantons = pd.factorize(df['kanton'], sort=True)
+    hr_codes = pd.Categorical(df['subrubric'], categories=SUBRUBRICS).codes
+    valid = (kt_codes >= 0) & (hr_codes >= 0)
+
+    shape = (len(SUBRUBRICS), len(cantons), len(months))
+    flat = (hr_codes[valid].astype(np.int64) * shape[1] + kt_codes[valid]) * shape[2] + (month_codes[valid] - first)
+    counts = np.bincount(flat, minlength=int(np.prod(shape))).reshape(shape)
+    return PlotData(months, cantons, counts)
+
+
+def plot_data_from_monthly(monthly):
+    """Build a PlotData from the long-format dashboard dataset (month, geo, kanton, hr, count)."""
+    monthly = monthly[monthly['hr'].isin(SUBRUBRICS)]
+    months = pd.to_datetime(monthly['month']).to_numpy().astype('datetime64[M]')
+    all_months = np.unique(months)
+    m_idx = np.searchsorted(all_months, months)
+    hr_idx = pd.Categorical(monthly['hr'], categories=SUBRUBRICS).codes
+    values = monthly['count'].to_numpy(dtype=np.int64)
+
+    is_ch = (monthly['geo'] == "CH").to_numpy()
+    totals = np.zeros((len(SUBRUBRICS), len(all_months)), dtype=np.int64)
+    totals[hr_idx[is_ch], m_idx[is_ch]] = values[is_ch]
+
+    kt_codes, cantons = pd.factorize(monthly['kanton'][~is_ch], sort=True)
+    counts = np.zeros((len(SUBRUBRICS), len(cantons), len(all_months)), dtype=np.int64)
+    counts[hr_idx[~is_ch], kt_codes, m_idx[~is_ch]] = values[~is_ch]
+    return PlotData(all_months, cantons, counts, totals)
+
+
+def _draw_lines(ax, x, series):
+    # Plain Line2D artists on a precomputed date axis: no per-call data munging
+    for hr, values in zip(SUBRUBRICS, series):
+        ax.add_line(Line2D(x, values, color=SUBRUBRIC_COLORS[hr], label=hr))
+    ax.xaxis_date()
+    ax.autoscale_view()
+
+
+def line_figure(data, kanton=None, title=None):
+    """Figure with the HR01/HR03 time series for CH (default) or one canton."""
+    series = data.kanton_counts(kanton) if kanton else data.totals
+    fig, ax = plt.subplots(figsize=(20, 6))
+    _draw_lines(ax, data.x, series)
+    ax.set_title(title or f"SHAB Meldungen {kanton or 'CH'} {data.period}")
+    ax.set_ylabel("Meldungen")
+    ax.grid(True, alpha=0.3)
+    ax.legend(title="subrubric")
+    fig.autofmt_xdate(rotation=45)
+    return fig
+
+
+def facet_figure(data, cantons=None, xlabel=None):
+    """Figure with one small panel per canton, 5 per row, sharing the date axis."""
+    cantons = sorted(cantons) if cantons else data.cantons
+    ncols = min(5, max(len(cantons), 1))
+    nrows = max(1, -(-len(cantons) // ncols))
+
+    fig, axes = plt.subplots(nrows, ncols, figsize=(3 * ncols, 3 * nrows), sharex=True, squeeze=False)
+    for ax in axes.flat[len(cantons):]:
+        ax.set_visible(False)
+    for ax, kt in zip(axes.flat, cantons):
+        _draw_lines(ax, data.x, data.kanton_counts(kt))
+        ax.set_title(f"kanton = {kt}")
+        ax.tick_params(axis='x', labelbottom=False)
+
+    # The x labels are hidden, so a fixed yearly grid replaces the (slow) auto date
+    # locator; it is shared by all panels through sharex.
+    axes.flat[0].xaxis.set_major_locator(mdates.YearLocator())
+
+    handles = [Line2D([], [], color=SUBRUBRIC_COLORS[hr], label=hr) for hr in SUBRUBRICS]
+    fig.legend(handles=handles, loc='center right', title="subrubric")
+    fig.supxlabel(xlabel or data.period)
+    fig.supylabel("Meldungen")
+    # Fixed margins instead of tight_layout: measuring every panel's extent costs more than drawing it
+    fig.subplots_adjust(left=0.06, right=0.9, bottom=0.06, top=0.95, wspace=0.3, hspace=0.3)
+    return fig
+
+
+def _save_figure(fig, target, fmt='png', tight=True):
+    fig.savefig(target, format=fmt, bbox_inches='tight' if tight else None)
+    plt.close(fig)
+
+
+def _render_to_file(kind, data, output_path, start_date, end_date):
+    # Runs in a worker process; each figure is independent of the others
+    if kind == "facet":
+        fig = facet_figure(data, xlabel=f"{start_date} - {end_date}")
+        _save_figure(fig, output_path, tight=False)
+    else:
+        fig = line_figure(data, title=f"SHAB Meldungen {start_date} - {end_date}")
+        _save_figure(fig, output_path)
+    return output_path
+
+
+KANTON_PLOT_DIR = 'kantone'
+KANTON_MANIFEST = 'manifest.json'
+# Size of one canton image in inches (at 100 dpi)
+KANTON_FIGSIZE = (4, 2.5)
+
+
+def canton_figure(months_x, series, kanton):
+    """Small, self-contained figure for one canton with readable year labels."""
+    fig, ax = plt.subplots(figsize=KANTON_FIGSIZE, dpi=100)
+    _draw_lines(ax, months_x, series)
+    ax.xaxis.set_major_locator(mdates.YearLocator())
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y'))
+    ax.set_title(kanton)
+    ax.grid(True, alpha=0.3)
+    ax.legend(fontsize='x-small', loc='upper left')
+    fig.subplots_adjust(left=0.14, right=0.97, bottom=0.12, top=0.88)
+    return fig
+
+
+def canton_manifest_path(output_dir='./static'):
+    return os.path.join(output_dir, KANTON_PLOT_DIR, KANTON_MANIFEST)
+
+
+def _render_canton_files(kanton, months_x, series, kanton_dir):
+    # Runs in a worker process; writes <KT>.png and <KT>.svg atomically
+    fig = canton_figure(months_x, series, kanton)
+    for fmt in ("png", "svg"):
+        path = os.path.join(kanton_dir, f"{kanton}.{fmt}")
+        temp_path = f"{path}.tmp"
+        fig.savefig(temp_path, format=fmt)
+        os.replace(temp_path, path)
+    plt.close(fig)
+    return kanton
+
+
+def render_canton_plots(data, output_dir='./static', cantons=None, max_workers=PLOT_WORKERS):
+    """
+    Render one small PNG and SVG per canton into <output_dir>/kantone/ and update manifest.json.
+
+    Each canton is tagged with a hash of its series, so only cantons whose data changed
+    (or whose files are missing) are re-rendered; the others are left untouched.
 
     Args:
-        df: DataFrame containing the SHAB data.
+        data: PlotData built with build_plot_data.
+        output_dir: Static directory.
+        cantons: Cantons to consider (default: all in `data`).
+        max_workers: Size of the rendering process pool (1 renders in-process).
+
+    Returns:
+        The list of cantons that were rendered.
+    """
+    kanton_dir = os.path.join(output_dir, KANTON_PLOT_DIR)
+    if not os.path.exists(kanton_dir):
+        os.makedirs(kanton_dir)
+
+    manifest_path = canton_manifest_path(output_dir)
+    manifest = {"cantons": {}}
+    if os.path.isfile(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+
+    jobs = {}
+    for kt in (cantons or data.cantons):
+        series = data.kanton_counts(kt)
+        series_hash = content_hash(data.months, series)[:16]
+        entry = manifest["cantons"].get(kt, {})
+        files_exist = all(os.path.exists(os.path.join(kanton_dir, f"{kt}.{fmt}")) for fmt in ("png", "svg"))
+        if entry.get("hash") == series_hash and files_exist:
+            continue
+        jobs[kt] = (series, series_hash)
+
+    max_workers = min(max_workers, os.cpu_count() or 1, max(len(jobs), 1))
+    rendered = []
+    if max_workers <= 1:
+        for kt, (series, _) in jobs.items():
+            try:
+                rendered.append(_render_canton_files(kt, data.x, series, kanton_dir))
+            except Exception as e:
+                logger.error(f"Failed to generate canton plot {kt}: {e}")
+    else:
+        with _process_pool(max_workers) as pool:
+            futures = {pool.submit(_render_canton_files, kt, data.x, series, kanton_dir): kt for kt, (series, _) in jobs.items()}
+            for future in as_completed(futures):
+                try:
+                    rendered.append(future.result())
+                except Exception as e:
+                    logger.error(f"Failed to generate canton plot {futures[future]}: {e}")
+
+    for kt in rendered:
+        manifest["cantons"][kt] = {
+            "png": f"{KANTON_PLOT_DIR}/{kt}.png",
+            "svg": f"{KANTON_PLOT_DIR}/{kt}.svg",
+            "hash": jobs[kt][1],
+        }
+    manifest["width"], manifest["height"] = (int(v * 100) for v in KANTON_FIGSIZE)
+    manifest["period"] = data.period
+
+    temp_path = f"{manifest_path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(temp_path, manifest_path)
+
+    logger.info(f"Rendered {len(rendered)} of {len(data.cantons)} canton plots into {kanton_dir}")
+    return sorted(rendered)
+
+
+def plot_output_paths(output_dir='./static'):
+    """The files written by render_plots, by figure name."""
+    return {
+        "FacetGridKanton": os.path.join(output_dir, "FacetGridKanton.png"),
+        "LineGraph": os.path.join(output_dir, "LineGraph.png"),
+    }
+
+
+def render_plots(data, start_date, end_date, output_dir='./static', max_workers=PLOT_WORKERS):
+    """
+    Render the dashboard figures from a PlotData.
+    The independent figures are rendered concurrently in a process pool.
+
+    Args:
+        data: PlotData built with build_plot_data.
         start_date: Start date of the range (date object)
         end_date: End date of the range (date object)
         output_dir: Directory to save plots.
+        max_workers: Size of the rendering process pool (1 renders in-process).
     """
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
+    max_workers = min(max_workers, os.cpu_count() or 1)
+    kinds = {"FacetGridKanton": "facet", "LineGraph": "line"}
+    jobs = {name: (kinds[name], path) for name, path in plot_output_paths(output_dir).items()}
+
+    if max_workers <= 1:
+        for name, (kind, path) in jobs.items():
+            try:
+                _render_to_file(kind, data, path, start_date, end_date)
+                logger.info(f"Saved {path}")
+            except Exception as e:
+                logger.error(f"Failed to generate {name}: {e}")
+        return
+
+    with _process_pool(min(max_workers, len(jobs))) as pool:
+        futures = {
+            pool.submit(_render_to_file, kind, data, path, start_date, end_date): name
+            for name, (kind, path) in jobs.items()
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                logger.info(f"Saved {future.result()}")
+            except Exception as e:
+                logger.error(f"Failed to generate {name}: {e}")
+
+
+def generate_plots(df, start_date, end_date, output_dir='./static', max_workers=PLOT_WORKERS):
+    """
+    Generate all plots for the dashboard.
+
+    The data is aggregated once into NumPy arrays; the figures are then drawn by render_plots
+    and render_canton_plots.
+
+    Args:
+        df: DataFrame containing the SHAB data.
+        start_date: Start date of the range (date object)
+        end_date: End date of the range (date object)
+        output_dir: Directory to save plots.
+        max_workers: Size of the rendering process pool (1 renders in-process).
+    """
     logger.info("Generating plots...")
 
     if df.empty:
         logger.warning("DataFrame is empty. Skipping plot generation.")
         return
 
-    # Pre-process data for plotting
-    df['date'] = pd.to_datetime(df['date'])
-    df['month'] = df['date'].dt.to_period('M') # Use period for sorting
-
-    # 1. FacetGrid per Kanton
-    try:
-        grouped_multiple = df.groupby(['month', 'subrubric', 'kanton']).agg({'subrubric': ['count']})
-        grouped_multiple.columns = ['count']
-        grouped_multiple = grouped_multiple.reset_index()
-
-        # Convert month back to string for plotting but ensure order?
-        # Seaborn might plot strings in order of appearance or alphabetical.
-        # Better to convert to timestamp for x-axis or sort explicitly.
-        grouped_multiple['month_str'] = grouped_multiple['month'].dt.strftime('%Y-%m')
-        grouped_multiple = grouped_multiple.sort_values('month')
-
-        logger.info("Generating FacetGridKanton...")
-        # Sort data to ensure months are in order
-        grouped_multiple.sort_values(by=['kanton', 'month'], inplace=True)
-
-        g = sns.FacetGrid(grouped_multiple, col="kanton", col_wrap=5, hue="subrubric", sharey=False)
-        g.map(sns.lineplot, "month_str", "count")
-        g.add_legend()
-        g.set_axis_labels(f"{start_date} - {end_date}", "Meldungen")
-        g.set(xticklabels=[]) # Hide x labels to avoid clutter
-
-        output_path = os.path.join(output_dir, "FacetGridKanton.png")
-        g.savefig(output_path)
-        plt.close()
-        logger.info(f"Saved {output_path}")
-
-    except Exception as e:
-        logger.error(f"Failed to generate FacetGridKanton: {e}")
-
-    # 2. LineGraph (Total without Kantons)
-    try:
-        grouped_no_kanton = df.groupby(['month', 'subrubric']).agg({'subrubric': ['count']})
-        grouped_no_kanton.columns = ['count']
-        grouped_no_kanton = grouped_no_kanton.reset_index()
-        grouped_no_kanton['month_str'] = grouped_no_kanton['month'].dt.strftime('%Y-%m')
-        grouped_no_kanton = grouped_no_kanton.sort_values('month')
-
-        logger.info("Generating LineGraph...")
-        plt.figure(figsize=(20, 6))
-        sns.set_style(style='darkgrid')
-
-        # Explicitly pass ax to avoid variable shadowing issues if we used subplots
-        ax = sns.lineplot(data=grouped_no_kanton, x="month_str", y='count', hue='subrubric')
-        plt.xticks(rotation=45)
-        plt.title(f"SHAB Meldungen {start_date} - {end_date}")
-
-        output_path = os.path.join(output_dir, "LineGraph.png")
-        plt.savefig(output_path, bbox_inches='tight')
-        plt.close()
-        logger.info(f"Saved {output_path}")
-
-    except Exception as e:
-        logger.error(f"Failed to generate LineGraph: {e}")
+    data = build_plot_data(df)
+    render_plots(data, start_date, end_date, output_dir, max_workers)
+    render_canton_plots(data, output_dir, max_workers=max_workers)
+
+# On-demand views (rendered by plot_service in worker processes)
+
+PLOT_KINDS = ("line", "facet")
+PLOT_FORMATS = ("png", "svg")
+DASHBOARD_MONTHLY_FILE = os.path.join('./static', 'data', 'shab_monthly.json')
+
+# Per-process cache of the monthly dataset: path -> (mtime, PlotData)
+_monthly_cache = {}
+
+def load_monthly(data_file=DASHBOARD_MONTHLY_FILE):
+    """
+    Load the dashboard monthly dataset (shab_monthly.json) as a PlotData.
+    The result is cached per process and reloaded when the file changes.
+    """
+    mtime = os.path.getmtime(data_file)
+    cached = _monthly_cache.get(data_file)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    with open(data_file, "r", encoding="utf-8") as f:
+        data = plot_data_from_monthly(pd.DataFrame(json.load(f)))
+
+    _monthly_cache[data_file] = (mtime, data)
+    return data
+
+def render_view(kind, kanton=None, date_from=None, date_to=None, fmt='png', data_file=DASHBOARD_MONTHLY_FILE):
+    """
+    Render a single plot view to bytes.
+
+    Args:
+        kind: 'line' (totals for CH or one canton) or 'facet' (one panel per canton).
+        kanton: For 'line', an optional canton code. For 'facet', an optional list of canton codes.
+        date_from: First month to include ('YYYY-MM'), or None for no lower bound.
+        date_to: Last month to include ('YYYY-MM'), or None for no upper bound.
+        fmt: 'png' or 'svg'.
+        data_file: Path to shab_monthly.json.
+
+    Returns:
+        The rendered image as bytes.
+    """
+    if kind not in PLOT_KINDS:
+        raise ValueError(f"Unknown plot kind: {kind}")
+    if fmt not in PLOT_FORMATS:
+        raise ValueError(f"Unknown plot format: {fmt}")
+
+    data = load_monthly(data_file).window(date_from, date_to)
+
+    buf = io.BytesIO()
+    if kind == "line":
+        _save_figure(line_figure(data, kanton=kanton), buf, fmt)
+    else:
+        _save_figure(facet_figure(data, cantons=kanton), buf, fmt, tight=False)
+    return buf.getvalue()
@@ -0,0 +1,152 @@
+"""
+Profiling mode of the refresh (`python refresh_data.py --profile`).
+
+The profiler wraps every pipeline stage and writes, into one directory per run:
+    <stage>.pstats        cProfile dump (open with `python -m pstats` or snakeviz)
+    <stage>.txt           the top functions by cumulative time
+    memory.txt            tracemalloc peak (above the stage's start) and top allocation sites per stage
+    summary.json          stage durations, memory peaks and the refresh metrics
+    flamegraph.folded     with --flamegraph: sampled stacks in the folded format
+                          (flamegraph.pl, speedscope, inferno)
+
+While profiling, the pipeline runs one stage at a time so that the cProfile and
+tracemalloc numbers of a stage are not mixed with those of a concurrent one. Without
+--profile none of this is imported or active.
+"""
+
+import os
+import sys
+import json
+import time
+import pstats
+import cProfile
+import logging
+import threading
+import contextlib
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+
+from metrics import refresh_metrics
+
+logger = logging.getLogger(__name__)
+
+SHAB_DATA_DIR = './shab_data'
+PROFILE_DIR = os.path.join(SHAB_DATA_DIR, 'profiles')
+
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 15
+SAMPLE_INTERVAL = 0.005  # seconds
+
+
+class StackSampler:
+    """Samples the Python stacks of all threads at a fixed interval into folded-stack counts."""
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def write(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class StageProfiler:
+    """
+    Collects per-stage cProfile, tracemalloc and (optionally) sampled stack data.
+
+    Args:
+        out_dir: Directory for this run's profile files (created if missing).
+        flamegraph: Also sample stacks for a flame graph.
+    """
+
+    def __init__(self, out_dir=None, flamegraph=False):
+        self.out_dir = out_dir or os.path.join(PROFILE_DIR, datetime.now().strftime("%Y%m%d-%H%M%S"))
+        self.sampler = StackSampler() if flamegraph else None
+        self.stages = {}
+        self.memory_reports = []
+
+    def start(self):
+        os.makedirs(self.out_dir, exist_ok=True)
+        # One frame per trace is enough for per-line allocation sites and keeps the overhead low
+        tracemalloc.start(1)
+        if self.sampler is not None:
+            self.sampler.start()
+        logger.info(f"Profiling enabled, writing to {self.out_dir}")
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Profile the stage running in the current thread."""
+        profile = cProfile.Profile()
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        baseline = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            seconds = time.perf_counter() - start
+            current, peak = tracemalloc.get_traced_memory()
+            after = tracemalloc.take_snapshot()
+            # Relative to the memory held when the stage started (earlier stages' outputs)
+            self._write_stage(name, profile, seconds, current - baseline, peak - baseline, before, after)
+
+    def _write_stage(self, name, profile, seconds, retained, peak, before, after):
+        profile.dump_stats(os.path.join(self.out_dir, f"{name}.pstats"))
+        with open(os.path.join(self.out_dir, f"{name}.txt"), "w", encoding="utf-8") as f:
+            stats = pstats.Stats(profile, stream=f)
+            stats.strip_dirs().sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+
+        sites = after.compare_to(before, "lineno")[:TOP_ALLOCATIONS]
+        lines = [f"== {name}: peak +{peak / 2**20:.1f} MiB, retained {retained / 2**20:+.1f} MiB"]
+        lines += [f"  {stat}" for stat in sites]
+        self.memory_reports.append("\n".join(lines))
+        self.stages[name] = {
+            "seconds": round(seconds, 4),
+            "tracemalloc_peak_bytes": peak,
+            "tracemalloc_retained_bytes": retained,
+        }
+
+    def finish(self):
+        """Stop sampling and tracing and write the run-level files."""
+        if self.sampler is not None:
+            self.sampler.stop()
+            self.sampler.write(os.path.join(self.out_dir, "flamegraph.folded"))
+        tracemalloc.stop()
+
+        with open(os.path.join(self.out_dir, "memory.txt"), "w", encoding="utf-8") as f:
+            f.write("\n\n".join(self.memory_reports) + "\n")
+        with open(os.path.join(self.out_dir, "summary.json"), "w", encoding="utf-8") as f:
+            json.dump({"stages": self.stages, "metrics": refresh_metrics.snapshot()}, f, indent=2)
+        logger.info(f"Profile written to {self.out_dir}")
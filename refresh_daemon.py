@@ -0,0 +1,276 @@
+"""
+Long-running refresh daemon (`python refresh_data.py --daemon`).
+
+The daemon keeps the SHAB rows of the refresh range and their monthly aggregate in memory
+between cycles. A cycle downloads only the days that are new in the range plus the most
+recent HOT_WINDOW_DAYS days (where late publications still show up), recomputes the monthly
+aggregate for the affected months only and then runs the remaining refresh stages on the
+warm state. Heavy modules (pandas, pyarrow, matplotlib) are imported once per process.
+
+A cycle runs every `interval` seconds. With a control port, a local HTTP endpoint triggers
+an immediate cycle:
+
+    curl -X POST http://127.0.0.1:<port>/refresh
+    curl http://127.0.0.1:<port>/status
+"""
+
+import json
+import time
+import signal
+import logging
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+from app import Get_Shab_DF, Get_Shab_DF_from_range, compact_shab_df, daterange, get_session
+from parquet_utils import acquire_lock, safe_write_parquet_atomic
+from dashboard_data import build_dashboard_monthly
+from artifacts import ArtifactManifest
+from metrics import refresh_metrics
+import refresh_data
+
+logger = logging.getLogger("refresh_daemon")
+
+DAEMON_INTERVAL = 3600
+# Days at the end of the range that are re-downloaded on every cycle
+HOT_WINDOW_DAYS = 3
+CONTROL_HOST = '127.0.0.1'
+
+
+class WarmState:
+    """The SHAB rows of the refresh range and their monthly aggregate, kept between cycles."""
+
+    def __init__(self, all_subrubrics=False):
+        self.all_subrubrics = all_subrubrics
+        self.df_shab = None
+        self.monthly = None
+        self.days = set()
+
+    def load(self, start_date, end_date):
+        """Cold start: load the range the same way a one-shot refresh does."""
+        df = Get_Shab_DF_from_range(start_date, end_date, all_subrubrics=self.all_subrubrics)
+        if not df.empty:
+            df = df.reset_index(drop=True)
+        self.df_shab = df
+        self.monthly = build_dashboard_monthly(df, all_subrubrics=self.all_subrubrics)
+        self.days = set(daterange(start_date, end_date))
+        logger.info(f"Warm state loaded: {len(df)} records, {len(self.days)} days")
+
+    def update(self, start_date, end_date, session=None):
+        """
+        Bring the state up to date for the range.
+
+        Returns:
+            True if rows were added, changed or dropped.
+        """
+        days = set(daterange(start_date, end_date))
+        hot = {end_date - timedelta(days=i) for i in range(HOT_WINDOW_DAYS)} & days
+        fetch = sorted((days - self.days) | hot)
+        logger.info(f"Fetching {len(fetch)} days ({len(hot)} in the hot window)")
+
+        session = session or get_session()
+        frames = []
+        # Only the days downloaded successfully replace their rows; a failed re-fetch keeps the old ones
+        fetched = set()
+        for day in fetch:
+            try:
+                df = Get_Shab_DF(day, session=session, use_cache=day not in self.days or day not in hot,
+                                 all_subrubrics=self.all_subrubrics)
+            except Exception as e:
+                logger.error(f"Error fetching {day}: {e}")
+                continue
+            if not df.empty:
+                df['date'] = pd.to_datetime(df['date'])
+                frames.append(df)
+            fetched.add(day)
+        self.days |= fetched
+
+        df_shab = self.df_shab
+        row_days = df_shab['date'].dt.date if not df_shab.empty else pd.Series(dtype=object)
+        kept = df_shab[row_days.isin(days) & ~row_days.isin(fetched)] if not df_shab.empty else df_shab
+        new_rows = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=df_shab.columns)
+
+        # Months whose rows changed: new or re-downloaded days that differ, or days that left the range
+        old_rows = df_shab[row_days.isin(fetched)] if not df_shab.empty else df_shab
+        dropped = df_shab[~row_days.isin(days)] if not df_shab.empty else df_shab
+        affected = _changed_months(old_rows, new_rows) | _months(dropped)
+        self.days &= days
+        if not affected:
+            return False
+
+        updated = pd.concat([kept, new_rows], ignore_index=True) if not new_rows.empty else kept.reset_index(drop=True)
+        if 'id' in updated.columns:
+            updated = updated.drop_duplicates(subset=['id'], ignore_index=True)
+        if self.all_subrubrics:
+            compact_shab_df(updated)
+        self.df_shab = updated
+        self.monthly = _splice_monthly(self.monthly, updated, affected, start_date, self.all_subrubrics)
+        logger.info(f"Warm state updated: {len(updated)} records, months {sorted(affected)} recomputed")
+        return True
+
+
+def _months(df):
+    if df.empty:
+        return set()
+    return set(pd.to_datetime(df['date']).dt.strftime("%Y-%m-01"))
+
+
+def _changed_months(old_rows, new_rows):
+    """Months in which the set of publications differs between old_rows and new_rows."""
+    months = set()
+    for month in _months(old_rows) | _months(new_rows):
+        old_ids = set(old_rows.loc[pd.to_datetime(old_rows['date']).dt.strftime("%Y-%m-01") == month, 'id']) if not old_rows.empty else set()
+        new_ids = set(new_rows.loc[pd.to_datetime(new_rows['date']).dt.strftime("%Y-%m-01") == month, 'id']) if not new_rows.empty else set()
+        if old_ids != new_ids:
+            months.add(month)
+    return months
+
+
+def _splice_monthly(monthly, df_shab, months, start_date, all_subrubrics=False):
+    """
+    Recompute the monthly aggregate for `months` only. Every row of the aggregate depends on
+    the rows of its own month alone, so the other months are kept as they are.
+    """
+    first_month = start_date.strftime("%Y-%m-01")
+    row_months = df_shab['date'].dt.strftime("%Y-%m-01") if not df_shab.empty else pd.Series(dtype=object)
+    recomputed = build_dashboard_monthly(df_shab[row_months.isin(months)], all_subrubrics=all_subrubrics)
+
+    parts = []
+    if monthly is not None:
+        parts.append(monthly[~monthly['month'].isin(months) & (monthly['month'] >= first_month)])
+    if recomputed is not None:
+        parts.append(recomputed)
+    if not parts:
+        return None
+    result = pd.concat(parts, ignore_index=True)
+    if result.empty:
+        return None
+    return result.sort_values(by=["month", "geo", "kanton", "hr"], ignore_index=True)
+
+
+class RefreshDaemon:
+    """
+    Runs refresh cycles on the warm state every `interval` seconds, or immediately when triggered.
+
+    Args:
+        interval: Seconds between cycles.
+        control_port: Port of the local control endpoint, or None to disable it.
+        all_subrubrics: Ingest every HR subrubric (see subrubrics.py).
+    """
+
+    def __init__(self, interval=DAEMON_INTERVAL, control_port=None, all_subrubrics=False):
+        self.interval = interval
+        self.control_port = control_port
+        self.all_subrubrics = all_subrubrics
+        self.state = WarmState(all_subrubrics)
+        self.session = get_session()
+        self.trigger = threading.Event()
+        self.stopping = threading.Event()
+        self.last_cycle = {}
+        self._server = None
+
+    def cycle(self):
+        """Run one refresh cycle. Returns the stage timings."""
+        started = datetime.now()
+        refresh_metrics.reset()
+        start_date, end_date = refresh_data.refresh_date_range()
+        with acquire_lock(refresh_data.LOCK_FILE, timeout=10):
+            fetch_start = time.perf_counter()
+            if self.state.df_shab is None:
+                self.state.load(start_date, end_date)
+            elif self.state.update(start_date, end_date, session=self.session) and not self.state.df_shab.empty:
+                # Keep the on-disk cache current for one-shot runs and cold starts
+                safe_write_parquet_atomic(self.state.df_shab, refresh_data.shab_cache_paths(self.all_subrubrics)[0])
+            # Reported like the shab_fetch stage of a one-shot refresh
+            refresh_metrics.inc("shab_rows", len(self.state.df_shab))
+            refresh_metrics.observe_stage("shab_fetch", "run", time.perf_counter() - fetch_start)
+
+            manifest = ArtifactManifest()
+            context = {
+                "start_date": start_date,
+                "end_date": end_date,
+                "manifest": manifest,
+                "df_shab": self.state.df_shab,
+                "monthly": self.state.monthly,
+                "all_subrubrics": self.all_subrubrics,
+            }
+            # SHAB rows and the monthly aggregate come from the warm state
+            stages = [name for name in refresh_data.PIPELINE.stages if name not in ("shab_fetch", "aggregate")]
+            try:
+                timings = refresh_data.PIPELINE.run(context, only=stages)
+            finally:
+                manifest.save()
+
+        seconds = (datetime.now() - started).total_seconds()
+        self.last_cycle = {
+            "finished": datetime.now().isoformat(),
+            "seconds": round(seconds, 3),
+            "records": len(self.state.df_shab),
+            "data_version": context["status"]["data_version"],
+        }
+        logger.info(f"Refresh cycle finished in {seconds:.2f}s")
+        return timings
+
+    def run(self):
+        """Run cycles until stopped (SIGTERM / SIGINT)."""
+        if threading.current_thread() is threading.main_thread():
+            for sig in (signal.SIGTERM, signal.SIGINT):
+                signal.signal(sig, lambda *_: self.stop())
+        if self.control_port:
+            self._start_control_server()
+
+        logger.info(f"Refresh daemon started, interval {self.interval}s")
+        while not self.stopping.is_set():
+            self.trigger.clear()
+            try:
+                self.cycle()
+            except TimeoutError:
+                logger.warning("Could not acquire lock, another refresh is running. Retrying next cycle.")
+            except Exception as e:
+                # Keep the daemon alive; the warm state is rebuilt on the next cycle
+                logger.error(f"Refresh cycle failed: {e}", exc_info=True)
+                self.state = WarmState(self.all_subrubrics)
+            self.trigger.wait(self.interval)
+
+        if self._server is not None:
+            self._server.shutdown()
+        logger.info("Refresh daemon stopped.")
+
+    def stop(self):
+        self.stopping.set()
+        self.trigger.set()
+
+    def _start_control_server(self):
+        daemon = self
+
+        class ControlHandler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path != "/refresh":
+                    self.send_error(404)
+                    return
+                daemon.trigger.set()
+                self._send_json(202, {"triggered": True})
+
+            def do_GET(self):
+                if self.path != "/status":
+                    self.send_error(404)
+                    return
+                self._send_json(200, {"interval": daemon.interval, "last_cycle": daemon.last_cycle})
+
+            def _send_json(self, code, payload):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        # Loopback only: the endpoint has no authentication
+        self._server = ThreadingHTTPServer((CONTROL_HOST, self.control_port), ControlHandler)
+        threading.Thread(target=self._server.serve_forever, name="refresh-control", daemon=True).start()
+        logger.info(f"Control endpoint on http://{CONTROL_HOST}:{self.control_port}")
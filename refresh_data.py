@@ -1,19 +1,27 @@
 
 import os
 import sys
+import json
 import logging
+import argparse
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
 import pandas as pd
-import json
 
 # Import components
-from app import Get_Shab_DF_from_range
-from bfs_pxweb import fetch_udemo, CANTON_ABBR_TO_LABEL
-from plots import generate_plots
-from parquet_utils import acquire_lock, safe_write_parquet_atomic
-from logging_setup import configure_logging
-from dashboard_data import export_dashboard_data
+from app import Get_Shab_DF_from_range, iter_shab_months
+from udemo_store import update_store as update_udemo_store, stored_observations, aggregate_births, merge_udemo
+from plots import (build_plot_data, plot_data_from_monthly, render_plots, render_canton_plots, plot_output_paths,
+                   canton_manifest_path)
+from parquet_utils import acquire_lock, safe_read_parquet, safe_write_parquet_atomic
+from dashboard_data import build_dashboard_monthly, write_dashboard_data, dashboard_output_paths
+from shared_dataset import publish_dataset
+from artifacts import ArtifactManifest, content_hash
+from pipeline import Stage, Pipeline
+from retention import apply_retention
+from search_index import SearchIndexUpdate, update_search_index
+from metrics import refresh_metrics
+from subrubrics import DEFAULT_SUBRUBRICS, cache_dir
 
 from logging_setup import configure_logging
 
@@ -21,113 +29,428 @@ logger = logging.getLogger("refresh_data")
 
 SHAB_DATA_DIR = './shab_data'
 LOCK_FILE = os.path.join(SHAB_DATA_DIR, 'refresh.lock')
+MAIN_PARQUET = os.path.join(SHAB_DATA_DIR, 'last_df.parquet')
 UDEMO_MERGED_FILE = os.path.join(SHAB_DATA_DIR, 'udemo_merged.parquet')
 STATUS_FILE = './static/status.json'
+UDEMO_OBSERVATION = "Unternehmensneugründungen"
 
-def main():
-    logger.info("Starting data refresh process...")
+def read_status():
+    """The status.json of the last refresh, or an empty dict."""
+    try:
+        with open(STATUS_FILE, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def shab_cache_paths(all_subrubrics=False):
+    """(hot dataset, archive directory) of the SHAB cache of an ingestion mode."""
+    data_dir = cache_dir(all_subrubrics)
+    return os.path.join(data_dir, os.path.basename(MAIN_PARQUET)), os.path.join(data_dir, 'archive')
+
+def refresh_date_range(today=None):
+    """The last three full years of months before `today`."""
+    given_date = today or datetime.today().date()
+    end_date = given_date.replace(day=1) - timedelta(days=1)
+    start_date = end_date - relativedelta(years=3) + timedelta(days=1)
+    return start_date, end_date
+
+# --- Stages ---
+# Each stage reads its inputs from the shared context and returns its outputs. Stages that
+# write artifacts are skipped when the hash of their input aggregates matches what was last
+# published and their outputs are still on disk.
+
+def fetch_shab(ctx):
+    def progress_callback(current, total, message):
+        if current % 10 == 0 or current == total:
+            logger.info(f"SHAB Progress {current}/{total}: {message}")
+        if ctx.get("progress"):
+            ctx["progress"](current, total, message)
+
+    df_shab = Get_Shab_DF_from_range(ctx["start_date"], ctx["end_date"], progress_callback=progress_callback,
+                                     all_subrubrics=ctx.get("all_subrubrics", False))
+    refresh_metrics.inc("shab_rows", len(df_shab))
+    logger.info(f"SHAB data fetched: {len(df_shab)} records")
+    if df_shab.empty:
+        logger.warning("No SHAB data found. Plots will be empty.")
+    return {"df_shab": df_shab}
+
+def restore_shab(ctx):
+    main_parquet, _ = shab_cache_paths(ctx.get("all_subrubrics", False))
+    df = safe_read_parquet(main_parquet)
+    if df is None or df.empty:
+        return {"df_shab": pd.DataFrame()}
+    dates = pd.to_datetime(df["date"]).dt.date
+    return {"df_shab": df[(dates >= ctx["start_date"]) & (dates <= ctx["end_date"])].copy()}
+
+def retain_window(ctx):
+    # Runs after the SHAB fetch has written the hot dataset; days before the window go to the archive
+    main_parquet, archive_dir = shab_cache_paths(ctx.get("all_subrubrics", False))
+    return {"retention": apply_retention(ctx["start_date"], data_dir=os.path.dirname(main_parquet), archive_dir=archive_dir)}
+
+def _refresh_years(ctx):
+    return list(range(ctx["start_date"].year, ctx["end_date"].year + 1))
+
+def fetch_bfs(ctx):
+    # Only years missing from the local store, or provisional, are requested
+    logger.info("Fetching BFS UDEMO data...")
+    try:
+        df_bfs = update_udemo_store(UDEMO_OBSERVATION, _refresh_years(ctx))
+    except Exception as e:
+        logger.error(f"BFS fetch failed, proceeding without BFS data: {e}")
+        df_bfs = pd.DataFrame()
+    return {"df_bfs": df_bfs}
+
+def restore_bfs(ctx):
+    return {"df_bfs": stored_observations(UDEMO_OBSERVATION, _refresh_years(ctx))}
+
+def generate_plots(ctx):
+    if ctx["df_shab"].empty:
+        return {"plots_changed": False}
+    return _render_plot_data(ctx, build_plot_data(ctx["df_shab"]))
+
+def generate_plots_from_monthly(ctx):
+    # --stream: there are no SHAB rows in memory, only their monthly aggregate
+    if ctx["monthly"] is None:
+        return {"plots_changed": False}
+    return _render_plot_data(ctx, plot_data_from_monthly(ctx["monthly"]))
+
+def _render_plot_data(ctx, plot_data):
+    manifest = ctx["manifest"]
+    plots_hash = content_hash(plot_data.months, plot_data.cantons, plot_data.counts,
+                              str(ctx["start_date"]), str(ctx["end_date"]))
+    plot_outputs = list(plot_output_paths().values()) + [canton_manifest_path()]
+    if manifest.is_fresh("plots", plots_hash, plot_outputs):
+        logger.info("Plot inputs unchanged, skipping plot generation.")
+        return {"plots_changed": False}
+
+    logger.info("Generating plots...")
+    render_plots(plot_data, ctx["start_date"], ctx["end_date"])
+    # Only cantons whose series changed are re-rendered
+    render_canton_plots(plot_data)
+    manifest.record("plots", plots_hash, plot_outputs)
+    return {"plots_changed": True}
+
+def shab_events_by_year(df_shab, all_subrubrics=False):
+    """SHAB publications per (kanton, year), the SHAB side of the UDEMO comparison."""
+    if all_subrubrics:
+        # The comparison with the BFS births stays on HR01 and HR03, as in the default mode
+        df_shab = df_shab[df_shab["subrubric"].isin(DEFAULT_SUBRUBRICS)]
+    shab_year_canton = (
+        df_shab.assign(year=pd.to_datetime(df_shab["date"]).dt.year)
+               .groupby(["kanton", "year"])
+               .size()
+               .reset_index(name="shab_events")
+    )
+    shab_year_canton["year"] = shab_year_canton["year"].astype(int)
+    return shab_year_canton
+
+def merge_bfs(ctx):
+    if ctx["df_shab"].empty:
+        return {"udemo_merged": None, "udemo_changed": False}
+    return _merge_udemo(ctx, shab_events_by_year(ctx["df_shab"], ctx.get("all_subrubrics", False)))
+
+def merge_bfs_streamed(ctx):
+    if ctx["shab_year_canton"] is None:
+        return {"udemo_merged": None, "udemo_changed": False}
+    return _merge_udemo(ctx, ctx["shab_year_canton"])
+
+def _merge_udemo(ctx, shab_year_canton):
+    df_bfs, manifest = ctx["df_bfs"], ctx["manifest"]
+    unchanged = {"udemo_merged": None, "udemo_changed": False}
+    if df_bfs.empty:
+        logger.warning("BFS data empty, skipping merge.")
+        return unchanged
+
+    # df_bfs columns: Beobachtungseinheit, Kanton, Rechtsform, Jahr, value
+    # Sum over legal forms
+    bfs_births = aggregate_births(df_bfs)
+
+    udemo_hash = content_hash(shab_year_canton, bfs_births)
+    if manifest.is_fresh("udemo", udemo_hash, [UDEMO_MERGED_FILE]):
+        logger.info("UDEMO merge inputs unchanged, skipping merge.")
+        return unchanged
+
+    # Only the (kanton, year) rows whose inputs changed are recomputed
+    udemo_merged = merge_udemo(shab_year_canton, bfs_births, previous=safe_read_parquet(UDEMO_MERGED_FILE))
+    logger.info(f"Merged BFS data: {len(udemo_merged)} rows.")
+
+    safe_write_parquet_atomic(udemo_merged, UDEMO_MERGED_FILE)
+    manifest.record("udemo", udemo_hash, [UDEMO_MERGED_FILE])
+    return {"udemo_merged": udemo_merged, "udemo_changed": True}
+
+def restore_udemo(ctx):
+    return {"udemo_merged": None, "udemo_changed": False}
+
+def stream_shab(ctx):
+    """
+    --stream: fold the SHAB data into the monthly aggregate, the (kanton, year) counts and the
+    search index one calendar month at a time, without building the whole-history dataframe.
+    """
+    all_subrubrics = ctx.get("all_subrubrics", False)
+
+    def progress_callback(current, total, message):
+        if current % 100 == 0 or current == total:
+            logger.info(f"SHAB Progress {current}/{total}: {message}")
+        if ctx.get("progress"):
+            ctx["progress"](current, total, message)
+
+    search_index = SearchIndexUpdate(start_date=ctx["start_date"], end_date=ctx["end_date"])
+    monthly_parts, year_canton_parts, records = [], [], 0
+    for month, df_month in iter_shab_months(ctx["start_date"], ctx["end_date"], progress_callback=progress_callback,
+                                            all_subrubrics=all_subrubrics):
+        records += len(df_month)
+        # Every aggregate row depends on the rows of its own month only
+        monthly_parts.append(build_dashboard_monthly(df_month, all_subrubrics=all_subrubrics))
+        year_canton_parts.append(shab_events_by_year(df_month, all_subrubrics))
+        search_index.add(df_month)
+        logger.debug(f"Folded {len(df_month)} records of {month:%Y-%m}")
+
+    refresh_metrics.inc("shab_rows", records)
+    logger.info(f"SHAB data streamed: {records} records")
+    monthly_parts = [part for part in monthly_parts if part is not None]
+    monthly = None
+    if monthly_parts:
+        monthly = pd.concat(monthly_parts, ignore_index=True).sort_values(
+            by=["month", "geo", "kanton", "hr"], ignore_index=True)
+    shab_year_canton = None
+    if records:
+        # A year spans twelve month fragments: sum them
+        shab_year_canton = (pd.concat(year_canton_parts, ignore_index=True)
+                              .groupby(["kanton", "year"], as_index=False)["shab_events"].sum())
+    else:
+        logger.warning("No SHAB data found. Plots will be empty.")
+    return {
+        "monthly": monthly,
+        "shab_year_canton": shab_year_canton,
+        "shab_records": records,
+        "search_segments_written": search_index.finish(),
+    }
+
+def index_titles(ctx):
+    # Only the months whose publications changed are re-indexed
+    return {"search_segments_written": update_search_index(ctx["df_shab"], start_date=ctx["start_date"], end_date=ctx["end_date"])}
+
+def aggregate_monthly(ctx):
+    return {"monthly": build_dashboard_monthly(ctx["df_shab"], all_subrubrics=ctx.get("all_subrubrics", False))}
+
+def export_dashboard(ctx):
+    manifest, monthly = ctx["manifest"], ctx["monthly"]
+    if monthly is None:
+        return {"dashboard_changed": False}
+
+    dashboard_hash = content_hash(monthly)
+    dashboard_outputs = dashboard_output_paths()
+    if manifest.is_fresh("dashboard", dashboard_hash, dashboard_outputs):
+        logger.info("Dashboard data unchanged, skipping export.")
+        return {"dashboard_changed": False}
+
+    write_dashboard_data(monthly)
+    manifest.record("dashboard", dashboard_hash, dashboard_outputs)
+    return {"dashboard_changed": True}
+
+def publish(ctx):
+    """Publish the shared dataset for the Flask workers and write status.json."""
+    manifest, monthly = ctx["manifest"], ctx["monthly"]
+    changed = ctx["plots_changed"] or ctx["udemo_changed"] or ctx["dashboard_changed"]
+
+    # data_version only moves when some published content actually changed.
+    now = datetime.now()
+    previous_status = read_status()
+    dataset_hash = None
+    udemo_merged = ctx["udemo_merged"]
+    if monthly is not None:
+        if udemo_merged is None:
+            # Unchanged, or BFS was unavailable this time: use the last successful merge
+            udemo_merged = safe_read_parquet(UDEMO_MERGED_FILE)
+        dataset_hash = content_hash(monthly, udemo_merged)
+        if not manifest.is_fresh("dataset", dataset_hash):
+            changed = True
+
+    if changed or "data_version" not in previous_status:
+        data_version = int(now.timestamp())
+        data_updated_at = now.isoformat()
+    else:
+        logger.info("No content changes, keeping data_version.")
+        data_version = previous_status["data_version"]
+        data_updated_at = previous_status.get("data_updated_at", now.isoformat())
+
+    if dataset_hash is not None and not manifest.is_fresh("dataset", dataset_hash):
+        dataset_file = publish_dataset(monthly, udemo_merged, data_version=data_version)
+        manifest.record("dataset", dataset_hash, [os.path.join(SHAB_DATA_DIR, dataset_file)], file=dataset_file)
+    dataset_file = manifest.get("dataset", "file")
+
+    status = {
+        "last_refresh": now.isoformat(),
+        "data_updated_at": data_updated_at,
+        "start_date": str(ctx["start_date"]),
+        "end_date": str(ctx["end_date"]),
+        "records": ctx["shab_records"] if "shab_records" in ctx else len(ctx["df_shab"]),
+        "all_subrubrics": ctx.get("all_subrubrics", False),
+        "status": "success",
+        "data_files": ["shab_monthly.json", "dimensions.json"],
+        # Basic metadata derived from df_shab if needed, or rely on dimensions.json
+        "data_version": data_version,
+        "dataset_file": dataset_file,
+        # Stages finished so far (publish itself is still running), counters, timers, peak RSS
+        "metrics": refresh_metrics.snapshot()
+    }
+    # Write atomically so the Flask snapshot watcher never reads a partial file
+    status_tmp = f"{STATUS_FILE}.tmp"
+    with open(status_tmp, 'w') as f:
+        json.dump(status, f)
+    os.replace(status_tmp, STATUS_FILE)
+    return {"status": status}
+
+# SHAB and BFS fetches run side by side; plots, the UDEMO merge and the dashboard export
+# start as soon as their inputs are ready.
+PIPELINE = Pipeline([
+    Stage("shab_fetch", fetch_shab, outputs=["df_shab"], restore=restore_shab),
+    Stage("retention", retain_window, inputs=["df_shab"], outputs=["retention"]),
+    Stage("bfs_fetch", fetch_bfs, outputs=["df_bfs"], restore=restore_bfs),
+    Stage("plots", generate_plots, inputs=["df_shab"], outputs=["plots_changed"],
+          restore=lambda ctx: {"plots_changed": False}),
+    Stage("udemo_merge", merge_bfs, inputs=["df_shab", "df_bfs"],
+          outputs=["udemo_merged", "udemo_changed"], restore=restore_udemo),
+    Stage("search_index", index_titles, inputs=["df_shab"], outputs=["search_segments_written"],
+          restore=lambda ctx: {"search_segments_written": 0}),
+    # No restore: the aggregation is cheap, and rebuilding it keeps the dataset hash identical to a full run
+    Stage("aggregate", aggregate_monthly, inputs=["df_shab"], outputs=["monthly"]),
+    Stage("dashboard", export_dashboard, inputs=["monthly"], outputs=["dashboard_changed"],
+          restore=lambda ctx: {"dashboard_changed": False}),
+    Stage("publish", publish,
+          inputs=["df_shab", "monthly", "udemo_merged", "plots_changed", "udemo_changed", "dashboard_changed"],
+          outputs=["status"]),
+])
+
+# --stream: the SHAB data is folded month by month into the aggregates the later stages need,
+# so no stage ever holds the SHAB rows of the whole range. Peak memory is one month of rows.
+STREAM_PIPELINE = Pipeline([
+    Stage("shab_fetch", stream_shab, outputs=["monthly", "shab_year_canton", "shab_records", "search_segments_written"]),
+    Stage("retention", retain_window, inputs=["monthly"], outputs=["retention"]),
+    Stage("bfs_fetch", fetch_bfs, outputs=["df_bfs"]),
+    Stage("plots", generate_plots_from_monthly, inputs=["monthly"], outputs=["plots_changed"]),
+    Stage("udemo_merge", merge_bfs_streamed, inputs=["shab_year_canton", "df_bfs"],
+          outputs=["udemo_merged", "udemo_changed"]),
+    Stage("dashboard", export_dashboard, inputs=["monthly"], outputs=["dashboard_changed"]),
+    Stage("publish", publish,
+          inputs=["shab_records", "monthly", "udemo_merged", "plots_changed", "udemo_changed", "dashboard_changed"],
+          outputs=["status"]),
+])
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Refresh the SHAB dashboard data.")
+    parser.add_argument("--only", action="append", metavar="STAGE",
+                        help=f"Run only these stages (repeatable or comma-separated): {', '.join(PIPELINE.stages)}. "
+                             "Their inputs are loaded from the last run.")
+    parser.add_argument("--from-stage", metavar="STAGE",
+                        help="Run this stage and every stage downstream of it.")
+    parser.add_argument("--all-subrubrics", action="store_true",
+                        help="Ingest every HR subrubric, not only HR01 and HR03 (about 10x the rows; "
+                             "cached separately in shab_data/all_subrubrics/).")
+    parser.add_argument("--stream", action="store_true",
+                        help="Aggregate the SHAB data one month at a time instead of loading the whole range "
+                             "(for long-history backfills; memory stays at one month of rows).")
+    parser.add_argument("--start-date", type=lambda value: datetime.strptime(value, "%Y-%m-%d").date(),
+                        metavar="YYYY-MM-DD",
+                        help="First day of the refresh range (default: three years back), e.g. for a backfill.")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Keep running and refresh every --interval seconds, with the data kept in memory.")
+    parser.add_argument("--interval", type=int, default=3600, metavar="SECONDS",
+                        help="Seconds between refresh cycles in --daemon mode (default: 3600).")
+    parser.add_argument("--control-port", type=int, metavar="PORT",
+                        help="In --daemon mode, serve POST /refresh and GET /status on 127.0.0.1:PORT.")
+    parser.add_argument("--profile", nargs="?", const="", metavar="DIR",
+                        help="Write per-stage cProfile dumps and tracemalloc reports (default: shab_data/profiles/<time>/). "
+                             "Stages run one at a time.")
+    parser.add_argument("--flamegraph", action="store_true",
+                        help="With --profile, also sample stacks into flamegraph.folded.")
+    args = parser.parse_args(argv)
+    if args.flamegraph and args.profile is None:
+        parser.error("--flamegraph requires --profile")
+    if args.daemon and args.profile is not None:
+        parser.error("--profile profiles a single run and cannot be combined with --daemon")
+    if args.daemon and (args.only or args.from_stage):
+        parser.error("--daemon runs the full pipeline and cannot be combined with --only / --from-stage")
+    if args.stream and (args.daemon or args.only or args.from_stage):
+        parser.error("--stream runs the full pipeline once and cannot be combined with --daemon / --only / --from-stage")
+    if args.daemon and args.start_date:
+        parser.error("--start-date cannot be combined with --daemon")
+    if args.start_date and args.start_date > refresh_date_range()[1]:
+        parser.error(f"--start-date must not be after {refresh_date_range()[1]}")
+    if args.only:
+        args.only = [name.strip() for value in args.only for name in value.split(",") if name.strip()]
+    try:
+        PIPELINE.select(args.only, args.from_stage)
+    except ValueError as e:
+        parser.error(str(e))
+    return args
+
+def run_refresh(start_date=None, stream=False, only=None, from_stage=None, all_subrubrics=False,
+                profiler=None, progress=None, on_stage=None):
+    """
+    Run one refresh. The caller holds LOCK_FILE.
+
+    Args:
+        start_date: First day of the range, or None for the default three years.
+        stream: Run STREAM_PIPELINE instead of PIPELINE.
+        only, from_stage: Stage selection (see Pipeline.run).
+        all_subrubrics: Ingest every HR subrubric (see subrubrics.py).
+        profiler: StageProfiler wrapping every stage, or None.
+        progress: Called as progress(current, total, message) while the SHAB days are read.
+        on_stage: Called on stage start/finish (see Pipeline.run).
+
+    Returns:
+        Dict of stage name -> seconds.
+    """
+    default_start, end_date = refresh_date_range()
+    start_date = start_date or default_start
+    if start_date > end_date:
+        raise ValueError(f"The start date must not be after {end_date}")
+    logger.info(f"Target date range: {start_date} to {end_date}")
+
+    refresh_metrics.reset()
+    manifest = ArtifactManifest()
+    context = {"start_date": start_date, "end_date": end_date, "manifest": manifest,
+               "all_subrubrics": all_subrubrics, "progress": progress}
+    try:
+        pipeline = STREAM_PIPELINE if stream else PIPELINE
+        timings = pipeline.run(context, only=only, from_stage=from_stage, profiler=profiler, on_stage=on_stage)
+    finally:
+        # Keep what the finished stages recorded, even if a later one failed
+        manifest.save()
+
+    logger.info("Stage timings: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items()))
+    logger.info("Refresh completed successfully.")
+    return timings
+
+def main(argv=None):
+    args = parse_args(argv)
 
     # Ensure directories
     if not os.path.exists(SHAB_DATA_DIR):
         os.makedirs(SHAB_DATA_DIR)
 
+    if args.daemon:
+        from refresh_daemon import RefreshDaemon
+        RefreshDaemon(interval=args.interval, control_port=args.control_port,
+                      all_subrubrics=args.all_subrubrics).run()
+        return
+
+    logger.info("Starting data refresh process...")
+
     try:
         with acquire_lock(LOCK_FILE, timeout=10):
-            # 1. Calculate Date Range (last 3 years)
-            given_date = datetime.today().date()
-            end_date = given_date.replace(day=1) - timedelta(days=1)
-            start_date = end_date - relativedelta(years=3) + timedelta(days=1)
-
-            logger.info(f"Target date range: {start_date} to {end_date}")
-
-            # 2. Fetch SHAB Data
-            def progress_callback(current, total, message):
-                if current % 10 == 0 or current == total:
-                    logger.info(f"SHAB Progress {current}/{total}: {message}")
-
-            df_shab = Get_Shab_DF_from_range(start_date, end_date, progress_callback=progress_callback)
-            logger.info(f"SHAB data fetched: {len(df_shab)} records")
-
-            if df_shab.empty:
-                logger.warning("No SHAB data found. Plots will be empty.")
-
-            # 3. Generate Plots
-            generate_plots(df_shab, start_date, end_date)
-
-            # 4. Fetch BFS Data & Merge
-            logger.info("Fetching BFS UDEMO data...")
-
-            # Prepare SHAB data for merge
-            if not df_shab.empty:
-                df_shab_proc = df_shab.copy()
-                df_shab_proc["year"] = pd.to_datetime(df_shab_proc["date"]).dt.year
-
-                shab_year_canton = (
-                    df_shab_proc.groupby(["kanton", "year"])
-                           .size()
-                           .reset_index(name="shab_events")
-                )
-
-                years = sorted(shab_year_canton["year"].unique().tolist())
-
-                # Fetch BFS data
-                try:
-                    df_bfs = fetch_udemo(
-                        observation_text="Unternehmensneugründungen",
-                        years=years,
-                        canton_abbrs=None
-                    )
-                except Exception as e:
-                    logger.error(f"BFS fetch failed, proceeding without BFS data: {e}")
-                    df_bfs = pd.DataFrame()
-
-                if not df_bfs.empty:
-                     # df_bfs columns: Beobachtungseinheit, Kanton, Rechtsform, Jahr, value
-                     # Sum over legal forms
-                    df_bfs_agg = df_bfs.groupby(["Jahr", "Kanton"], as_index=False)["value"].sum()
-                    df_bfs_agg = df_bfs_agg.rename(columns={"Jahr": "year", "Kanton": "kanton_name", "value": "bfs_births"})
-
-                    # Convert BFS canton names back to abbreviations
-                    name_to_abbr = {v: k for k, v in CANTON_ABBR_TO_LABEL.items()}
-                    df_bfs_agg["kanton"] = df_bfs_agg["kanton_name"].map(name_to_abbr)
-
-                    # Ensure types match
-                    df_bfs_agg["year"] = pd.to_numeric(df_bfs_agg["year"], errors='coerce')
-                    shab_year_canton["year"] = shab_year_canton["year"].astype(int)
-
-                    udemo_merged = shab_year_canton.merge(
-                        df_bfs_agg[["kanton", "year", "bfs_births"]],
-                        on=["kanton", "year"],
-                        how="left"
-                    )
-
-                    logger.info(f"Merged BFS data: {len(udemo_merged)} rows.")
-
-                    # Save merged data
-                    safe_write_parquet_atomic(udemo_merged, UDEMO_MERGED_FILE)
-                else:
-                    logger.warning("BFS data empty, skipping merge.")
-
-            # 5. Export Dashboard Data
-            export_dashboard_data(df_shab)
-
-            # 6. Write Status
-            now = datetime.now()
-            status = {
-                "last_refresh": now.isoformat(),
-                "data_updated_at": now.isoformat(),
-                "start_date": str(start_date),
-                "end_date": str(end_date),
-                "records": len(df_shab),
-                "status": "success",
-                "data_files": ["shab_monthly.json", "dimensions.json"],
-                # Basic metadata derived from df_shab if needed, or rely on dimensions.json
-                "data_version": int(now.timestamp())
-            }
-            with open(STATUS_FILE, 'w') as f:
-                json.dump(status, f)
-
-            logger.info("Refresh completed successfully.")
+            profiler = None
+            if args.profile is not None:
+                from profiling import StageProfiler
+                profiler = StageProfiler(args.profile or None, flamegraph=args.flamegraph)
+                profiler.start()
+            try:
+                run_refresh(start_date=args.start_date, stream=args.stream, only=args.only,
+                            from_stage=args.from_stage, all_subrubrics=args.all_subrubrics, profiler=profiler)
+            finally:
+                if profiler is not None:
+                    profiler.finish()
 
     except TimeoutError:
         logger.error("Could not acquire lock. Another refresh process might be running.")
@@ -0,0 +1,245 @@
+"""
+Refresh jobs triggered from the Flask app (`POST /api/refresh`).
+
+A job is a JSON file in shab_data/jobs/ that records its parameters, its state (queued,
+running, complete, failed) and its live progress: the running stages and the SHAB days
+read so far. The files are shared by all Flask worker processes, which only write new
+jobs and read progress.
+
+Submitting a job starts a worker process (`python -m refresh_jobs`) that runs the queued
+jobs one after the other, outside the request threads, and exits when the queue is empty.
+Only one worker runs at a time (WORKER_LOCK), and every job takes the refresh lock
+(refresh_data.LOCK_FILE) like a manual or daemon refresh does, so refreshes never overlap.
+
+Standard library only at import time, so the Flask serving path stays light.
+"""
+
+import os
+import sys
+import json
+import uuid
+import logging
+import tempfile
+import threading
+import subprocess
+from datetime import date, datetime, timedelta
+
+logger = logging.getLogger("refresh_jobs")
+
+SHAB_DATA_DIR = './shab_data'
+JOBS_DIR = os.path.join(SHAB_DATA_DIR, 'jobs')
+WORKER_LOCK = os.path.join(JOBS_DIR, 'worker.lock')
+
+# Seconds a job waits for a refresh started elsewhere (CLI, daemon) before it fails
+JOB_LOCK_TIMEOUT = 600
+# Finished jobs kept on disk
+MAX_FINISHED_JOBS = 20
+# Earliest start of a queued refresh, in years before the current one: every day of the
+# range is a request to the SHAB API
+MAX_BACKFILL_YEARS = 10
+
+ACTIVE_STATES = ("queued", "running")
+
+
+def _now():
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def _write_job(job, jobs_dir=JOBS_DIR):
+    fd, temp_path = tempfile.mkstemp(dir=jobs_dir, prefix="tmp_job_", suffix=".json")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(job, f)
+        os.replace(temp_path, os.path.join(jobs_dir, f"{job['id']}.json"))
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def load_job(job_id, jobs_dir=JOBS_DIR):
+    """The job record, or None if there is no such job."""
+    try:
+        with open(os.path.join(jobs_dir, f"{os.path.basename(job_id)}.json"), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def list_jobs(jobs_dir=JOBS_DIR):
+    """All job records, oldest first (job ids sort by submission time)."""
+    try:
+        names = sorted(name for name in os.listdir(jobs_dir) if name.endswith(".json") and not name.startswith("tmp_"))
+    except OSError:
+        return []
+    jobs = (load_job(name[:-len(".json")], jobs_dir) for name in names)
+    return [job for job in jobs if job is not None]
+
+
+def current_job(jobs_dir=JOBS_DIR):
+    """The running job, else the next queued one, else the last finished one; None without any job."""
+    jobs = list_jobs(jobs_dir)
+    for state in ACTIVE_STATES:
+        for job in jobs:
+            if job["state"] == state:
+                return job
+    return jobs[-1] if jobs else None
+
+
+def earliest_start_date(today=None):
+    """First day a queued refresh may start from (January 1st, MAX_BACKFILL_YEARS years back)."""
+    today = today or date.today()
+    return date(today.year - MAX_BACKFILL_YEARS, 1, 1)
+
+
+def latest_start_date(today=None):
+    """Last day a queued refresh may start from: the end of the refresh range, as in refresh_data.refresh_date_range."""
+    today = today or date.today()
+    return today.replace(day=1) - timedelta(days=1)
+
+
+def submit_job(start_date=None, stream=False, jobs_dir=JOBS_DIR, start_worker=True):
+    """
+    Queue a refresh and make sure a worker process runs it. A job with the same parameters
+    that is still queued is returned instead of queueing another one.
+
+    Args:
+        start_date: First day of the range (date), or None for the default three years.
+            Clamped to earliest_start_date().
+        stream: Run the streaming pipeline (see refresh_data.py --stream).
+        jobs_dir: Directory of the job files.
+        start_worker: Start a worker process for the queue.
+
+    Returns:
+        The job record.
+    """
+    os.makedirs(jobs_dir, exist_ok=True)
+    if start_date is not None and start_date < earliest_start_date():
+        logger.warning(f"Refresh start {start_date} clamped to {earliest_start_date()} (MAX_BACKFILL_YEARS)")
+        start_date = earliest_start_date()
+    params = {"start_date": start_date.isoformat() if start_date else None, "stream": bool(stream)}
+    job = next((j for j in list_jobs(jobs_dir) if j["state"] == "queued" and j["params"] == params), None)
+    if job is None:
+        job = {
+            "id": f"{datetime.now():%Y%m%d-%H%M%S-%f}-{uuid.uuid4().hex[:6]}",
+            "state": "queued",
+            "params": params,
+            "submitted_at": _now(),
+            "started_at": None,
+            "finished_at": None,
+            "stages": [],
+            "stages_done": 0,
+            "stages_total": 0,
+            "current": 0,
+            "total": 0,
+            "message": "Queued",
+            "error": None,
+        }
+        _write_job(job, jobs_dir)
+        logger.info(f"Refresh job {job['id']} queued: {params}")
+    if start_worker:
+        _start_worker()
+    return job
+
+
+def _start_worker():
+    # Detached from the request; the worker exits right away if another one is draining the queue
+    kwargs = {"start_new_session": True} if sys.platform != "win32" else {}
+    subprocess.Popen([sys.executable, "-m", "refresh_jobs"], cwd=os.getcwd(),
+                     stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, **kwargs)
+
+
+# --- Worker process ---
+
+class JobProgress:
+    """Writes a running job's progress to its file (the pipeline's progress and on_stage hooks)."""
+
+    def __init__(self, job, jobs_dir=JOBS_DIR):
+        self.job = job
+        self.jobs_dir = jobs_dir
+        # progress() is called from the stage threads, on_stage() from the pipeline's loop
+        self._lock = threading.Lock()
+
+    def update(self, **fields):
+        with self._lock:
+            self.job.update(fields)
+            _write_job(self.job, self.jobs_dir)
+
+    def progress(self, current, total, message):
+        self.update(current=current, total=total, message=message)
+
+    def on_stage(self, name, event, done, total):
+        with self._lock:
+            stages = [stage for stage in self.job["stages"] if stage != name]
+        if event == "started":
+            stages.append(name)
+        self.update(stages=stages, stages_done=done, stages_total=total, message=f"Stage {name} {event}")
+
+
+def run_job(job, jobs_dir=JOBS_DIR):
+    """Run one queued job to completion and record the outcome in its file."""
+    import refresh_data
+    from parquet_utils import acquire_lock
+
+    tracker = JobProgress(job, jobs_dir)
+    tracker.update(state="running", started_at=_now(), message="Waiting for the refresh lock")
+    params = job["params"]
+    try:
+        with acquire_lock(refresh_data.LOCK_FILE, timeout=JOB_LOCK_TIMEOUT):
+            tracker.update(message="Refresh started")
+            start_date = datetime.strptime(params["start_date"], "%Y-%m-%d").date() if params["start_date"] else None
+            refresh_data.run_refresh(start_date=start_date, stream=params["stream"],
+                                     progress=tracker.progress, on_stage=tracker.on_stage)
+    except TimeoutError:
+        logger.error(f"Refresh job {job['id']}: could not acquire the refresh lock")
+        tracker.update(state="failed", finished_at=_now(), stages=[],
+                       message="Another refresh is running", error="Another refresh is running")
+        return
+    except Exception as e:
+        logger.error(f"Refresh job {job['id']} failed: {e}", exc_info=True)
+        tracker.update(state="failed", finished_at=_now(), stages=[], message="Refresh failed", error=str(e))
+        return
+    tracker.update(state="complete", finished_at=_now(), stages=[], message="Ready")
+    logger.info(f"Refresh job {job['id']} complete")
+
+
+def _prune_finished(jobs_dir=JOBS_DIR):
+    finished = [job for job in list_jobs(jobs_dir) if job["state"] not in ACTIVE_STATES]
+    for job in finished[:-MAX_FINISHED_JOBS]:
+        os.remove(os.path.join(jobs_dir, f"{job['id']}.json"))
+
+
+def _next_queued(jobs_dir=JOBS_DIR):
+    return next((job for job in list_jobs(jobs_dir) if job["state"] == "queued"), None)
+
+
+def run_worker(jobs_dir=JOBS_DIR):
+    """Run queued jobs until the queue is empty. Returns at once if another worker holds the queue."""
+    from parquet_utils import acquire_lock
+
+    os.makedirs(jobs_dir, exist_ok=True)
+    worker_lock = os.path.join(jobs_dir, os.path.basename(WORKER_LOCK))
+    # Re-checked after releasing the lock: a job queued while the lock was held by this worker
+    # may have had its own worker give up on the lock
+    while _next_queued(jobs_dir) is not None:
+        try:
+            with acquire_lock(worker_lock, timeout=0):
+                # Jobs left running by a worker that died
+                for job in list_jobs(jobs_dir):
+                    if job["state"] == "running":
+                        JobProgress(job, jobs_dir).update(state="failed", finished_at=_now(), stages=[],
+                                                          message="Refresh failed", error="The worker process exited")
+                job = _next_queued(jobs_dir)
+                while job is not None:
+                    run_job(job, jobs_dir)
+                    _prune_finished(jobs_dir)
+                    job = _next_queued(jobs_dir)
+        except TimeoutError:
+            logger.info("Another worker is running the refresh jobs.")
+            return
+
+
+if __name__ == "__main__":
+    from logging_setup import configure_logging
+    configure_logging(level="INFO", log_file="refresh.log")
+    run_worker()
@@ -0,0 +1,228 @@
+"""
+Sliding-window retention for the SHAB cache.
+
+The hot dataset (last_df.parquet and the daily shab-YYYY-MM-DD.parquet files) only keeps
+the days of the active refresh window. Older days are moved into a cold archive with one
+parquet partition per month (shab_data/archive/shab-YYYY-MM.parquet) plus an index of the
+archived days. The archive is only read when a range before the window is requested, so
+the hot dataset, and the cost of a refresh, stay constant as time goes by.
+"""
+
+import os
+import re
+import json
+import logging
+import tempfile
+from datetime import date
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from parquet_utils import safe_read_parquet, safe_write_parquet_atomic, handle_extension_type_registration
+from metrics import refresh_metrics
+
+logger = logging.getLogger(__name__)
+
+SHAB_DATA_DIR = './shab_data'
+MAIN_PARQUET = os.path.join(SHAB_DATA_DIR, 'last_df.parquet')
+ARCHIVE_DIR = os.path.join(SHAB_DATA_DIR, 'archive')
+ARCHIVE_INDEX = 'index.json'
+
+DAILY_FILE_RE = re.compile(r'^shab-(\d{4}-\d{2}-\d{2})\.parquet$')
+# Rows of last_df.parquet decoded at a time by retention
+MAIN_BATCH_ROWS = 100_000
+
+
+def _partition_path(month, archive_dir):
+    return os.path.join(archive_dir, f'shab-{month}.parquet')
+
+
+def load_archive_index(archive_dir=ARCHIVE_DIR):
+    """Archived days by month: {'YYYY-MM': ['YYYY-MM-DD', ...]}."""
+    try:
+        with open(os.path.join(archive_dir, ARCHIVE_INDEX), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_archive_index(index, archive_dir):
+    fd, temp_path = tempfile.mkstemp(dir=archive_dir, prefix="tmp_shab_", suffix=".json")
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=2, sort_keys=True)
+    os.replace(temp_path, os.path.join(archive_dir, ARCHIVE_INDEX))
+
+
+def archived_days(archive_dir=ARCHIVE_DIR):
+    """Set of dates held in the cold archive."""
+    return {date.fromisoformat(d) for days in load_archive_index(archive_dir).values() for d in days}
+
+
+def read_archive(from_date, to_date, archive_dir=ARCHIVE_DIR):
+    """
+    Read the archived rows between from_date and to_date (inclusive).
+
+    Returns:
+        DataFrame of the archived rows in the range (empty if none are archived).
+    """
+    index = load_archive_index(archive_dir)
+    first, last = from_date.strftime('%Y-%m'), to_date.strftime('%Y-%m')
+    frames = []
+    for month in sorted(m for m in index if first <= m <= last):
+        df = safe_read_parquet(_partition_path(month, archive_dir))
+        if df is not None and not df.empty:
+            frames.append(df)
+    if not frames:
+        return pd.DataFrame()
+    df = pd.concat(frames, ignore_index=True)
+    df['date'] = pd.to_datetime(df['date'])
+    return df[(df['date'].dt.date >= from_date) & (df['date'].dt.date <= to_date)].reset_index(drop=True)
+
+
+def _archive_rows(rows, days, archive_dir, index):
+    """Merge rows and the days they cover into the archive partitions (index updated in place)."""
+    if not os.path.exists(archive_dir):
+        os.makedirs(archive_dir)
+
+    if not rows.empty:
+        rows = rows.copy()
+        rows['date'] = pd.to_datetime(rows['date'])
+    months = {d.strftime('%Y-%m') for d in days}
+    for month in sorted(months):
+        month_days = sorted(d.isoformat() for d in days if d.strftime('%Y-%m') == month)
+        month_rows = rows[rows['date'].dt.strftime('%Y-%m') == month] if not rows.empty else rows
+        if not month_rows.empty:
+            path = _partition_path(month, archive_dir)
+            existing = safe_read_parquet(path)
+            if existing is not None and not existing.empty:
+                existing['date'] = pd.to_datetime(existing['date'])
+                month_rows = pd.concat([existing, month_rows], ignore_index=True)
+            if 'id' in month_rows.columns:
+                month_rows = month_rows.drop_duplicates(subset=['id'], keep='last')
+            safe_write_parquet_atomic(month_rows.sort_values('date', ignore_index=True), path)
+        index[month] = sorted(set(index.get(month, [])) | set(month_days))
+
+
+def _batch_dates(batch):
+    return pd.to_datetime(batch.column(batch.schema.get_field_index('date')).to_pandas())
+
+
+def _old_main_months(parquet_file, cutoff):
+    """Months ('YYYY-MM') of the rows before cutoff, by row group; only the date column is read."""
+    months = {}
+    for group in range(parquet_file.num_row_groups):
+        for batch in parquet_file.iter_batches(batch_size=MAIN_BATCH_ROWS, row_groups=[group], columns=['date']):
+            dates = _batch_dates(batch)
+            old = dates[dates < cutoff]
+            if not old.empty:
+                keys = (old.dt.year * 100 + old.dt.month).unique()
+                months.setdefault(group, set()).update(f"{key // 100:04d}-{key % 100:02d}" for key in keys)
+    return months
+
+
+def _read_main_month(parquet_file, month, row_groups, cutoff):
+    """The rows of one month before cutoff from the given row groups, one batch at a time."""
+    start = pd.Timestamp(f"{month}-01")
+    end = min(start + pd.offsets.MonthBegin(1), cutoff)
+    batches = []
+    for batch in parquet_file.iter_batches(batch_size=MAIN_BATCH_ROWS, row_groups=row_groups):
+        dates = _batch_dates(batch)
+        mask = ((dates >= start) & (dates < end)).to_numpy()
+        if mask.any():
+            batches.append(batch.filter(pa.array(mask)))
+    return pa.Table.from_batches(batches, schema=parquet_file.schema_arrow).to_pandas()
+
+
+def _rewrite_main(parquet_file, path, cutoff):
+    """Rewrite last_df.parquet without the rows before cutoff, one batch at a time (atomic replace)."""
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix="tmp_shab_", suffix=".parquet")
+    os.close(fd)
+    try:
+        with pq.ParquetWriter(temp_path, parquet_file.schema_arrow) as writer:
+            for batch in parquet_file.iter_batches(batch_size=MAIN_BATCH_ROWS):
+                mask = (_batch_dates(batch) >= cutoff).to_numpy()
+                if mask.any():
+                    writer.write_batch(batch.filter(pa.array(mask)))
+        refresh_metrics.inc("parquet_writes")
+        refresh_metrics.inc("parquet_bytes_written", os.path.getsize(temp_path))
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def apply_retention(window_start, data_dir=SHAB_DATA_DIR, archive_dir=ARCHIVE_DIR):
+    """
+    Move every day before window_start out of the hot dataset into the cold archive.
+
+    The days are archived one month at a time, and last_df.parquet is read and rewritten in
+    batches, so memory stays at about one month of rows however long the history is (e.g.
+    after a backfill with an earlier --start-date).
+
+    Args:
+        window_start: First day of the active window (date).
+        data_dir: Directory of last_df.parquet and the daily files.
+        archive_dir: Directory of the cold archive.
+
+    Returns:
+        Dict with the number of archived rows and daily files.
+    """
+    cutoff = pd.Timestamp(window_start)
+
+    # 1. Daily files before the window, by month
+    old_files = {}
+    for name in os.listdir(data_dir) if os.path.isdir(data_dir) else []:
+        match = DAILY_FILE_RE.match(name)
+        if match:
+            day = date.fromisoformat(match.group(1))
+            if day < window_start:
+                old_files[day] = os.path.join(data_dir, name)
+
+    # 2. Months of the aggregated file's rows before the window
+    main_parquet = os.path.join(data_dir, os.path.basename(MAIN_PARQUET))
+    main_file = None
+    main_months = {}
+    if os.path.isfile(main_parquet):
+        handle_extension_type_registration()
+        main_file = pq.ParquetFile(main_parquet)
+        main_months = _old_main_months(main_file, cutoff)
+
+    months = {day.strftime('%Y-%m') for day in old_files}
+    for group_months in main_months.values():
+        months |= group_months
+    if not months:
+        return {"archived_rows": 0, "archived_files": 0}
+
+    index = load_archive_index(archive_dir)
+    archived_rows = 0
+    for month in sorted(months):
+        month_files = {day: path for day, path in old_files.items() if day.strftime('%Y-%m') == month}
+        frames = [safe_read_parquet(path) for path in month_files.values()]
+        days = set(month_files)
+        groups = [group for group, group_months in main_months.items() if month in group_months]
+        if groups:
+            month_main = _read_main_month(main_file, month, groups, cutoff)
+            month_main['date'] = pd.to_datetime(month_main['date'])
+            frames.append(month_main)
+            days |= set(month_main['date'].dt.date)
+
+        frames = [df for df in frames if df is not None and not df.empty]
+        rows = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        if 'id' in rows.columns:
+            rows = rows.drop_duplicates(subset=['id'])
+        _archive_rows(rows, days, archive_dir, index)
+        archived_rows += len(rows)
+
+    # The archive is complete before anything is removed from the hot dataset, so an
+    # interrupted run never loses days: at worst they are archived again (deduplicated by id).
+    _save_archive_index(index, archive_dir)
+    if main_months:
+        _rewrite_main(main_file, main_parquet, cutoff)
+    for path in old_files.values():
+        os.remove(path)
+
+    logger.info(f"Retention: archived {archived_rows} rows from {len(months)} months before {window_start} "
+                f"({len(old_files)} daily files)")
+    return {"archived_rows": archived_rows, "archived_files": len(old_files)}
@@ -0,0 +1,314 @@
+"""
+Prefix search over the publication titles (company names).
+
+The refresh builds an inverted index of the normalized title tokens, one segment per month,
+in shab_data/search/:
+
+    index.json                  month -> segment file, plus the files of the previous index
+    titles-YYYY-MM-<hash>.json  the month's publications (id, date, kanton, subrubric, title),
+                                newest first, the sorted token list and a postings list per token
+
+A segment's file name carries a hash of its rows, so a refresh only rewrites the months whose
+publications changed (typically the last one). An update replaces the months of its refresh
+range only; the months before it (e.g. from a --start-date backfill) stay in the index, so
+search covers all the history that was ever refreshed. Segments are immutable; a new
+index.json is swapped in atomically and the files of the previous index are kept for readers
+that still use it.
+
+A query token matches every indexed token it is a prefix of (binary search on the sorted
+token list), and all query tokens must match. Only the segments of the requested months are
+read. The reader side is standard library only, so the Flask serving path stays light.
+"""
+
+import os
+import re
+import json
+import bisect
+import hashlib
+import logging
+import tempfile
+import threading
+import unicodedata
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+SHAB_DATA_DIR = './shab_data'
+SEARCH_DIR = os.path.join(SHAB_DATA_DIR, 'search')
+SEARCH_INDEX = 'index.json'
+SEGMENT_PREFIX = 'titles-'
+
+# Shortest query token that is matched as a prefix; shorter ones would match most titles
+MIN_PREFIX_LENGTH = 2
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+_NON_ALNUM = re.compile(r'[^0-9a-z]+')
+_SEGMENT_COLUMNS = ['id', 'date', 'kanton', 'subrubric', 'title']
+
+
+def tokenize(text):
+    """Normalized tokens of a title or query: case-folded, accents stripped, split on non-alphanumerics."""
+    if not text:
+        return []
+    text = unicodedata.normalize('NFKD', text.casefold()).encode('ascii', 'ignore').decode('ascii')
+    return [token for token in _NON_ALNUM.split(text) if token]
+
+
+def load_search_index(index_dir=SEARCH_DIR):
+    """The index manifest ({"months": {month: file}, "previous": [...]}), or None if none was built."""
+    try:
+        with open(os.path.join(index_dir, SEARCH_INDEX), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json_atomic(obj, path):
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix="tmp_shab_", suffix=".json")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            # json.dumps uses the C encoder; json.dump streams through the pure-Python one
+            f.write(json.dumps(obj, ensure_ascii=False, separators=(',', ':')))
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+# --- Building (refresh side) ---
+
+def _month_keys(df):
+    """Month of every row as a YYYYMM integer (cheaper than formatting every date)."""
+    dates = df['date']
+    return (dates.dt.year * 100 + dates.dt.month).to_numpy()
+
+
+def _segment_hashes(df, keys):
+    """Order-independent hash of each month's rows: {month key: hex digest}."""
+    import numpy as np
+    import pandas as pd
+
+    row_hashes = pd.util.hash_pandas_object(df[_SEGMENT_COLUMNS], index=False).to_numpy()
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    xors = np.bitwise_xor.reduceat(row_hashes[order], starts)
+    counts = np.diff(np.r_[starts, len(order)])
+    return {
+        int(key): hashlib.sha256(f"{int(x)}:{int(n)}".encode('utf-8')).hexdigest()[:16]
+        for key, x, n in zip(sorted_keys[starts], xors, counts)
+    }
+
+
+def build_segment(month, rows):
+    """The search segment (JSON-ready dict) of one month's publications."""
+    rows = rows.sort_values(['date', 'id'], ascending=[False, True])
+    titles = rows['title'].astype(str).tolist()
+    postings = defaultdict(list)
+    for i, title in enumerate(titles):
+        for token in set(tokenize(title)):
+            postings[token].append(i)
+    terms = sorted(postings)
+    return {
+        "month": month,
+        "ids": rows['id'].astype(str).tolist(),
+        "dates": rows['date'].dt.strftime('%Y-%m-%d').tolist(),
+        "kantone": rows['kanton'].astype(str).tolist(),
+        "subrubrics": rows['subrubric'].astype(str).tolist(),
+        "titles": titles,
+        "terms": terms,
+        "postings": [postings[term] for term in terms],
+    }
+
+
+class SearchIndexUpdate:
+    """
+    Incremental update of the title index, fed with the SHAB rows in one or more chunks
+    (each month wholly within one chunk), e.g. one month at a time by a streaming refresh.
+
+    Args:
+        index_dir: Directory of the index.
+        start_date, end_date: The refresh range. The indexed months outside it are kept;
+            without a range, the months between the first and last month added are replaced.
+    """
+
+    def __init__(self, index_dir=SEARCH_DIR, start_date=None, end_date=None):
+        self.index_dir = index_dir
+        self.range = (start_date.strftime('%Y-%m'), end_date.strftime('%Y-%m')) if start_date and end_date else None
+        self.previous = load_search_index(index_dir) or {"months": {}}
+        self.months = {}
+        self.written = 0
+
+    def add(self, rows):
+        """Index the months in `rows`, rewriting only the segments whose rows changed."""
+        if rows.empty:
+            return
+        if not os.path.exists(self.index_dir):
+            os.makedirs(self.index_dir)
+
+        import pandas as pd
+
+        df = rows[_SEGMENT_COLUMNS].copy()
+        if not pd.api.types.is_datetime64_any_dtype(df['date']):
+            df['date'] = pd.to_datetime(df['date'], errors='coerce')
+        df = df.dropna(subset=['date'])
+        keys = _month_keys(df)
+
+        for key, digest in sorted(_segment_hashes(df, keys).items()):
+            month = f"{key // 100:04d}-{key % 100:02d}"
+            file_name = f"{SEGMENT_PREFIX}{month}-{digest}.json"
+            self.months[month] = file_name
+            if self.previous["months"].get(month) == file_name and os.path.isfile(os.path.join(self.index_dir, file_name)):
+                continue
+            _write_json_atomic(build_segment(month, df[keys == key]), os.path.join(self.index_dir, file_name))
+            self.written += 1
+
+    def finish(self):
+        """
+        Publish the new index.json. Without any indexed rows the current index is kept.
+
+        Returns:
+            Number of month segments that were (re)written.
+        """
+        if not self.months:
+            logger.warning("No SHAB rows were indexed. Keeping the search index as it is.")
+            return 0
+        first, last = self.range or (min(self.months), max(self.months))
+        for month, file_name in self.previous["months"].items():
+            if (month < first or month > last) and os.path.isfile(os.path.join(self.index_dir, file_name)):
+                self.months[month] = file_name
+        self.months = dict(sorted(self.months.items()))
+        if self.written or self.months != self.previous["months"]:
+            # Files of the index being replaced stay on disk until the next update
+            replaced = sorted(set(self.previous["months"].values()) - set(self.months.values()))
+            _write_json_atomic({"months": self.months, "previous": replaced}, os.path.join(self.index_dir, SEARCH_INDEX))
+            keep = set(self.months.values()) | set(replaced)
+            for name in os.listdir(self.index_dir):
+                if name.startswith(SEGMENT_PREFIX) and name not in keep:
+                    os.remove(os.path.join(self.index_dir, name))
+            logger.info(f"Search index: {self.written} of {len(self.months)} month segments rewritten")
+        else:
+            logger.info("Search index unchanged.")
+        return self.written
+
+
+def update_search_index(df_shab, index_dir=SEARCH_DIR, start_date=None, end_date=None):
+    """
+    Bring the title index up to date with df_shab, rebuilding only the months whose rows changed.
+
+    Args:
+        df_shab: SHAB rows of the refresh range (id, date, kanton, subrubric, title).
+        index_dir: Directory of the index.
+        start_date, end_date: The refresh range (see SearchIndexUpdate).
+
+    Returns:
+        Number of month segments that were (re)written.
+    """
+    update = SearchIndexUpdate(index_dir, start_date, end_date)
+    update.add(df_shab)
+    return update.finish()
+
+
+# --- Querying (Flask side) ---
+
+class TitleIndex:
+    """
+    Read side of the title index. Reloads index.json when it changes on disk and loads the
+    month segments on first use; segments no longer in the index are dropped.
+    """
+
+    def __init__(self, index_dir=SEARCH_DIR):
+        self.index_dir = index_dir
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._months = None
+        self._segments = {}
+
+    def _current_months(self):
+        path = os.path.join(self.index_dir, SEARCH_INDEX)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return None
+        with self._lock:
+            if mtime != self._mtime:
+                index = load_search_index(self.index_dir)
+                if index is None:
+                    # Being replaced; keep serving the index we have
+                    return self._months
+                self._months = index["months"]
+                self._mtime = mtime
+                live = set(self._months.values())
+                self._segments = {name: seg for name, seg in self._segments.items() if name in live}
+            return self._months
+
+    def _segment(self, file_name):
+        segment = self._segments.get(file_name)
+        if segment is None:
+            with open(os.path.join(self.index_dir, file_name), 'r', encoding='utf-8') as f:
+                segment = json.load(f)
+            with self._lock:
+                self._segments[file_name] = segment
+        return segment
+
+    @staticmethod
+    def _match(segment, tokens):
+        terms, postings = segment["terms"], segment["postings"]
+        matched = None
+        for token in tokens:
+            lo = bisect.bisect_left(terms, token)
+            hi = bisect.bisect_left(terms, token + '\x7f')
+            docs = set()
+            for posting in postings[lo:hi]:
+                docs.update(posting)
+            matched = docs if matched is None else matched & docs
+            if not matched:
+                return []
+        return sorted(matched)
+
+    def search(self, query, kantone=None, date_from=None, date_to=None, limit=DEFAULT_LIMIT):
+        """
+        Publications whose title matches every token of `query` (as a prefix), newest first.
+
+        Args:
+            query: Search text, e.g. a (partial) company name.
+            kantone: Canton codes to restrict to, or None.
+            date_from: First month ('YYYY-MM'), or None.
+            date_to: Last month ('YYYY-MM'), or None.
+            limit: Maximum number of publications returned.
+
+        Returns:
+            {"query", "total", "results": [{id, date, kanton, subrubric, title}, ...]},
+            or None if no index has been built yet.
+
+        Raises:
+            ValueError: If the query has no token of at least MIN_PREFIX_LENGTH characters.
+        """
+        tokens = sorted(set(tokenize(query)), key=len, reverse=True)
+        if not tokens or len(tokens[0]) < MIN_PREFIX_LENGTH:
+            raise ValueError(f"The query needs a word of at least {MIN_PREFIX_LENGTH} characters")
+        months = self._current_months()
+        if months is None:
+            return None
+
+        kantone = set(kantone) if kantone else None
+        results, total = [], 0
+        for month in sorted(months, reverse=True):
+            if (date_from and month < date_from) or (date_to and month > date_to):
+                continue
+            segment = self._segment(months[month])
+            for i in self._match(segment, tokens):
+                if kantone is not None and segment["kantone"][i] not in kantone:
+                    continue
+                total += 1
+                if len(results) < limit:
+                    results.append({
+                        "id": segment["ids"][i],
+                        "date": segment["dates"][i],
+                        "kanton": segment["kantone"][i],
+                        "subrubric": segment["subrubrics"][i],
+                        "title": segment["titles"][i],
+                    })
+        return {"query": query, "total": total, "results": results}
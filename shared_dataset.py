@@ -0,0 +1,224 @@
+"""
+Memory-mapped dataset shared by all Flask worker processes.
+
+The refresh publishes the aggregated monthly cube and the merged UDEMO table into a single
+binary file in shab_data/. Workers map that file read-only and build NumPy views directly on
+the mapping, so every worker shares the same physical pages (the OS page cache) and attaching
+costs neither a copy nor a parse.
+
+File layout:
+    8 bytes   magic (b"SHABDS01")
+    4 bytes   header length, little-endian uint32
+    N bytes   JSON header (layout, labels, data_version)
+    padding   up to a 64-byte boundary
+    arrays    each one 64-byte aligned, at the offsets listed in the header
+"""
+
+import os
+import glob
+import json
+import mmap
+import struct
+import logging
+import tempfile
+
+import numpy as np
+
+from cantons import VALID_CANTONS
+from subrubrics import DEFAULT_METRICS, metric_order
+
+logger = logging.getLogger(__name__)
+
+SHAB_DATA_DIR = './shab_data'
+DATASET_PREFIX = 'dataset-'
+DATASET_MAGIC = b"SHABDS01"
+ALIGN = 64
+
+# Datasets kept on disk besides the newest one, for workers that haven't swapped yet
+KEEP_PREVIOUS = 1
+
+# Metric axis of the cube by default; the all-subrubrics mode appends the other subrubrics
+CUBE_METRICS = DEFAULT_METRICS
+CUBE_GEOS = ["CH"] + sorted(VALID_CANTONS)
+
+
+def _align(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+def build_cube(monthly):
+    """
+    Build the dense (metric, geo, month) count cube from the long-format monthly frame
+    written by dashboard_data.export_dashboard_data.
+
+    Returns:
+        (cube, months, metrics): int64 array of shape (len(metrics), len(CUBE_GEOS), len(months)),
+        the sorted list of month labels ('YYYY-MM-DD') and the metric labels (CUBE_METRICS,
+        followed by any other subrubric in the frame).
+    """
+    months = sorted(monthly["month"].unique().tolist())
+    metrics = metric_order(monthly["hr"].dropna().unique())
+    month_pos = {m: i for i, m in enumerate(months)}
+    geo_pos = {g: i for i, g in enumerate(CUBE_GEOS)}
+    metric_pos = {m: i for i, m in enumerate(metrics)}
+
+    geo = np.where(monthly["geo"].to_numpy() == "CH", "CH", monthly["kanton"].to_numpy())
+    m_idx = monthly["month"].map(month_pos).to_numpy()
+    g_idx = np.array([geo_pos.get(g, -1) for g in geo], dtype=np.int64)
+    h_idx = monthly["hr"].map(metric_pos).fillna(-1).to_numpy(dtype=np.int64)
+    valid = (g_idx >= 0) & (h_idx >= 0)
+
+    cube = np.zeros((len(metrics), len(CUBE_GEOS), len(months)), dtype=np.int64)
+    cube[h_idx[valid], g_idx[valid], m_idx[valid].astype(np.int64)] = monthly["count"].to_numpy()[valid]
+    return cube, months, metrics
+
+
+def _udemo_arrays(udemo):
+    geo_pos = {g: i for i, g in enumerate(CUBE_GEOS)}
+    births = udemo["bfs_births"] if "bfs_births" in udemo.columns else np.nan
+    return {
+        "udemo_kanton": udemo["kanton"].map(geo_pos).fillna(-1).to_numpy(dtype=np.int16),
+        "udemo_year": udemo["year"].to_numpy(dtype=np.int32),
+        "udemo_shab_events": udemo["shab_events"].to_numpy(dtype=np.int64),
+        "udemo_bfs_births": np.broadcast_to(np.asarray(births, dtype=np.float64), len(udemo)).copy(),
+    }
+
+
+def publish_dataset(monthly, udemo=None, data_version=None, data_dir=SHAB_DATA_DIR):
+    """
+    Write the shared dataset file for `data_version` and remove outdated ones.
+
+    Args:
+        monthly: Long-format monthly frame (month, geo, kanton, hr, count).
+        udemo: Merged UDEMO frame (kanton, year, shab_events, bfs_births), or None.
+        data_version: Version the dataset belongs to (used in the file name).
+        data_dir: Directory to write into.
+
+    Returns:
+        The file name (relative to data_dir) of the published dataset.
+    """
+    cube, months, metrics = build_cube(monthly)
+    arrays = {"cube": cube}
+    if udemo is not None and not udemo.empty:
+        arrays.update(_udemo_arrays(udemo))
+
+    layout = {}
+    offset = 0
+    for name, arr in arrays.items():
+        arr = np.ascontiguousarray(arr)
+        arrays[name] = arr
+        layout[name] = {"dtype": arr.dtype.str, "shape": list(arr.shape), "offset": offset}
+        offset = _align(offset + arr.nbytes)
+
+    header = json.dumps({
+        "data_version": data_version,
+        "arrays": layout,
+        "labels": {"metrics": metrics, "geos": CUBE_GEOS, "months": months},
+    }).encode("utf-8")
+    data_start = _align(len(DATASET_MAGIC) + 4 + len(header))
+
+    if not os.path.exists(data_dir):
+        os.makedirs(data_dir)
+    file_name = f"{DATASET_PREFIX}{data_version}.bin"
+    path = os.path.join(data_dir, file_name)
+
+    fd, temp_path = tempfile.mkstemp(dir=data_dir, prefix="tmp_shab_", suffix=".bin")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(DATASET_MAGIC)
+            f.write(struct.pack("<I", len(header)))
+            f.write(header)
+            for name, arr in arrays.items():
+                f.seek(data_start + layout[name]["offset"])
+                f.write(arr.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    logger.info(f"Published shared dataset {path} ({data_start + offset} bytes)")
+    _remove_old_datasets(data_dir, keep=path)
+    return file_name
+
+
+def _remove_old_datasets(data_dir, keep):
+    paths = sorted(glob.glob(os.path.join(data_dir, f"{DATASET_PREFIX}*.bin")), key=os.path.getmtime, reverse=True)
+    old = [p for p in paths if os.path.abspath(p) != os.path.abspath(keep)][KEEP_PREVIOUS:]
+    for path in old:
+        try:
+            os.remove(path)
+        except OSError:
+            # Still mapped by a worker (Windows); retried on the next publish
+            pass
+
+
+class SharedDataset:
+    """
+    Read-only view of a published dataset file.
+    All arrays are NumPy views on a shared read-only mapping; nothing is copied.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._mmap[:len(DATASET_MAGIC)] != DATASET_MAGIC:
+            raise ValueError(f"{path} is not a shared dataset file")
+        (header_len,) = struct.unpack_from("<I", self._mmap, len(DATASET_MAGIC))
+        header_start = len(DATASET_MAGIC) + 4
+        self.header = json.loads(self._mmap[header_start:header_start + header_len])
+        data_start = _align(header_start + header_len)
+
+        self.arrays = {}
+        for name, spec in self.header["arrays"].items():
+            dtype = np.dtype(spec["dtype"])
+            count = int(np.prod(spec["shape"]))
+            arr = np.frombuffer(self._mmap, dtype=dtype, count=count, offset=data_start + spec["offset"])
+            self.arrays[name] = arr.reshape(spec["shape"])
+
+        labels = self.header["labels"]
+        self.data_version = self.header.get("data_version")
+        self.metrics = labels["metrics"]
+        self.geos = labels["geos"]
+        self.months = labels["months"]
+        self.cube = self.arrays["cube"]
+
+    def series(self, metric, geo="CH"):
+        """Monthly counts for one metric and geo ('CH' or a canton code), aligned to self.months."""
+        return self.cube[self.metrics.index(metric), self.geos.index(geo)]
+
+    @property
+    def has_udemo(self):
+        return "udemo_kanton" in self.arrays
+
+    def udemo_records(self):
+        """The merged UDEMO table as JSON-ready records (NaN -> None)."""
+        if not self.has_udemo:
+            return None
+        births = self.arrays["udemo_bfs_births"]
+        return [
+            {
+                "kanton": self.geos[k] if k >= 0 else None,
+                "year": int(y),
+                "shab_events": int(e),
+                "bfs_births": None if np.isnan(b) else float(b),
+            }
+            for k, y, e, b in zip(
+                self.arrays["udemo_kanton"].tolist(),
+                self.arrays["udemo_year"].tolist(),
+                self.arrays["udemo_shab_events"].tolist(),
+                births.tolist(),
+            )
+        ]
+
+
+def attach_dataset(file_name, data_dir=SHAB_DATA_DIR):
+    """Map a published dataset read-only. Returns None if the file does not exist."""
+    path = os.path.join(data_dir, file_name)
+    if not os.path.isfile(path):
+        return None
+    return SharedDataset(path)
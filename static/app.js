@@ -1,7 +1,7 @@
 
 // State
 const state = {
-    metric: "NET", // HR01, HR03, NET
+    metric: "NET", // HR01, HR03, NET, or another subrubric in the all-subrubrics mode
     measure: "count",
     geoMode: "CH", // CH, KT
     selectedCanton: null, // "ZH" etc.
@@ -9,10 +9,10 @@ const state = {
     compare: false,
     months: [],
     cantons: [],
-    data: []
+    metrics: []
 };
 
-// Data Indices
+// Data Indices (views into the typed arrays built by data_worker.js)
 let indexByKantonMetric = {}; // [kanton][hr] -> array of values aligned to months
 let indexByCHMetric = {};     // [hr] -> array of values aligned to months
 
@@ -22,11 +22,10 @@ document.addEventListener("DOMContentLoaded", async () => {
 
     try {
         const version = await loadStatus();
-        await loadDimensions(version);
-        await loadData(version);
+        const dataset = await loadDataset(version);
 
+        processData(dataset);
         initControls();
-        processData();
         render();
 
         updateStatus("Ready");
@@ -58,34 +57,30 @@ async function loadStatus() {
     return null;
 }
 
-async function loadDimensions(version) {
-    let url = "/static/data/dimensions.json";
-    if (version) url += `?v=${version}`;
-    const resp = await fetch(url);
-    if (!resp.ok) throw new Error("Missing dimensions.json");
-    const dims = await resp.json();
-
-    state.months = dims.months;
-    state.cantons = dims.cantons;
-
-    // Default canton
-    if (state.cantons.length > 0) {
-        state.selectedCanton = state.cantons[0];
-    }
-}
-
-async function loadData(version) {
-    let url = "/static/data/shab_monthly.json";
-    if (version) url += `?v=${version}`;
-    const resp = await fetch(url);
-    if (!resp.ok) throw new Error("Missing shab_monthly.json");
-    state.data = await resp.json();
+// Fetching and indexing run in a Web Worker; the indexed result is cached in IndexedDB
+// per data_version, so a repeat visit with unchanged data transfers nothing.
+function loadDataset(version) {
+    return new Promise((resolve, reject) => {
+        const worker = new Worker("/static/data_worker.js");
+        worker.onmessage = (event) => {
+            worker.terminate();
+            const { ok, cached, dataset, error } = event.data;
+            if (!ok) return reject(new Error(error));
+            if (cached) console.info(`Dashboard data ${version} loaded from the local cache`);
+            resolve(dataset);
+        };
+        worker.onerror = (event) => {
+            worker.terminate();
+            reject(new Error(event.message || "Data worker failed"));
+        };
+        worker.postMessage({ version });
+    });
 }
 
 function initControls() {
     // Metrics
     const metricContainer = document.getElementById("metric-controls");
-    ["NET", "HR01", "HR03"].forEach(m => {
+    ["NET", ...state.metrics.filter(m => m !== "NET")].forEach(m => {
         const btn = document.createElement("button");
         btn.textContent = m;
         if (m === state.metric) btn.classList.add("active");
@@ -154,38 +149,28 @@ function toggleCantonSelector() {
     el.style.display = state.geoMode === "KT" ? "block" : "none";
 }
 
-function processData() {
-    // Build fast lookup indices
-    // Initialize structure
-    state.cantons.forEach(kt => {
-        indexByKantonMetric[kt] = {};
-        ["HR01", "HR03", "NET"].forEach(hr => {
-            indexByKantonMetric[kt][hr] = new Array(state.months.length).fill(0);
-        });
-    });
-
-    ["HR01", "HR03", "NET"].forEach(hr => {
-        indexByCHMetric[hr] = new Array(state.months.length).fill(0);
-    });
-
-    // Map month string to index
-    const monthMap = new Map();
-    state.months.forEach((m, i) => monthMap.set(m, i));
+function processData(dataset) {
+    state.months = dataset.months;
+    state.cantons = dataset.cantons;
+    state.metrics = dataset.metrics;
 
-    // Fill indices
-    state.data.forEach(row => {
-        const mIdx = monthMap.get(row.month);
-        if (mIdx === undefined) return;
+    // Default canton
+    if (state.cantons.length > 0) {
+        state.selectedCanton = state.cantons[0];
+    }
 
-        if (row.geo === "CH") {
-            if (indexByCHMetric[row.hr]) {
-                indexByCHMetric[row.hr][mIdx] = row.count;
-            }
-        } else if (row.geo === "KT" && row.kanton) {
-            if (indexByKantonMetric[row.kanton] && indexByKantonMetric[row.kanton][row.hr]) {
-                indexByKantonMetric[row.kanton][row.hr][mIdx] = row.count;
-            }
-        }
+    // Per-metric views into the flat arrays (see data_worker.js for the layout)
+    const nMonths = state.months.length;
+    const nMetrics = state.metrics.length;
+    state.metrics.forEach((hr, m) => {
+        indexByCHMetric[hr] = dataset.ch.subarray(m * nMonths, (m + 1) * nMonths);
+    });
+    state.cantons.forEach((kt, k) => {
+        indexByKantonMetric[kt] = {};
+        state.metrics.forEach((hr, m) => {
+            const offset = (k * nMetrics + m) * nMonths;
+            indexByKantonMetric[kt][hr] = dataset.kt.subarray(offset, offset + nMonths);
+        });
     });
 }
 
@@ -309,7 +294,7 @@ function renderHeatmap(months, startIdx) {
     const rowsData = [];
 
     state.cantons.forEach(kt => {
-        const row = indexByKantonMetric[kt][state.metric].slice(startIdx);
+        const row = Array.from(indexByKantonMetric[kt][state.metric].subarray(startIdx));
         const sum = row.reduce((a, b) => a + b, 0);
 
         // Update global min/max
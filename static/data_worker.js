@@ -0,0 +1,114 @@
+// Dashboard data worker: fetches dimensions.json and shab_monthly.json, builds the
+// month-aligned value arrays off the main thread and keeps the result in IndexedDB,
+// keyed by data_version, so repeat visits skip both the download and the indexing.
+//
+// Request:  { version }  (data_version from /api/status, or null)
+// Response: { ok: true, cached, dataset } or { ok: false, error }
+//
+// dataset = { version, months, cantons, metrics, ch, kt } where
+//   ch: Float64Array, value of metric m in month i at  ch[m * months + i]
+//   kt: Float64Array, value for canton k at            kt[(k * metrics + m) * months + i]
+
+const DB_NAME = "shab-dashboard";
+const DB_STORE = "datasets";
+const DB_VERSION = 1;
+
+self.onmessage = async (event) => {
+    const version = event.data.version;
+    try {
+        const db = version ? await openDb() : null;
+        let dataset = db ? await readDataset(db, version) : null;
+        const cached = Boolean(dataset);
+        if (!dataset) {
+            dataset = await buildDataset(version);
+            if (db) await storeDataset(db, dataset);
+        }
+        self.postMessage({ ok: true, cached, dataset }, [dataset.ch.buffer, dataset.kt.buffer]);
+    } catch (e) {
+        self.postMessage({ ok: false, error: e.message });
+    }
+};
+
+async function fetchJson(name, version) {
+    let url = `/static/data/${name}`;
+    if (version) url += `?v=${version}`;
+    const resp = await fetch(url);
+    if (!resp.ok) throw new Error(`Missing ${name}`);
+    return resp.json();
+}
+
+async function buildDataset(version) {
+    const [dims, rows] = await Promise.all([
+        fetchJson("dimensions.json", version),
+        fetchJson("shab_monthly.json", version),
+    ]);
+    const months = dims.months;
+    const cantons = dims.cantons;
+    // HR01, HR03, NET, followed by the other subrubrics when all of them are ingested
+    const metrics = dims.metrics || ["HR01", "HR03", "NET"];
+
+    const monthIndex = new Map(months.map((m, i) => [m, i]));
+    const metricIndex = new Map(metrics.map((m, i) => [m, i]));
+    const cantonIndex = new Map(cantons.map((k, i) => [k, i]));
+    const nMonths = months.length;
+    const ch = new Float64Array(metrics.length * nMonths);
+    const kt = new Float64Array(cantons.length * metrics.length * nMonths);
+
+    for (const row of rows) {
+        const i = monthIndex.get(row.month);
+        const m = metricIndex.get(row.hr);
+        if (i === undefined || m === undefined) continue;
+        if (row.geo === "CH") {
+            ch[m * nMonths + i] = row.count;
+        } else if (row.geo === "KT") {
+            const k = cantonIndex.get(row.kanton);
+            if (k !== undefined) kt[(k * metrics.length + m) * nMonths + i] = row.count;
+        }
+    }
+    return { version, months, cantons, metrics, ch, kt };
+}
+
+// --- IndexedDB ---
+// The cache is best-effort: without IndexedDB (e.g. private browsing) the data is fetched every time.
+
+function openDb() {
+    return new Promise((resolve) => {
+        if (!self.indexedDB) return resolve(null);
+        const req = indexedDB.open(DB_NAME, DB_VERSION);
+        req.onupgradeneeded = () => req.result.createObjectStore(DB_STORE, { keyPath: "version" });
+        req.onsuccess = () => resolve(req.result);
+        req.onerror = () => resolve(null);
+        req.onblocked = () => resolve(null);
+    });
+}
+
+function readDataset(db, version) {
+    return new Promise((resolve) => {
+        try {
+            const req = db.transaction(DB_STORE, "readonly").objectStore(DB_STORE).get(version);
+            req.onsuccess = () => resolve(req.result || null);
+            req.onerror = () => resolve(null);
+        } catch (e) {
+            resolve(null);
+        }
+    });
+}
+
+function storeDataset(db, dataset) {
+    // Only the current data_version is kept
+    return new Promise((resolve) => {
+        try {
+            const tx = db.transaction(DB_STORE, "readwrite");
+            const store = tx.objectStore(DB_STORE);
+            store.getAllKeys().onsuccess = (event) => {
+                event.target.result.filter(key => key !== dataset.version).forEach(key => store.delete(key));
+            };
+            store.put(dataset);
+            tx.oncomplete = () => resolve();
+            tx.onerror = () => resolve();
+            tx.onabort = () => resolve();
+        } catch (e) {
+            resolve();
+        }
+    });
+}
@@ -0,0 +1,36 @@
+"""
+Handelsregister (HR) subrubrics of SHAB publications.
+
+By default only HR01 (new entries) and HR03 (deletions) are ingested, which is what the
+dashboard has always shown. The opt-in all-subrubrics mode (refresh_data.py --all-subrubrics)
+keeps every HR subrubric (mutations, ...), roughly ten times the rows. Its SHAB cache (hot
+dataset, daily files and archive) lives in a directory of its own, so switching modes never
+mixes filtered and unfiltered days.
+
+Dependency-free, like cantons.py, so the Flask serving path can import it.
+"""
+
+import os
+
+SHAB_DATA_DIR = './shab_data'
+ALL_SUBRUBRICS_DIR = os.path.join(SHAB_DATA_DIR, 'all_subrubrics')
+
+DEFAULT_SUBRUBRICS = ("HR01", "HR03")
+# HR01 - HR03
+NET_METRIC = "NET"
+DEFAULT_METRICS = [*DEFAULT_SUBRUBRICS, NET_METRIC]
+
+
+def cache_dir(all_subrubrics=False):
+    """Directory of the SHAB cache (last_df.parquet, daily files, archive/) of an ingestion mode."""
+    return ALL_SUBRUBRICS_DIR if all_subrubrics else SHAB_DATA_DIR
+
+
+def is_hr_subrubric(code):
+    """True for HR subrubric codes ('HR01', 'HR02', ...); False for missing values ('--')."""
+    return isinstance(code, str) and code.upper().startswith("HR")
+
+
+def metric_order(codes):
+    """Metric labels in display order: HR01, HR03, NET, then the other subrubrics sorted."""
+    return DEFAULT_METRICS + sorted(set(codes) - set(DEFAULT_METRICS))
@@ -0,0 +1,83 @@
+"""
+A --stream refresh writes daily files but not last_df.parquet; a regular refresh that
+follows it must still return every day of the range (and the other way round).
+
+Run with: pipenv run pytest test_stream_refresh.py
+"""
+
+import re
+from datetime import date
+
+import pandas as pd
+import pytest
+
+import app
+from benchmarks.synthetic import make_shab_xml_pages
+
+ROWS_PER_DAY = 20
+
+
+class _Response:
+    def __init__(self, content):
+        self.content = content
+        self.status_code = 200
+        self.raw = None
+
+    def raise_for_status(self):
+        pass
+
+
+class _SyntheticSession:
+    """Serves synthetic amtsblattportal pages and counts the days requested."""
+
+    def __init__(self):
+        self.days = set()
+
+    def get(self, url, **kwargs):
+        day = re.search(r'publicationDate.start=([\d-]+)', url).group(1)
+        page = int(url.rsplit('pageRequest.page=', 1)[1])
+        self.days.add(day)
+        pages = make_shab_xml_pages(pd.Timestamp(day).date(), ROWS_PER_DAY, seed=int(day.replace('-', '')))
+        return _Response(pages[min(page, len(pages) - 1)])
+
+
+@pytest.fixture
+def session(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    fake = _SyntheticSession()
+    monkeypatch.setattr(app, "get_session", lambda: fake)
+    return fake
+
+
+def _stream(from_date, to_date):
+    return pd.concat([df for _, df in app.iter_shab_months(from_date, to_date)], ignore_index=True)
+
+
+def _days(df):
+    return sorted(set(df['date'].dt.date))
+
+
+def test_regular_refresh_after_stream_keeps_streamed_days(session):
+    app.Get_Shab_DF_from_range(date(2024, 1, 1), date(2024, 1, 10))
+    _stream(date(2024, 1, 1), date(2024, 1, 20))
+
+    session.days.clear()
+    df = app.Get_Shab_DF_from_range(date(2024, 1, 1), date(2024, 1, 20))
+
+    assert _days(df) == list(app.daterange(date(2024, 1, 1), date(2024, 1, 20)))
+    # The streamed days come from their daily files, not from the API
+    assert session.days == set()
+    last_df = pd.read_parquet("shab_data/last_df.parquet")
+    assert pd.to_datetime(last_df['date']).dt.date.nunique() == 20
+
+
+def test_stream_after_regular_refresh_sees_every_day(session):
+    _stream(date(2024, 1, 11), date(2024, 1, 20))
+    regular = app.Get_Shab_DF_from_range(date(2024, 1, 1), date(2024, 1, 20))
+
+    session.days.clear()
+    streamed = _stream(date(2024, 1, 1), date(2024, 1, 20))
+
+    assert session.days == set()
+    assert sorted(streamed['id']) == sorted(regular['id'])
+    assert _days(streamed) == list(app.daterange(date(2024, 1, 1), date(2024, 1, 20)))
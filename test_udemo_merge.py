@@ -0,0 +1,72 @@
+"""
+BFS revisions stored by a run that did not reach the UDEMO merge (--only bfs_fetch, or a
+refresh that failed after bfs_fetch) must still reach udemo_merged.parquet on the next merge.
+
+Run with: pipenv run pytest test_udemo_merge.py
+"""
+
+from datetime import date
+
+import pandas as pd
+import pytest
+
+import refresh_data
+import udemo_store
+from artifacts import ArtifactManifest
+from benchmarks.synthetic import make_shab_df, make_udemo_observations
+
+YEARS = [2024, 2025]
+
+
+@pytest.fixture
+def ctx(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "shab_data").mkdir()
+    return {
+        "start_date": date(2024, 1, 1),
+        "end_date": date(2025, 12, 31),
+        "df_shab": make_shab_df(date(2024, 1, 1), date(2025, 12, 31), rows_per_day=5),
+        "manifest": ArtifactManifest(str(tmp_path / "shab_data" / "artifacts.json")),
+    }
+
+
+def _serve(monkeypatch, observations):
+    def fetch_udemo(observation_text, years, **kwargs):
+        return observations[observations["Jahr"].isin(years)]
+    monkeypatch.setattr(udemo_store, "fetch_udemo", fetch_udemo)
+
+
+def _merged_births():
+    merged = pd.read_parquet(refresh_data.UDEMO_MERGED_FILE)
+    return merged.set_index(["kanton", "year"])["bfs_births"].sort_index()
+
+
+def test_bfs_revision_from_an_earlier_fetch_reaches_the_merge(ctx, monkeypatch):
+    _serve(monkeypatch, make_udemo_observations(YEARS, seed=1))
+    refresh_data.merge_bfs({**ctx, **refresh_data.fetch_bfs(ctx)})
+
+    # --only bfs_fetch: the revised figures are stored, the merged table is not touched
+    _serve(monkeypatch, make_udemo_observations(YEARS, seed=2))
+    refresh_data.fetch_bfs(ctx)
+
+    # The next refresh merges the stored figures; nothing changes in the store this time
+    result = refresh_data.merge_bfs({**ctx, **refresh_data.restore_bfs(ctx)})
+
+    assert result["udemo_changed"]
+    expected = udemo_store.aggregate_births(udemo_store.stored_observations(refresh_data.UDEMO_OBSERVATION, YEARS))
+    merged = _merged_births()
+    expected = expected.set_index(["kanton", "year"])["bfs_births"].reindex(merged.index)
+    pd.testing.assert_series_equal(merged, expected, check_dtype=False)
+
+
+def test_unchanged_inputs_recompute_no_row(ctx, monkeypatch, caplog):
+    _serve(monkeypatch, make_udemo_observations(YEARS, seed=1))
+    refresh_data.merge_bfs({**ctx, **refresh_data.fetch_bfs(ctx)})
+    previous = pd.read_parquet(refresh_data.UDEMO_MERGED_FILE)
+
+    bfs_births = udemo_store.aggregate_births(refresh_data.restore_bfs(ctx)["df_bfs"])
+    with caplog.at_level("INFO", logger="udemo_store"):
+        merged = udemo_store.merge_udemo(refresh_data.shab_events_by_year(ctx["df_shab"]), bfs_births, previous=previous)
+
+    assert f"0 rows updated, {len(previous)} unchanged" in caplog.text
+    pd.testing.assert_frame_equal(merged, previous, check_dtype=False)
@@ -0,0 +1,157 @@
+"""
+Local store of BFS UDEMO observations and the incremental SHAB/UDEMO merge.
+
+Observations are stored by observation unit and year in shab_data/udemo_store.parquet.
+A refresh only asks BFS for years that are missing from the store, plus the most recent
+years, whose figures BFS still publishes as provisional. The merged table is then updated
+only for the (kanton, year) rows whose SHAB count or BFS births differ from the published table.
+"""
+
+import os
+import logging
+from datetime import date
+
+import pandas as pd
+
+from bfs_pxweb import fetch_udemo, CANTON_ABBR_TO_LABEL
+from parquet_utils import safe_read_parquet, safe_write_parquet_atomic
+
+logger = logging.getLogger(__name__)
+
+SHAB_DATA_DIR = './shab_data'
+UDEMO_STORE_FILE = os.path.join(SHAB_DATA_DIR, 'udemo_store.parquet')
+
+# Years (counting back from the current one) whose BFS figures may still be revised
+PROVISIONAL_YEARS = 2
+
+STORE_COLUMNS = ['Beobachtungseinheit', 'Kanton', 'Rechtsform', 'Jahr', 'value']
+MERGE_KEYS = ["kanton", "year"]
+
+
+def load_store(path=UDEMO_STORE_FILE):
+    store = safe_read_parquet(path)
+    if store is None:
+        return pd.DataFrame(columns=STORE_COLUMNS)
+    return store
+
+
+def years_to_fetch(store, observation_text, years, today=None):
+    """Years from `years` that are missing from the store for this observation unit, or provisional."""
+    today = today or date.today()
+    stored = store.loc[store['Beobachtungseinheit'] == observation_text, 'Jahr']
+    stored_years = set(pd.to_numeric(stored, errors='coerce').dropna().astype(int))
+    first_provisional = today.year - PROVISIONAL_YEARS
+    return sorted(int(y) for y in years if int(y) not in stored_years or int(y) >= first_provisional)
+
+
+def update_store(observation_text, years, path=UDEMO_STORE_FILE, **fetch_kwargs):
+    """
+    Bring the store up to date for `years` and return its observations for those years.
+
+    Returns:
+        The stored rows for observation_text and years (columns as returned by fetch_udemo, Jahr as int).
+    """
+    store = load_store(path)
+    fetch_years = years_to_fetch(store, observation_text, years)
+    changed_years = set()
+
+    if fetch_years:
+        logger.info(f"Fetching UDEMO years {fetch_years} for '{observation_text}'")
+        fetched = fetch_udemo(observation_text=observation_text, years=fetch_years, **fetch_kwargs)
+        if not fetched.empty:
+            fetched = fetched[STORE_COLUMNS].copy()
+            # The BFS label is the observation unit as requested (substring match)
+            fetched['Beobachtungseinheit'] = observation_text
+            fetched['Jahr'] = pd.to_numeric(fetched['Jahr'], errors='coerce').astype('Int64')
+            store['Jahr'] = pd.to_numeric(store['Jahr'], errors='coerce').astype('Int64')
+
+            replaced = (store['Beobachtungseinheit'] == observation_text) & store['Jahr'].isin(fetched['Jahr'].dropna().unique())
+            for year, rows in fetched.groupby('Jahr'):
+                old = store[replaced & (store['Jahr'] == year)]
+                if not _same_observations(old, rows):
+                    changed_years.add(int(year))
+
+            if changed_years:
+                store = pd.concat([store[~replaced], fetched], ignore_index=True)
+                store = store.sort_values(['Beobachtungseinheit', 'Jahr', 'Kanton', 'Rechtsform'], ignore_index=True)
+                safe_write_parquet_atomic(store, path)
+                logger.info(f"UDEMO store updated for years {sorted(changed_years)}")
+        else:
+            logger.warning("BFS returned no data, using stored UDEMO observations only.")
+    else:
+        logger.info("All requested UDEMO years are stored, no BFS request needed.")
+
+    return stored_observations(observation_text, years, store)
+
+
+def stored_observations(observation_text, years, store=None):
+    """The stored rows for observation_text and years, without contacting BFS."""
+    if store is None:
+        store = load_store()
+    year_values = {int(y) for y in years}
+    jahr = pd.to_numeric(store['Jahr'], errors='coerce')
+    observations = store[(store['Beobachtungseinheit'] == observation_text) & jahr.isin(year_values)].copy()
+    observations['Jahr'] = pd.to_numeric(observations['Jahr'], errors='coerce').astype(int)
+    return observations
+
+
+def _same_observations(old, new):
+    if len(old) != len(new):
+        return False
+    cols = ['Kanton', 'Rechtsform', 'value']
+    a = old[cols].sort_values(cols[:2], ignore_index=True)
+    b = new[cols].sort_values(cols[:2], ignore_index=True)
+    return a.equals(b)
+
+
+def aggregate_births(observations):
+    """Sum the observations over legal forms into (kanton, year, bfs_births) with canton abbreviations."""
+    agg = observations.groupby(["Jahr", "Kanton"], as_index=False)["value"].sum()
+    agg = agg.rename(columns={"Jahr": "year", "Kanton": "kanton_name", "value": "bfs_births"})
+
+    # Convert BFS canton names back to abbreviations
+    name_to_abbr = {v: k for k, v in CANTON_ABBR_TO_LABEL.items()}
+    agg["kanton"] = agg["kanton_name"].map(name_to_abbr)
+    agg["year"] = pd.to_numeric(agg["year"], errors='coerce')
+    return agg[["kanton", "year", "bfs_births"]]
+
+
+def merge_udemo(shab_year_canton, bfs_births, previous=None):
+    """
+    Merge SHAB yearly counts with BFS births, updating only the affected (kanton, year) rows.
+
+    Args:
+        shab_year_canton: DataFrame (kanton, year, shab_events).
+        bfs_births: DataFrame (kanton, year, bfs_births) from aggregate_births.
+        previous: The previously published merged table, or None for a full merge.
+
+    Returns:
+        The merged DataFrame (kanton, year, shab_events, bfs_births).
+    """
+    shab_year_canton = shab_year_canton.copy()
+    shab_year_canton["year"] = shab_year_canton["year"].astype(int)
+
+    if previous is None or previous.empty or "bfs_births" not in previous.columns:
+        return shab_year_canton.merge(bfs_births, on=MERGE_KEYS, how="left")
+
+    prev = previous.set_index(MERGE_KEYS)
+    cur = shab_year_canton.set_index(MERGE_KEYS)
+
+    # Rows that are new, or whose SHAB count or BFS births differ from the published table.
+    # Comparing against `previous` also catches BFS revisions stored by an earlier run
+    # (e.g. --only bfs_fetch) that never reached the merged table.
+    births = bfs_births.dropna(subset=["kanton"]).astype({"year": int}).set_index(MERGE_KEYS)["bfs_births"]
+    new_births = births.reindex(cur.index)
+    prev_births = prev["bfs_births"].reindex(cur.index)
+    prev_events = prev["shab_events"].reindex(cur.index)
+    affected = cur.index[
+        (prev_events != cur["shab_events"]).to_numpy()
+        | ((new_births != prev_births) & ~(new_births.isna() & prev_births.isna())).to_numpy()
+    ]
+
+    updated = cur.loc[affected].reset_index().merge(bfs_births, on=MERGE_KEYS, how="left")
+    kept = prev[prev.index.isin(cur.index) & ~prev.index.isin(affected)].reset_index()
+    logger.info(f"UDEMO merge: {len(updated)} rows updated, {len(kept)} unchanged")
+
+    merged = pd.concat([kept, updated], ignore_index=True)
+    return merged.sort_values(MERGE_KEYS, ignore_index=True)[["kanton", "year", "shab_events", "bfs_births"]]